@@ -1,23 +1,272 @@
+import csv
+import hashlib
+import io
 import logging
 import json
+import os
+import queue
+import re
+import socket
+import tempfile
 import time
+import uuid
 import threading
-from flask import Flask, request, jsonify, Response
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Flask, current_app, g, request, jsonify, Response, send_file
 from flask_cors import CORS
+import click
 import redis
 
-app = Flask(__name__)
-CORS(app)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+import archive
+import metrics
+import payloads
+import psychometrics
+import sharding
+from payloads import (
+    ANSWER_BATCH_CLOCK_SKEW, ANSWER_ERRORS, ANSWER_NEEDS_MIGRATION, ANSWER_UNKNOWN_STUDENT, ANSWER_WINDOW,
+    RANKING_SCORE_SCALE,
+)
+
+# Rotas, hooks e comandos ficam no blueprint; a aplicação é montada por create_app()
+api = Blueprint("quizzes", __name__, cli_group=None)
+
+def settings_from_env(environ=os.environ):
+    """Configuração da aplicação lida do ambiente; create_app(config) pode sobrescrever as chaves.
+
+    Só estas chaves (Redis, log e tarefas de fundo) são por aplicação. Os demais ajustes
+    (caches, retenção, leaderboards, ingestão, lotes...) são constantes do módulo lidas do
+    ambiente no import e valem para o processo inteiro, qualquer que seja o config.
+    """
+    host = environ.get("REDIS_HOST", "localhost")
+    port = int(environ.get("REDIS_PORT", 6379))
+    return {
+        # Configuração do Redis (pool e timeouts configuráveis pelo ambiente)
+        "REDIS_HOST": host,
+        "REDIS_PORT": port,
+        "REDIS_DB": int(environ.get("REDIS_DB", 0)),
+        "REDIS_MAX_CONNECTIONS": int(environ.get("REDIS_MAX_CONNECTIONS", 50)),
+        # Tempo máximo esperando uma conexão livre no pool antes de falhar
+        "REDIS_POOL_TIMEOUT": float(environ.get("REDIS_POOL_TIMEOUT", 5)),
+        # Timeouts de socket (segundos); vazio = sem timeout, como o padrão do redis-py
+        "REDIS_SOCKET_TIMEOUT": float(environ["REDIS_SOCKET_TIMEOUT"]) if environ.get("REDIS_SOCKET_TIMEOUT") else None,
+        "REDIS_CONNECT_TIMEOUT": float(environ.get("REDIS_CONNECT_TIMEOUT", 5)),
+        # Topologia: "standalone" (REDIS_HOST/REDIS_PORT), "cluster" (Redis Cluster) ou "ring"
+        # (redis-servers independentes com hash consistente); os dois últimos usam REDIS_NODES
+        "REDIS_MODE": environ.get("REDIS_MODE", "standalone"),
+        "REDIS_NODES": sharding.parse_nodes(environ.get("REDIS_NODES", f"{host}:{port}")),
+        "LOG_LEVEL": environ.get("LOG_LEVEL", "INFO").upper(),
+        # Scheduler de retenção dentro do processo web; desligue (0) quando o purge-answers
+        # roda por um cron, para não ter um scheduler por worker
+        "RETENTION_SCHEDULER": environ.get("RETENTION_SCHEDULER", "1").lower() not in ("0", "false", "no"),
+        # Atualização periódica dos leaderboards globais dentro do processo web; desligue (0)
+        # quando o refresh-leaderboards roda por um cron
+        "LEADERBOARD_REFRESHER": environ.get("LEADERBOARD_REFRESHER", "1").lower() not in ("0", "false", "no"),
+        # Threads de ingestão por processo no modo "stream" (0 desliga)
+        "ANSWER_INGEST_WORKERS": int(environ.get("ANSWER_INGEST_WORKERS", 2)),
+    }
+
+# Layout das chaves: "flat" mantém os nomes de sempre; "tagged" põe o id do quiz numa hash
+# tag (quiz:{id}:...) para que todas as chaves de um quiz fiquem no mesmo slot/nó. Mudar
+# o layout de uma base existente exige copiar as chaves para os nomes novos, por isso ele
+# é fixo por deployment (só pelo ambiente).
+REDIS_KEY_LAYOUT = os.environ.get("REDIS_KEY_LAYOUT",
+                                  "flat" if os.environ.get("REDIS_MODE", "standalone") == "standalone" else "tagged")
+
+def redis_pool_options(settings=None):
+    """Opções comuns aos pools síncrono e assíncrono."""
+    settings = settings or settings_from_env()
+    return {
+        "host": settings["REDIS_HOST"],
+        "port": settings["REDIS_PORT"],
+        "db": settings["REDIS_DB"],
+        "max_connections": settings["REDIS_MAX_CONNECTIONS"],
+        "timeout": settings["REDIS_POOL_TIMEOUT"],
+        "socket_timeout": settings["REDIS_SOCKET_TIMEOUT"],
+        "socket_connect_timeout": settings["REDIS_CONNECT_TIMEOUT"],
+        "decode_responses": True,
+    }
 
-# Configuração do Redis
-r = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
-logging.basicConfig(level=logging.DEBUG)
+def build_redis_client(settings):
+    """Cria o cliente Redis da topologia configurada, com os nós instrumentados para as métricas."""
+    client = sharding.create_client(settings["REDIS_MODE"], settings["REDIS_NODES"], redis_pool_options(settings))
+    instrument_redis_nodes(client)
+    return client
+
+def instrument_redis_nodes(client):
+    for node in sharding.node_clients(client):
+        metrics.instrument_redis_client(node, record_redis_usage)
+
+# Cliente Redis compartilhado: o pool só é criado no primeiro comando, não no import
+r = sharding.LazyClient(lambda: build_redis_client(settings_from_env()))
+
+# Métricas expostas em /metrics (formato Prometheus)
+metrics_registry = metrics.Registry()
+REQUEST_LATENCY = metrics_registry.histogram(
+    "http_request_duration_seconds", "Latência das requisições por rota.", ["endpoint", "method"])
+REQUESTS = metrics_registry.counter(
+    "http_requests", "Requisições atendidas por rota e status.", ["endpoint", "method", "status"])
+RESPONSE_SIZE = metrics_registry.histogram(
+    "http_response_size_bytes", "Tamanho do corpo das respostas por rota.", ["endpoint", "method"],
+    buckets=metrics.SIZE_BUCKETS)
+REDIS_COMMANDS = metrics_registry.histogram(
+    "redis_commands_per_request", "Comandos Redis enviados por requisição.", ["endpoint", "method"],
+    buckets=metrics.COUNT_BUCKETS)
+REDIS_TIME = metrics_registry.histogram(
+    "redis_seconds_per_request", "Tempo gasto esperando o Redis por requisição.", ["endpoint", "method"])
+PURGE_DURATION = metrics_registry.histogram(
+    "retention_run_duration_seconds", "Duração das rodadas de retenção.",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600))
+PURGED_ANSWERS = metrics_registry.counter(
+    "retention_purged_answers", "Respostas expurgadas pela retenção.")
+INGEST_APPLIED = metrics_registry.counter(
+    "answer_ingest_applied", "Respostas enfileiradas já aplicadas pelos workers de ingestão.")
+INGEST_DELAY = metrics_registry.histogram(
+    "answer_ingest_delay_seconds", "Tempo entre o enfileiramento de uma resposta e a sua aplicação.")
+INGEST_BACKLOG = metrics_registry.gauge(
+    "answer_ingest_backlog", "Respostas enfileiradas ainda não aplicadas (todos os quizzes).")
+RESPONSE_CACHE = metrics_registry.counter(
+    "http_response_cache", "Leituras condicionais por rota: not_modified (304), hit ou miss do corpo em cache.",
+    ["endpoint", "result"])
+INGEST_OLDEST_AGE = metrics_registry.gauge(
+    "answer_ingest_oldest_age_seconds", "Idade da resposta enfileirada mais antiga ainda não aplicada.")
+LEADERBOARD_REFRESH_DURATION = metrics_registry.histogram(
+    "leaderboard_refresh_duration_seconds", "Duração das rodadas de atualização dos leaderboards globais.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60))
+LEADERBOARD_QUIZZES_APPLIED = metrics_registry.counter(
+    "leaderboard_quizzes_applied", "Quizzes com pontuações novas somadas aos leaderboards globais.")
+
+# Comandos Redis da requisição em andamento nesta thread: [quantidade, segundos]
+request_redis_usage = threading.local()
+
+def record_redis_usage(quantidade, segundos):
+    uso = getattr(request_redis_usage, "current", None)
+    if uso is not None:
+        uso[0] += quantidade
+        uso[1] += segundos
+
+@api.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    request_redis_usage.current = [0, 0.0]
+
+@api.after_app_request
+def record_request_metrics(response):
+    uso = getattr(request_redis_usage, "current", None) or [0, 0.0]
+    request_redis_usage.current = None
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_LATENCY.observe(time.perf_counter() - g.get("request_started", time.perf_counter()), endpoint, request.method)
+    REQUESTS.inc(1, endpoint, request.method, str(response.status_code))
+    if not response.is_streamed:
+        RESPONSE_SIZE.observe(response.calculate_content_length() or 0, endpoint, request.method)
+    REDIS_COMMANDS.observe(uso[0], endpoint, request.method)
+    REDIS_TIME.observe(uso[1], endpoint, request.method)
+    return response
+
+# Rota com as métricas no formato texto do Prometheus
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    if ANSWER_INGEST_MODE == "stream":
+        update_ingest_metrics()
+    return Response(metrics_registry.expose(), mimetype="text/plain; version=0.0.4"), 200
 
 # Prefixos para facilitar a identificação das chaves no Redis
 QUIZ_PREFIX = "quiz:"
 USER_PREFIX = "user:"
 TIME_PREFIX = "time:"
 
+def key_tag(valor):
+    """Envolve o valor numa hash tag no layout "tagged"; no "flat", devolve como está."""
+    return "{" + valor + "}" if REDIS_KEY_LAYOUT == "tagged" else valor
+
+def strip_key_tag(valor):
+    if REDIS_KEY_LAYOUT == "tagged" and valor.startswith("{") and valor.endswith("}"):
+        return valor[1:-1]
+    return valor
+
+# Registros mantidos pela aplicação, para que as leituras não precisem de KEYS
+USERS_KEY = "users"        # sorted set: código do aluno -> momento do cadastro
+USERS_VERSION_KEY = "users:version"  # contador incrementado a cada lote de usuários cadastrados
+QUIZZES_KEY = "quizzes"    # sorted set: id do quiz -> momento da criação
+QUIZZES_OPENED_KEY = "quizzes:opened"    # sorted set: id do quiz -> abertura mais recente de uma questão
+
+# Ids numéricos densos dos alunos, usados no formato compacto das respostas
+# As três chaves são usadas juntas num script: no layout "tagged" compartilham a tag {students}
+STUDENT_KEYS_PREFIX = key_tag("students") + ":" if REDIS_KEY_LAYOUT == "tagged" else ""
+STUDENT_IDS_KEY = STUDENT_KEYS_PREFIX + "student_ids"            # hash: código do aluno -> id
+STUDENT_CODES_KEY = STUDENT_KEYS_PREFIX + "student_codes"        # hash: id -> código do aluno
+STUDENT_NEXT_ID_KEY = STUDENT_KEYS_PREFIX + "student_ids:next"   # contador do próximo id
+STUDENT_ID_CACHE_SIZE = int(os.environ.get("STUDENT_ID_CACHE_SIZE", 100000))
+
+# Formato compacto das respostas: o campo "storage" da questão marca as já convertidas.
+# As respostas ficam em hashes de PACKED_BUCKET_SIZE alunos (id // tamanho), pequenos o
+# bastante para o Redis usar a codificação compacta (listpack, hash-max-listpack-entries).
+PACKED_STORAGE = "packed"
+PACKED_BUCKET_SIZE = 128
+# Quantidade de buckets lidos por pipeline ao percorrer todas as respostas de uma questão
+PACKED_SCAN_BUCKETS = 64
+
+# Retenção das respostas (configurável pelo ambiente)
+RETENTION_DAYS = float(os.environ.get("RETENTION_DAYS", 30))
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL_SECONDS", 24 * 60 * 60))
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 500))
+RETENTION_LOCK_TTL = float(os.environ.get("RETENTION_LOCK_TTL_SECONDS", 60))
+RETENTION_LOCK_KEY = "retention:lock"
+
+# Cache local das questões (configurável pelo ambiente)
+QUESTION_CACHE_SIZE = int(os.environ.get("QUESTION_CACHE_SIZE", 10000))
+QUESTION_CACHE_TTL = float(os.environ.get("QUESTION_CACHE_TTL_SECONDS", 300))
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Cache local das respostas de leitura já serializadas (ranking, analytics, usuários), válidas
+# enquanto as versões do ETag não mudam; corpos maiores que o limite não são guardados
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 1000))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 1024 * 1024))
+
+# Leaderboards globais e por curso, por janela de calendário ("day", "week" e "term"). São
+# somados no servidor (ZUNIONSTORE) a partir dos leaderboards dos quizzes, sem reler as
+# respostas; cada janela fica guardada pelos dias indicados depois de encerrada.
+LEADERBOARD_KEEP_DAYS = {"day": 30, "week": 180, "term": 400}
+LEADERBOARD_PERIOD_FORMATS = {"day": r"\d{4}-\d{2}-\d{2}", "week": r"\d{4}-W\d{2}", "term": r"\d{4}-T\d{1,2}"}
+# Meses de cada período letivo (um divisor de 12) e fuso fixo, em horas, das viradas de janela
+LEADERBOARD_TERM_MONTHS = int(os.environ.get("LEADERBOARD_TERM_MONTHS", 6))
+LEADERBOARD_UTC_OFFSET = float(os.environ.get("LEADERBOARD_UTC_OFFSET_HOURS", 0)) * 60 * 60
+LEADERBOARD_REFRESH_SECONDS = float(os.environ.get("LEADERBOARD_REFRESH_SECONDS", 60))
+# Além do período letivo atual, a atualização revisita os quizzes com questões abertas nesse intervalo
+LEADERBOARD_LOOKBACK_DAYS = float(os.environ.get("LEADERBOARD_LOOKBACK_DAYS", 7))
+LEADERBOARD_BATCH_SIZE = 500
+LEADERBOARD_LOCK_TTL = float(os.environ.get("LEADERBOARD_LOCK_TTL_SECONDS", 60))
+LEADERBOARD_LOCK_KEY = "leaderboard:lock"
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 1000
+# As chaves agregadas são usadas juntas num script: no layout "tagged" compartilham a tag {leaderboards}
+LEADERBOARD_KEYS_PREFIX = key_tag("leaderboards") + ":" if REDIS_KEY_LAYOUT == "tagged" else ""
+LEADERBOARD_VERSION_KEY = LEADERBOARD_KEYS_PREFIX + "leaderboard:version"   # contador a cada quiz agregado
+LEADERBOARD_APPLIED_KEY = LEADERBOARD_KEYS_PREFIX + "leaderboard:applied"   # hash: quiz -> "criação:versão" já agregada
+
+# Atualizações ao vivo (SSE) do ranking e das contagens de respostas
+LIVE_UPDATES_PER_SECOND = float(os.environ.get("LIVE_UPDATES_PER_SECOND", 1))
+LIVE_RANKING_SIZE = int(os.environ.get("LIVE_RANKING_SIZE", 10))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get("LIVE_HEARTBEAT_SECONDS", 15))
+
+# Modo de gravação das respostas: "sync" grava na própria requisição; "stream" valida o
+# prazo e a duplicata, enfileira a resposta num Redis Stream por quiz e responde na hora,
+# deixando a gravação para os workers de ingestão (consumer group, em lotes)
+ANSWER_INGEST_MODE = os.environ.get("ANSWER_INGEST_MODE", "sync")
+INGEST_BATCH_SIZE = int(os.environ.get("ANSWER_INGEST_BATCH_SIZE", 500))
+# Mensagens paradas há mais que isso com um consumidor (que caiu) são assumidas por outro
+INGEST_CLAIM_IDLE_MS = int(os.environ.get("ANSWER_INGEST_CLAIM_IDLE_MS", 30000))
+INGEST_BLOCK_MS = 1000
+INGEST_POLL_SECONDS = 0.05  # espera entre leituras sem bloqueio (Cluster e anel)
+INGEST_REFRESH_SECONDS = 5
+INGEST_GROUP = "ingest"
+INGEST_STREAMS_KEY = "ingest:streams"   # set com os streams de ingestão dos quizzes
+
 # Criar índice para RediSearch (se ainda não existir)
 def create_search_index():
     try:
@@ -29,38 +278,1131 @@ def create_search_index():
     except redis.exceptions.ResponseError as e:
         logging.info(f"Índice 'idx_votes' já existe: {e}")
 
-create_search_index()  # Criar o índice na inicialização
+# Envio de respostas em lote (gateways das salas): limite por requisição e registros por
+# pipeline; a tolerância de relógio (ANSWER_BATCH_CLOCK_SKEW) fica em payloads
+ANSWER_BATCH_MAX_RECORDS = int(os.environ.get("ANSWER_BATCH_MAX_RECORDS", 50000))
+ANSWER_BATCH_PIPELINE_SIZE = 500
+
+# Quantidade de alunos lidos por vez ao completar o ranking com quem não respondeu
+RANKING_SCAN_BATCH = 1000
+
+# Paginação da exportação de respostas (alunos por página)
+RESPONSES_PAGE_SIZE = 1000
+RESPONSES_MAX_PAGE_SIZE = 10000
+RESPONSE_STREAM_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+RESPONSES_CSV_HEADER = "question_id,student_id,answer,response_time\n"
+
+# Relatório psicométrico: comandos por pipeline na carga das respostas e validade do cache
+REPORT_PIPELINE_SIZE = 1000
+REPORT_CACHE_TTL = float(os.environ.get("REPORT_CACHE_TTL_SECONDS", 24 * 60 * 60))
+
+# Arquivos de quizzes (exportação/importação colunar): comandos por pipeline na importação
+# e tamanho a partir do qual o arquivo em trânsito vai da memória para o disco
+ARCHIVE_PIPELINE_SIZE = 1000
+ARCHIVE_SPOOL_SIZE = 64 * 1024 * 1024
+
+# Importação de usuários: tamanho padrão do lote gravado em cada pipeline
+USER_IMPORT_BATCH_SIZE = 1000
+
+# Trecho Lua comum aos scripts de resposta: valida o prazo e o formato da questão, marca
+# o aluno no bitmap "answered" (impedindo duplicatas) e calcula o tempo de resposta em ms.
+# Um timestamp anterior à abertura da questão (lotes enviados pelos gateways) só é aceito
+# dentro da tolerância de relógio, e conta como 0 ms; mais antigo que isso é recusado, senão
+# qualquer cliente conseguiria a pontuação máxima de velocidade antedatando a resposta.
+# Usa KEYS[1] (questão), KEYS[2] (answered) e ARGV no formato de answer_args.
+ANSWER_CHECKS_LUA = """
+local start_time = tonumber(redis.call('HGET', KEYS[1], 'start_time')) or 0
+local response_timestamp = tonumber(ARGV[3])
+if response_timestamp > start_time + tonumber(ARGV[4]) then
+    return -1
+end
+if response_timestamp < start_time - tonumber(ARGV[10]) then
+    return -4
+end
+if redis.call('HGET', KEYS[1], 'storage') ~= 'packed' then
+    return -2
+end
+if redis.call('SETBIT', KEYS[2], ARGV[8], 1) == 1 then
+    return 0
+end
+local response_ms = math.max(math.floor((response_timestamp - start_time) * 1000 + 0.5), 0)
+"""
+
+# Função Lua que grava uma resposta já validada no formato compacto ("tempo em ms:resposta")
+# e atualiza leaderboard, acertos e agregados. O HSETNX no bucket torna a gravação
+# idempotente: aplicar a mesma resposta de novo não altera nada. Retorna 1 se gravou.
+APPLY_ANSWER_LUA = """
+local function apply_answer(question, bucket, field, correct_answers, leaderboard, stats, correct,
+                            student, answer, response_ms, window, scale)
+    if redis.call('HSETNX', bucket, field, string.format('%d:%s', response_ms, answer)) == 0 then
+        return 0
+    end
+    local response_time = response_ms / 1000
+    local score = window - response_time
+    if redis.call('HGET', question, 'correct_answer') == answer then
+        redis.call('HINCRBY', correct_answers, student, 1)
+        redis.call('HINCRBY', stats, 'correct', 1)
+        redis.call('ZADD', correct, tostring(response_time), student)
+        score = score + scale
+    end
+    redis.call('ZINCRBY', leaderboard, tostring(score), student)
+    redis.call('HINCRBY', stats, 'total', 1)
+    redis.call('HINCRBY', stats, 'opt:' .. answer, 1)
+    redis.call('HINCRBYFLOAT', stats, 'time_total', tostring(response_time))
+    local fastest_time = tonumber(redis.call('HGET', stats, 'fastest_time'))
+    if not fastest_time or response_time < fastest_time then
+        redis.call('HSET', stats, 'fastest_id', student, 'fastest_time', tostring(response_time))
+    end
+    return 1
+end
+"""
+
+# Script Lua que valida o prazo, impede respostas duplicadas e grava a resposta
+# de forma atômica, numa única ida ao Redis. A resposta é gravada no formato compacto:
+# um bit por aluno em "answered" e "tempo em ms:resposta" no bucket do aluno.
+# KEYS: questão, answered (bitmap), bucket de respostas do aluno, correct_answers,
+#       leaderboard, estatísticas da questão, acertos da questão, versões do quiz e da questão
+# ARGV: student_id, answer, timestamp da resposta, janela em segundos, peso do acerto,
+#       canal de eventos do quiz, id da questão, id numérico do aluno, campo no bucket,
+#       tolerância (segundos) para timestamps anteriores à abertura da questão
+ANSWER_LUA = APPLY_ANSWER_LUA + ANSWER_CHECKS_LUA + """
+apply_answer(KEYS[1], KEYS[3], ARGV[9], KEYS[4], KEYS[5], KEYS[6], KEYS[7],
+             ARGV[1], ARGV[2], response_ms, tonumber(ARGV[4]), tonumber(ARGV[5]))
+redis.call('INCR', KEYS[8])
+redis.call('INCR', KEYS[9])
+redis.call('PUBLISH', ARGV[6], ARGV[7])
+return 1
+"""
+answer_script = r.register_script(ANSWER_LUA)
+
+# Script Lua do modo "stream": faz as mesmas validações do ANSWER_LUA e apenas enfileira
+# a resposta (com o tempo já calculado) no stream do quiz.
+# KEYS: questão, answered (bitmap), stream de ingestão do quiz
+# ARGV: os mesmos de ANSWER_LUA
+INGEST_LUA = ANSWER_CHECKS_LUA + """
+redis.call('XADD', KEYS[3], '*', 'q', ARGV[7], 's', ARGV[1], 'n', ARGV[8], 'a', ARGV[2], 'ms', response_ms)
+return 1
+"""
+ingest_script = r.register_script(INGEST_LUA)
+
+# Script Lua que grava o "start_time" da questão no primeiro acesso (HSETNX, sem
+# sobrescrever o de leitores concorrentes) e devolve a questão numa única ida ao Redis.
+# KEYS: questão
+# ARGV: timestamp atual
+OPEN_QUESTION_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {}
+end
+redis.call('HSETNX', KEYS[1], 'start_time', ARGV[1])
+return redis.call('HGETALL', KEYS[1])
+"""
+open_question_script = r.register_script(OPEN_QUESTION_LUA)
+
+class LocalCache:
+    """Cache LRU em memória, com limite de itens e expiração por TTL, seguro entre threads."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, match):
+        """Remove os itens cujas chaves satisfazem match(chave)."""
+        with self._lock:
+            for key in [key for key in self._items if match(key)]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+# Cache local das questões já serializadas (sem a resposta correta)
+question_cache = LocalCache(QUESTION_CACHE_SIZE, QUESTION_CACHE_TTL)
+
+# Script Lua que devolve o id numérico de cada aluno, criando os que faltam (ids densos)
+# KEYS: código -> id, id -> código, contador
+# ARGV: códigos dos alunos
+ASSIGN_STUDENT_IDS_LUA = """
+local ids = {}
+for i, code in ipairs(ARGV) do
+    local id = redis.call('HGET', KEYS[1], code)
+    if not id then
+        id = redis.call('INCR', KEYS[3]) - 1
+        redis.call('HSET', KEYS[1], code, id)
+        redis.call('HSET', KEYS[2], id, code)
+    end
+    ids[i] = tonumber(id)
+end
+return ids
+"""
+assign_student_ids_script = r.register_script(ASSIGN_STUDENT_IDS_LUA)
+
+# Os ids nunca mudam depois de criados: cache local sem expiração prática
+student_id_cache = LocalCache(STUDENT_ID_CACHE_SIZE, float("inf"))
+
+def get_student_ids(alunos, create=False):
+    """Retorna um dicionário aluno -> id numérico.
+
+    Com create=True os alunos sem id recebem um; senão ficam de fora do resultado.
+    """
+    ids, faltando = payloads.cached_student_ids(alunos, student_id_cache)
+    if not faltando:
+        return ids
+
+    if create:
+        encontrados = assign_student_ids_script(
+            keys=[STUDENT_IDS_KEY, STUDENT_CODES_KEY, STUDENT_NEXT_ID_KEY], args=faltando)
+    else:
+        encontrados = r.hmget(STUDENT_IDS_KEY, faltando)
+    return payloads.store_student_ids(ids, faltando, encontrados, student_id_cache)
+
+def get_registered_student_ids(alunos):
+    """Retorna aluno -> id numérico só dos alunos cadastrados; os demais ficam de fora.
+
+    O cadastro já cria o id; aqui só recebem um id novo os alunos cadastrados antes dos ids
+    densos. Um código qualquer enviado numa resposta não gasta um id: o contador define o
+    tamanho de toda varredura dos buckets (relatório, arquivo, remoção).
+    """
+    ids = get_student_ids(alunos)
+    faltando = payloads.students_without_ids(alunos, ids)
+    if faltando:
+        pipe = r.pipeline(transaction=False)
+        for aluno in faltando:
+            pipe.zscore(USERS_KEY, aluno)
+        cadastrados = payloads.registered_students(faltando, pipe.execute())
+        if cadastrados:
+            ids.update(get_student_ids(cadastrados, create=True))
+    return ids
+
+def publish_cache_invalidation(quiz_id, question_id=None):
+    """Avisa todos os workers (via pub/sub) para descartar as questões de um quiz do cache local."""
+    r.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({"quiz_id": quiz_id, "question_id": question_id}))
+
+def invalidate_cached_questions(quiz_id, question_id=None):
+    question_cache.invalidate(
+        lambda key: key[0] == quiz_id and (question_id is None or key[1] == question_id))
+
+# Escuta as invalidações publicadas pelos outros workers
+def run_cache_invalidation_listener():
+    while True:
+        try:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+            # Ao (re)conectar, mensagens podem ter sido perdidas: começa com o cache vazio
+            question_cache.clear()
+            for message in pubsub.listen():
+                data = json.loads(message["data"])
+                invalidate_cached_questions(data["quiz_id"], data.get("question_id"))
+        except redis.exceptions.RedisError:
+            logging.exception("Falha no listener de invalidação do cache; reconectando")
+            time.sleep(1)
+
+# Funções para montar as chaves de um quiz e das suas questões. Todas começam por
+# quiz_key(quiz_id), que no layout "tagged" carrega a hash tag do quiz.
+def quiz_key(quiz_id):
+    """Hash do quiz (momento da criação, curso e, num quiz importado, a encarnação)."""
+    return QUIZ_PREFIX + key_tag(quiz_id)
+
+def quiz_id_from_key(key, suffix=""):
+    """Extrai o id do quiz de uma chave ou canal montado a partir de quiz_key."""
+    return strip_key_tag(key[len(QUIZ_PREFIX):len(key) - len(suffix)])
+
+def question_key(quiz_id, question_id):
+    return quiz_key(quiz_id) + ":" + question_id
+
+def questions_key(quiz_id):
+    """Lista ordenada com os ids das questões do quiz."""
+    return quiz_key(quiz_id) + ":questions"
+
+def leaderboard_key(quiz_id):
+    """Sorted set com a pontuação de cada aluno no quiz (acertos e tempo poupado)."""
+    return quiz_key(quiz_id) + ":leaderboard"
+
+def correct_answers_key(quiz_id):
+    """Hash com a quantidade de acertos de cada aluno no quiz."""
+    return quiz_key(quiz_id) + ":correct_answers"
+
+def stats_key(quiz_id, question_id):
+    """Hash com os agregados da questão (total, acertos, soma dos tempos, votos por opção, mais rápido)."""
+    return question_key(quiz_id, question_id) + ":stats"
+
+def correct_students_key(quiz_id, question_id):
+    """Sorted set com os alunos que acertaram a questão, pelo tempo de resposta."""
+    return question_key(quiz_id, question_id) + ":correct"
+
+def events_channel(quiz_id):
+    """Canal pub/sub em que answer_quiz avisa que o quiz recebeu respostas."""
+    return quiz_key(quiz_id) + ":events"
+
+def quiz_version_key(quiz_id):
+    """Contador incrementado na criação e a cada resposta gravada ou expurgada; invalida o relatório e o ETag do ranking."""
+    return quiz_key(quiz_id) + ":version"
+
+def question_version_key(quiz_id, question_id):
+    """Contador incrementado a cada resposta gravada ou expurgada na questão; invalida o ETag do analytics."""
+    return question_key(quiz_id, question_id) + ":version"
+
+def report_key(quiz_id):
+    """Hash com o último relatório calculado (corpo JSON) e a versão do quiz usada no cálculo."""
+    return quiz_key(quiz_id) + ":report"
+
+def ingest_stream_key(quiz_id):
+    """Redis Stream com as respostas aceitas e ainda não aplicadas (modo "stream")."""
+    return quiz_key(quiz_id) + ":ingest"
+
+def leaderboard_window_key(window, period, course=None):
+    """Sorted set com a soma das pontuações dos quizzes de uma janela, de todos ou de um curso."""
+    escopo = "course:" + course if course else "global"
+    return f"{LEADERBOARD_KEYS_PREFIX}leaderboard:{escopo}:{window}:{period}"
+
+def leaderboard_snapshot_key(quiz_id, creation_time):
+    """Sorted set com as pontuações do quiz já somadas às janelas (o que a próxima atualização desconta).
+
+    O momento da criação entra no nome: um quiz recriado com o mesmo id começa de um snapshot
+    vazio, enquanto o mesmo quiz reimportado de um arquivo continua do snapshot que tinha.
+    """
+    return f"{LEADERBOARD_KEYS_PREFIX}leaderboard:quiz:{quiz_id}:{creation_time}"
+
+def answered_bits_key(quiz_id, question_id):
+    """Bitmap com um bit por id de aluno que já respondeu a questão."""
+    return question_key(quiz_id, question_id) + ":answered_bits"
+
+def packed_bucket_key(quiz_id, question_id, bucket):
+    """Hash com as respostas ("tempo em ms:resposta") dos alunos de um bucket de ids."""
+    return question_key(quiz_id, question_id) + ":packed:" + str(bucket)
+
+def packed_location(student_num_id):
+    """Retorna (bucket, campo) em que fica a resposta do aluno com esse id numérico."""
+    return student_num_id // PACKED_BUCKET_SIZE, str(student_num_id % PACKED_BUCKET_SIZE)
+
+def pack_answer(answer, response_time):
+    return f"{int(round(response_time * 1000))}:{answer}"
+
+def unpack_answer(valor):
+    """Converte o valor compacto em (resposta, tempo de resposta em segundos)."""
+    response_ms, answer = valor.split(":", 1)
+    return answer, int(response_ms) / 1000
+
+def legacy_answer_keys(quiz_id, question_id):
+    """Chaves do formato antigo (uma cópia da resposta em cada estrutura), removidas na migração."""
+    key = question_key(quiz_id, question_id)
+    return [
+        key + ":responses",
+        TIME_PREFIX + key_tag(quiz_id) + ":" + question_id + ":response_time",
+        key + ":answered",
+        key + ":answered_at",
+    ]
+
+def answer_keys(quiz_id, question_id, student_num_id):
+    """Retorna as chaves usadas pelo script de resposta, na ordem esperada."""
+    key = question_key(quiz_id, question_id)
+    bucket, _ = packed_location(student_num_id)
+    return [
+        key,
+        answered_bits_key(quiz_id, question_id),
+        packed_bucket_key(quiz_id, question_id, bucket),
+        correct_answers_key(quiz_id),
+        leaderboard_key(quiz_id),
+        stats_key(quiz_id, question_id),
+        correct_students_key(quiz_id, question_id),
+        quiz_version_key(quiz_id),
+        question_version_key(quiz_id, question_id),
+    ]
+
+def ingest_keys(quiz_id, question_id):
+    """Retorna as chaves usadas pelo script de ingestão, na ordem esperada."""
+    return [question_key(quiz_id, question_id), answered_bits_key(quiz_id, question_id), ingest_stream_key(quiz_id)]
+
+def answer_args(quiz_id, question_id, student_id, student_num_id, answer, response_timestamp):
+    """Retorna os argumentos do script de resposta, na ordem esperada."""
+    _, field = packed_location(student_num_id)
+    return [student_id, answer, repr(response_timestamp), ANSWER_WINDOW, RANKING_SCORE_SCALE,
+            events_channel(quiz_id), question_id, student_num_id, field, ANSWER_BATCH_CLOCK_SKEW]
+
+def answer_script_call(quiz_id, question_id, student_id, student_num_id, answer, response_timestamp, stream):
+    """Retorna (keys, args) do script de ingestão (stream) ou de resposta, para as duas versões da API."""
+    keys = ingest_keys(quiz_id, question_id) if stream else answer_keys(quiz_id, question_id, student_num_id)
+    return keys, answer_args(quiz_id, question_id, student_id, student_num_id, answer, response_timestamp)
+
+def record_answer(quiz_id, question_id, student_id, answer, response_timestamp):
+    """Registra a resposta de um aluno e retorna um dos códigos ANSWER_*.
+
+    Questões ainda no formato antigo são migradas na primeira resposta. No modo "stream",
+    ANSWER_RECORDED significa que a resposta foi aceita e enfileirada.
+    """
+    student_num_id = get_registered_student_ids([student_id]).get(student_id)
+    if student_num_id is None:
+        return ANSWER_UNKNOWN_STUDENT
+    stream = ANSWER_INGEST_MODE == "stream"
+    keys, args = answer_script_call(quiz_id, question_id, student_id, student_num_id, answer, response_timestamp, stream)
+    if stream:
+        def executar():
+            pipe = r.pipeline(transaction=False)
+            register_ingest_stream(quiz_id, pipe)
+            ingest_script(keys=keys, args=args, client=pipe)
+            return pipe.execute()[-1]
+    else:
+        def executar():
+            return answer_script(keys=keys, args=args)
+
+    status = executar()
+    if status == ANSWER_NEEDS_MIGRATION:
+        migrate_question_storage(quiz_id, question_id)
+        status = executar()
+    return status
+
+def register_ingest_stream(quiz_id, pipe):
+    """Registra o stream do quiz, no pipeline da resposta, para que os workers de ingestão o leiam.
+
+    O SADD (O(1)) vai com cada resposta enfileirada, sem cache por processo: um quiz removido
+    (evict_quiz) e recriado volta ao registro mesmo quando a resposta chega por outro worker.
+    """
+    pipe.sadd(INGEST_STREAMS_KEY, ingest_stream_key(quiz_id))
 
 # Função para obter o tempo atual em segundos
 def get_current_time():
     return time.time()
 
-# Função para expurgar respostas antigas a cada 30 dias
+# Script Lua que conclui a migração de uma questão para o formato compacto: confere que
+# nenhuma resposta antiga chegou depois da cópia, marca a questão e apaga as chaves antigas.
+# KEYS: questão, chaves do formato antigo (respostas primeiro)
+# ARGV: formato compacto, quantidade de respostas copiadas
+# Retorna 1 se migrou, 0 se já estava migrada, -1 se a cópia precisa ser refeita
+FINALIZE_MIGRATION_LUA = """
+if redis.call('HGET', KEYS[1], 'storage') == ARGV[1] then
+    return 0
+end
+if redis.call('HLEN', KEYS[2]) ~= tonumber(ARGV[2]) then
+    return -1
+end
+redis.call('HSET', KEYS[1], 'storage', ARGV[1])
+for i = 2, #KEYS do
+    redis.call('UNLINK', KEYS[i])
+end
+return 1
+"""
+finalize_migration_script = r.register_script(FINALIZE_MIGRATION_LUA)
+
+# Questões que este worker já sabe estarem no formato compacto (o formato nunca volta atrás)
+packed_questions = LocalCache(QUESTION_CACHE_SIZE, float("inf"))
+
+def ensure_packed_storage(quiz_id, question_id):
+    """Garante que a questão está no formato compacto antes de ler as respostas."""
+    if packed_questions.get((quiz_id, question_id)) is None:
+        migrate_question_storage(quiz_id, question_id)
+
+def migrate_question_storage(quiz_id, question_id):
+    """Converte as respostas de uma questão do formato antigo para o compacto.
+
+    O formato antigo só é lido (o script de resposta não grava mais nele), então a cópia
+    é feita em pipelines e apenas a troca de formato é atômica. Pode ser repetida ou
+    executada por vários workers ao mesmo tempo. Retorna a quantidade de respostas copiadas.
+    """
+    key = question_key(quiz_id, question_id)
+    legacy_keys = legacy_answer_keys(quiz_id, question_id)
+    while True:
+        storage = r.hget(key, "storage")
+        if storage == PACKED_STORAGE:
+            packed_questions.set((quiz_id, question_id), True)
+            return 0
+        if storage is None and not r.exists(key):
+            return 0
+
+        respostas = dict(r.hscan_iter(legacy_keys[0], count=1000))
+        tempos = dict(r.hscan_iter(legacy_keys[1], count=1000))
+        for lote in iter_batches(list(respostas.items()), USER_IMPORT_BATCH_SIZE):
+            ids = get_student_ids([aluno for aluno, _ in lote], create=True)
+            pipe = r.pipeline(transaction=False)
+            for aluno, resposta in lote:
+                bucket, field = packed_location(ids[aluno])
+                tempo_resposta = float(tempos.get(aluno) or ANSWER_WINDOW)
+                pipe.setbit(answered_bits_key(quiz_id, question_id), ids[aluno], 1)
+                pipe.hset(packed_bucket_key(quiz_id, question_id, bucket), field, pack_answer(resposta, tempo_resposta))
+            pipe.execute()
+
+        # Um worker antigo ainda pode ter gravado respostas durante a cópia: nesse caso, copia de novo
+        if finalize_migration_script(keys=[key, *legacy_keys], args=[PACKED_STORAGE, len(respostas)]) != -1:
+            packed_questions.set((quiz_id, question_id), True)
+            return len(respostas)
+
+def iter_packed_records(quiz_id, question_id):
+    """Percorre as respostas compactas de uma questão em blocos de (id numérico, aluno, valor).
+
+    Os buckets são lidos em pipelines de PACKED_SCAN_BUCKETS, do id 0 ao último id criado.
+    """
+    total_ids = int(r.get(STUDENT_NEXT_ID_KEY) or 0)
+    total_buckets = (total_ids + PACKED_BUCKET_SIZE - 1) // PACKED_BUCKET_SIZE
+    for inicio in range(0, total_buckets, PACKED_SCAN_BUCKETS):
+        buckets = range(inicio, min(inicio + PACKED_SCAN_BUCKETS, total_buckets))
+        pipe = r.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hgetall(packed_bucket_key(quiz_id, question_id, bucket))
+        registros = [(bucket * PACKED_BUCKET_SIZE + int(field), valor)
+                     for bucket, campos in zip(buckets, pipe.execute())
+                     for field, valor in campos.items()]
+        if not registros:
+            continue
+        alunos = r.hmget(STUDENT_CODES_KEY, [student_num_id for student_num_id, _ in registros])
+        yield [(student_num_id, aluno, valor) for (student_num_id, valor), aluno in zip(registros, alunos)]
+
+def packed_lookups(quiz_id, question_id, alunos, ids):
+    """Agrupa por bucket as respostas a buscar: lista de (chave do bucket, campos, posições em alunos)."""
+    por_bucket = {}
+    for posicao, aluno in enumerate(alunos):
+        if aluno in ids:
+            bucket, field = packed_location(ids[aluno])
+            campos, posicoes = por_bucket.setdefault(bucket, ([], []))
+            campos.append(field)
+            posicoes.append(posicao)
+    return [(packed_bucket_key(quiz_id, question_id, bucket), campos, posicoes)
+            for bucket, (campos, posicoes) in por_bucket.items()]
+
+def unpack_lookups(total, lookups, valores_por_bucket):
+    """Converte o resultado dos HMGET de packed_lookups em listas (respostas, tempos) alinhadas aos alunos."""
+    respostas = [None] * total
+    tempos = [None] * total
+    for (_, _, posicoes), valores in zip(lookups, valores_por_bucket):
+        for posicao, valor in zip(posicoes, valores):
+            if valor is not None:
+                respostas[posicao], tempos[posicao] = unpack_answer(valor)
+    return respostas, tempos
+
+def read_packed_answers(quiz_id, question_id, alunos):
+    """Retorna (respostas, tempos) dos alunos numa questão; None para quem não respondeu."""
+    lookups = packed_lookups(quiz_id, question_id, alunos, get_student_ids(alunos))
+    pipe = r.pipeline(transaction=False)
+    for bucket_key, campos, _ in lookups:
+        pipe.hmget(bucket_key, campos)
+    return unpack_lookups(len(alunos), lookups, pipe.execute())
+
+# Script Lua que expurga um lote de respostas compactas de uma questão, mantendo
+# consistentes answered, leaderboard, acertos e agregados. Só desconta as respostas
+# que ainda estavam gravadas (HDEL), então repetir um lote não tem efeito.
+# KEYS: questão, correct_answers, leaderboard, estatísticas da questão, acertos da questão,
+#       answered (bitmap), versões do quiz e da questão, buckets de respostas...
+# ARGV: janela em segundos, peso do acerto, e para cada resposta: índice do bucket em KEYS,
+#       campo no bucket, id numérico do aluno, código do aluno
+# Retorna {respostas expurgadas, 1 se o aluno mais rápido foi expurgado}
+PURGE_LUA = """
+local correct_answer = redis.call('HGET', KEYS[1], 'correct_answer')
+local fastest_id = redis.call('HGET', KEYS[4], 'fastest_id')
+local purged, fastest_purged = 0, 0
+for i = 3, #ARGV, 4 do
+    local bucket = KEYS[tonumber(ARGV[i])]
+    local valor = redis.call('HGET', bucket, ARGV[i + 1])
+    if valor then
+        local student = ARGV[i + 3]
+        local separador = string.find(valor, ':', 1, true)
+        local response_time = tonumber(string.sub(valor, 1, separador - 1)) / 1000
+        local answer = string.sub(valor, separador + 1)
+        local score = tonumber(ARGV[1]) - response_time
+        redis.call('HINCRBY', KEYS[4], 'total', -1)
+        redis.call('HINCRBY', KEYS[4], 'opt:' .. answer, -1)
+        redis.call('HINCRBYFLOAT', KEYS[4], 'time_total', tostring(-response_time))
+        if answer == correct_answer then
+            if redis.call('HINCRBY', KEYS[2], student, -1) <= 0 then
+                redis.call('HDEL', KEYS[2], student)
+            end
+            redis.call('HINCRBY', KEYS[4], 'correct', -1)
+            score = score + tonumber(ARGV[2])
+        end
+        if tonumber(redis.call('ZINCRBY', KEYS[3], tostring(-score), student)) <= 0.000001 then
+            redis.call('ZREM', KEYS[3], student)
+        end
+        redis.call('HDEL', bucket, ARGV[i + 1])
+        redis.call('SETBIT', KEYS[6], ARGV[i + 2], 0)
+        redis.call('ZREM', KEYS[5], student)
+        if student == fastest_id then
+            fastest_purged = 1
+        end
+        purged = purged + 1
+    end
+end
+if purged > 0 then
+    redis.call('INCR', KEYS[7])
+    redis.call('INCR', KEYS[8])
+end
+return {purged, fastest_purged}
+"""
+purge_script = r.register_script(PURGE_LUA)
+
+# Script Lua que libera o lock apenas se ele ainda pertence a quem o adquiriu
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+release_lock_script = r.register_script(RELEASE_LOCK_LUA)
+
+# Script Lua que renova o lock apenas se ele ainda pertence a quem o adquiriu
+EXTEND_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+extend_lock_script = r.register_script(EXTEND_LOCK_LUA)
+
+def purge_question_answers(quiz_id, question_id, cutoff):
+    """Expurga, em fatias de RETENTION_BATCH_SIZE, as respostas de uma questão encerrada antes de cutoff.
+
+    Todas as respostas de uma questão chegam dentro da janela depois do start_time, então
+    a retenção é decidida por questão, sem guardar o momento de cada resposta.
+    """
+    ensure_packed_storage(quiz_id, question_id)
+    start_time = r.hget(question_key(quiz_id, question_id), "start_time")
+    if start_time is None or float(start_time) + ANSWER_WINDOW > cutoff:
+        return 0
+
+    base_keys = [
+        question_key(quiz_id, question_id),
+        correct_answers_key(quiz_id),
+        leaderboard_key(quiz_id),
+        stats_key(quiz_id, question_id),
+        correct_students_key(quiz_id, question_id),
+        answered_bits_key(quiz_id, question_id),
+        quiz_version_key(quiz_id),
+        question_version_key(quiz_id, question_id),
+    ]
+    total = 0
+    rebuild_stats = False
+    for registros in iter_packed_records(quiz_id, question_id):
+        for inicio in range(0, len(registros), RETENTION_BATCH_SIZE):
+            keys = list(base_keys)
+            indices = {}
+            args = [ANSWER_WINDOW, RANKING_SCORE_SCALE]
+            for student_num_id, aluno, _ in registros[inicio:inicio + RETENTION_BATCH_SIZE]:
+                bucket, field = packed_location(student_num_id)
+                if bucket not in indices:
+                    keys.append(packed_bucket_key(quiz_id, question_id, bucket))
+                    indices[bucket] = len(keys)
+                args.extend([indices[bucket], field, student_num_id, aluno])
+            purged, fastest_purged = purge_script(keys=keys, args=args)
+            total += purged
+            rebuild_stats = rebuild_stats or bool(fastest_purged)
+
+    # O bitmap continua ocupando memória mesmo zerado
+    if total and not r.bitcount(answered_bits_key(quiz_id, question_id)):
+        r.delete(answered_bits_key(quiz_id, question_id))
+
+    # O aluno mais rápido não pode ser "decrementado"; recalcula a partir do que restou
+    if rebuild_stats:
+        rebuild_question_stats(quiz_id, question_id)
+    return total
+
+# Função para expurgar respostas mais antigas que o período de retenção
 def purge_answers():
-    current_time = get_current_time()
-    for key in r.keys(QUIZ_PREFIX + '*'):
-        question_keys = r.keys(key + ":*")
-        for question_key in question_keys:
-            answered_students = r.smembers(question_key + ":answered")
-            for student_id in answered_students:
-                response_time = float(r.hget(TIME_PREFIX + question_key + ":response_time", student_id) or 0)
-                if current_time - response_time > 30 * 24 * 60 * 60:  # 30 dias
-                    r.srem(question_key + ":answered", student_id)
-                    r.hdel(TIME_PREFIX + question_key + ":response_time", student_id)
-                    logging.info(f"Deleted answer for student {student_id} in question {question_key}")
+    """Executa uma rodada de retenção, se nenhum outro worker estiver executando.
+
+    Os quizzes são percorridos com ZSCAN e as respostas das questões encerradas antes do
+    limite são removidas em fatias pequenas, para nunca bloquear o Redis.
+    Retorna o total de respostas expurgadas, ou None se outro worker tem o lock.
+    """
+    token = uuid.uuid4().hex
+    lock_ttl_ms = int(RETENTION_LOCK_TTL * 1000)
+    if not r.set(RETENTION_LOCK_KEY, token, nx=True, px=lock_ttl_ms):
+        logging.info("Retenção já está em execução em outro worker.")
+        return None
+
+    started = time.perf_counter()
+    cutoff = get_current_time() - RETENTION_DAYS * 24 * 60 * 60
+    total = 0
+    try:
+        cursor = 0
+        while True:
+            cursor, quizzes = r.zscan(QUIZZES_KEY, cursor, count=RETENTION_BATCH_SIZE)
+            for quiz_id, _ in quizzes:
+                for question_id in get_question_ids(quiz_id):
+                    purged = purge_question_answers(quiz_id, question_id, cutoff)
+                    if purged:
+                        logging.info(f"Expurgadas {purged} respostas da questão {question_id} do quiz {quiz_id}")
+                    total += purged
+                if not extend_lock_script(keys=[RETENTION_LOCK_KEY], args=[token, lock_ttl_ms]):
+                    logging.warning("Lock de retenção perdido; interrompendo a rodada.")
+                    return total
+            if cursor == 0:
+                break
+    finally:
+        release_lock_script(keys=[RETENTION_LOCK_KEY], args=[token])
+        PURGE_DURATION.observe(time.perf_counter() - started)
+        PURGED_ANSWERS.inc(total)
+
+    logging.info(f"Retenção concluída: {total} respostas expurgadas em {time.perf_counter() - started:.2f}s")
+    return total
 
 # Scheduler para rodar a função de purgar as respostas
 def run_scheduler():
     while True:
-        time.sleep(30 * 24 * 60 * 60)  # Espera 30 dias
-        purge_answers()
+        time.sleep(RETENTION_INTERVAL)
+        try:
+            purge_answers()
+        except redis.exceptions.RedisError:
+            logging.exception("Falha na rodada de retenção")
+
+def leaderboard_period(window, timestamp):
+    """Retorna (período, início, fim) da janela que contém o momento, no fuso LEADERBOARD_UTC_OFFSET."""
+    local = datetime.fromtimestamp(timestamp + LEADERBOARD_UTC_OFFSET, timezone.utc).replace(tzinfo=None)
+    dia = datetime(local.year, local.month, local.day)
+    if window == "day":
+        inicio, fim = dia, dia + timedelta(days=1)
+        periodo = dia.strftime("%Y-%m-%d")
+    elif window == "week":
+        inicio = dia - timedelta(days=dia.weekday())
+        fim = inicio + timedelta(days=7)
+        ano, semana, _ = local.isocalendar()
+        periodo = f"{ano}-W{semana:02d}"
+    else:
+        termo = (local.month - 1) // LEADERBOARD_TERM_MONTHS
+        inicio = datetime(local.year, termo * LEADERBOARD_TERM_MONTHS + 1, 1)
+        meses = (termo + 1) * LEADERBOARD_TERM_MONTHS
+        fim = datetime(local.year + meses // 12, meses % 12 + 1, 1)
+        periodo = f"{local.year}-T{termo + 1}"
+    utc = lambda momento: momento.replace(tzinfo=timezone.utc).timestamp() - LEADERBOARD_UTC_OFFSET
+    return periodo, utc(inicio), utc(fim)
+
+# Script Lua que soma às janelas o que mudou no leaderboard de um quiz desde a última
+# atualização: a cópia nova menos o snapshot já somado. A cópia fica com o máximo de cada
+# aluno, então expurgar respostas antigas (retenção) não tira pontos das janelas. Tudo
+# acontece num passo atômico com o registro da versão aplicada, então repetir é seguro.
+# KEYS: cópia nova do leaderboard do quiz, snapshot, versões aplicadas, versão dos
+#       leaderboards, e as janelas do quiz
+# ARGV: quiz, "criação:versão" do quiz, expiração do snapshot e a expiração de cada janela
+#       (na ordem de KEYS)
+APPLY_LEADERBOARD_LUA = """
+redis.call('ZUNIONSTORE', KEYS[1], 2, KEYS[1], KEYS[2], 'AGGREGATE', 'MAX')
+for i = 5, #KEYS do
+    redis.call('ZUNIONSTORE', KEYS[i], 3, KEYS[i], KEYS[1], KEYS[2], 'WEIGHTS', 1, 1, -1)
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', '0.000001')
+    redis.call('EXPIREAT', KEYS[i], ARGV[i - 1])
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    redis.call('EXPIREAT', KEYS[2], ARGV[3])
+end
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+return redis.call('INCR', KEYS[4])
+"""
+apply_leaderboard_script = r.register_script(APPLY_LEADERBOARD_LUA)
+
+def copy_sorted_set(origem, destino):
+    """Copia um sorted set: no servidor se as chaves ficam no mesmo slot/nó, senão com ZSCAN em lotes."""
+    if len(sharding.group_keys(r, [origem, destino])) == 1:
+        r.zunionstore(destino, [origem])
+        return
+    r.delete(destino)
+    for lote in iter_batches(r.zscan_iter(origem, count=RANKING_SCAN_BATCH), RANKING_SCAN_BATCH):
+        r.zadd(destino, dict(lote))
+
+def apply_quiz_leaderboard(quiz_id, creation_time, opened_time, course, estado, agora):
+    """Soma às janelas (globais e do curso) a diferença do quiz desde a última atualização.
+
+    As pontuações vêm das respostas, aceitas só até ANSWER_WINDOW depois da abertura da
+    questão: a diferença entra nas janelas da abertura mais recente de uma questão do quiz.
+    Retorna False se todas essas janelas já expiraram.
+    """
+    chaves, expiracoes = [], []
+    for window, dias in LEADERBOARD_KEEP_DAYS.items():
+        periodo, _, fim = leaderboard_period(window, opened_time)
+        expira = int(fim + dias * 24 * 60 * 60)
+        if expira <= agora:
+            continue
+        for escopo in (None, course) if course else (None,):
+            chaves.append(leaderboard_window_key(window, periodo, escopo))
+            expiracoes.append(expira)
+    if not chaves:
+        return False
+
+    # A cópia é lida antes do script; uma resposta gravada durante a cópia muda a versão
+    # do quiz e entra na próxima atualização
+    snapshot = leaderboard_snapshot_key(quiz_id, creation_time)
+    copy_sorted_set(leaderboard_key(quiz_id), snapshot + ":next")
+    apply_leaderboard_script(
+        keys=[snapshot + ":next", snapshot, LEADERBOARD_APPLIED_KEY, LEADERBOARD_VERSION_KEY, *chaves],
+        args=[quiz_id, estado, max(expiracoes), *expiracoes])
+    return True
+
+def refresh_quiz_leaderboards(quizzes, agora):
+    """Atualiza as janelas com os quizzes do lote cuja versão mudou; retorna quantos foram aplicados."""
+    pipe = r.pipeline(transaction=False)
+    for quiz_id in quizzes:
+        pipe.hmget(quiz_key(quiz_id), "creation_time", "course")
+        pipe.get(quiz_version_key(quiz_id))
+        pipe.zscore(QUIZZES_OPENED_KEY, quiz_id)
+    pipe.hmget(LEADERBOARD_APPLIED_KEY, quizzes)
+    resultados = pipe.execute()
+
+    aplicados = 0
+    for quiz_id, (creation_time, course), versao, opened_time, aplicado in zip(
+            quizzes, resultados[0:-1:3], resultados[1:-1:3], resultados[2:-1:3], resultados[-1]):
+        if creation_time is None:
+            continue  # quiz removido depois da leitura do registro
+        estado = f"{creation_time}:{versao or 0}"
+        if estado == aplicado:
+            continue
+        # Quizzes de antes do registro das aberturas ficam nas janelas da criação
+        opened_time = opened_time if opened_time is not None else float(creation_time)
+        if apply_quiz_leaderboard(quiz_id, creation_time, opened_time, course, estado, agora):
+            aplicados += 1
+    return aplicados
+
+# Função para atualizar os leaderboards globais e por curso
+def refresh_leaderboards(full=False):
+    """Executa uma rodada de atualização dos leaderboards, se nenhum outro worker estiver executando.
+
+    Percorre os quizzes com questões abertas desde o início do período letivo atual (ou
+    todos, com full) e soma às janelas só os quizzes que mudaram desde a rodada anterior.
+    Retorna a quantidade de quizzes aplicados, ou None se outro worker tem o lock.
+    """
+    token = uuid.uuid4().hex
+    lock_ttl_ms = int(LEADERBOARD_LOCK_TTL * 1000)
+    if not r.set(LEADERBOARD_LOCK_KEY, token, nx=True, px=lock_ttl_ms):
+        logging.debug("Atualização dos leaderboards já está em execução em outro worker.")
+        return None
+
+    started = time.perf_counter()
+    agora = get_current_time()
+    # Um quiz criado há muito tempo pode ter questões abertas agora: a busca é pela abertura
+    registro = QUIZZES_KEY if full else QUIZZES_OPENED_KEY
+    inicio = "-inf" if full else min(leaderboard_period("term", agora)[1],
+                                     agora - LEADERBOARD_LOOKBACK_DAYS * 24 * 60 * 60)
+    total = 0
+    try:
+        offset = 0
+        while True:
+            quizzes = r.zrangebyscore(registro, inicio, "+inf", start=offset, num=LEADERBOARD_BATCH_SIZE)
+            if not quizzes:
+                break
+            offset += len(quizzes)
+            total += refresh_quiz_leaderboards(quizzes, agora)
+            if not extend_lock_script(keys=[LEADERBOARD_LOCK_KEY], args=[token, lock_ttl_ms]):
+                logging.warning("Lock dos leaderboards perdido; interrompendo a rodada.")
+                return total
+    finally:
+        release_lock_script(keys=[LEADERBOARD_LOCK_KEY], args=[token])
+        LEADERBOARD_REFRESH_DURATION.observe(time.perf_counter() - started)
+        LEADERBOARD_QUIZZES_APPLIED.inc(total)
+
+    if total:
+        logging.info(f"Leaderboards atualizados: {total} quizzes em {time.perf_counter() - started:.2f}s")
+    return total
+
+# Atualização periódica dos leaderboards globais
+def run_leaderboard_refresher():
+    while True:
+        time.sleep(LEADERBOARD_REFRESH_SECONDS)
+        try:
+            refresh_leaderboards()
+        except redis.exceptions.RedisError:
+            logging.exception("Falha na atualização dos leaderboards")
+
+# Script Lua que aplica um lote de respostas enfileiradas e as confirma (XACK) no mesmo
+# passo atômico: uma resposta nunca é confirmada sem ser aplicada e, se for entregue de
+# novo (worker reiniciado), apply_answer não grava nada. As confirmadas saem do stream.
+# KEYS: stream, correct_answers, leaderboard, versão do quiz, e para cada questão do lote
+#       questão, estatísticas, acertos e versão da questão (nessa ordem), seguidas dos
+#       buckets de respostas
+# ARGV: grupo, janela em segundos, peso do acerto, canal de eventos do quiz, e para cada
+#       mensagem: id, índice da questão em KEYS, índice do bucket em KEYS, campo no bucket,
+#       student_id, answer, tempo de resposta em ms
+APPLY_INGESTED_LUA = APPLY_ANSWER_LUA + """
+local window, scale = tonumber(ARGV[2]), tonumber(ARGV[3])
+local applied = 0
+for i = 5, #ARGV, 7 do
+    local question = tonumber(ARGV[i + 1])
+    if apply_answer(KEYS[question], KEYS[tonumber(ARGV[i + 2])], ARGV[i + 3], KEYS[2], KEYS[3],
+                    KEYS[question + 1], KEYS[question + 2], ARGV[i + 4], ARGV[i + 5],
+                    tonumber(ARGV[i + 6]), window, scale) == 1 then
+        redis.call('INCR', KEYS[question + 3])
+        applied = applied + 1
+    end
+    redis.call('XACK', KEYS[1], ARGV[1], ARGV[i])
+    redis.call('XDEL', KEYS[1], ARGV[i])
+end
+if applied > 0 then
+    redis.call('INCR', KEYS[4])
+    redis.call('PUBLISH', ARGV[4], 'ingest')
+end
+return applied
+"""
+apply_ingested_script = r.register_script(APPLY_INGESTED_LUA)
+
+def apply_ingested_answers(stream, messages):
+    """Aplica um lote de mensagens lidas do stream de ingestão de um quiz; retorna as aplicadas."""
+    quiz_id = quiz_id_from_key(stream, ":ingest")
+    keys = [stream, correct_answers_key(quiz_id), leaderboard_key(quiz_id), quiz_version_key(quiz_id)]
+    args = [INGEST_GROUP, ANSWER_WINDOW, RANKING_SCORE_SCALE, events_channel(quiz_id)]
+    indices = {}
+    agora = get_current_time()
+    for message_id, campos in messages:
+        if not campos:  # mensagem removida do stream enquanto estava pendente
+            continue
+        question_id = campos["q"]
+        bucket, field = packed_location(int(campos["n"]))
+        if ("questão", question_id) not in indices:
+            indices[("questão", question_id)] = len(keys) + 1
+            keys += [question_key(quiz_id, question_id), stats_key(quiz_id, question_id),
+                     correct_students_key(quiz_id, question_id), question_version_key(quiz_id, question_id)]
+        if (question_id, bucket) not in indices:
+            keys.append(packed_bucket_key(quiz_id, question_id, bucket))
+            indices[(question_id, bucket)] = len(keys)
+        args += [message_id, indices[("questão", question_id)], indices[(question_id, bucket)], field,
+                 campos["s"], campos["a"], campos["ms"]]
+        INGEST_DELAY.observe(max(agora - int(message_id.split("-")[0]) / 1000, 0))
+
+    if len(args) == 4:
+        return 0
+    applied = apply_ingested_script(keys=keys, args=args)
+    INGEST_APPLIED.inc(applied)
+    return applied
+
+def ensure_ingest_group(stream):
+    try:
+        r.xgroup_create(stream, INGEST_GROUP, id="0", mkstream=True)
+    except redis.exceptions.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
 
-# Inicia o scheduler em uma thread separada
-threading.Thread(target=run_scheduler, daemon=True).start()
+def claim_stalled_answers(stream, consumer):
+    """Assume e aplica as mensagens paradas com consumidores que deixaram de responder."""
+    start_id = "0-0"
+    while True:
+        start_id, messages, *_ = r.xautoclaim(stream, INGEST_GROUP, consumer, INGEST_CLAIM_IDLE_MS,
+                                              start_id=start_id, count=INGEST_BATCH_SIZE)
+        if messages:
+            apply_ingested_answers(stream, messages)
+        if start_id == "0-0" or not messages:
+            return
+
+# Worker de ingestão: lê os streams de todos os quizzes pelo consumer group e aplica em lotes
+def run_ingest_worker(consumer):
+    streams = set()
+    proxima_retomada = 0
+    while True:
+        try:
+            # Streams de quizzes novos entram na leitura assim que aparecem no registro, e os
+            # de quizzes arquivados (removidos do registro) saem
+            registrados = r.smembers(INGEST_STREAMS_KEY)
+            streams &= registrados
+            for stream in registrados - streams:
+                ensure_ingest_group(stream)
+                streams.add(stream)
+            # De tempos em tempos, retoma as mensagens de workers que caíram
+            if time.monotonic() >= proxima_retomada:
+                for stream in streams:
+                    claim_stalled_answers(stream, consumer)
+                proxima_retomada = time.monotonic() + INGEST_REFRESH_SECONDS
+
+            if not streams:
+                time.sleep(INGEST_BLOCK_MS / 1000)
+                continue
+            for stream, messages in read_ingest_streams(consumer, streams):
+                apply_ingested_answers(stream, messages)
+        except redis.exceptions.RedisError:
+            logging.exception("Falha no worker de ingestão; tentando novamente")
+            time.sleep(1)
+
+def read_ingest_streams(consumer, streams):
+    """Lê as mensagens novas dos streams e retorna [(stream, mensagens), ...].
+
+    Num Redis só, um XREADGROUP bloqueante cobre todos os streams. No Cluster e no anel,
+    um XREADGROUP só aceita streams do mesmo slot/nó: os grupos são lidos sem bloquear,
+    num pipeline, e o worker espera INGEST_POLL_SECONDS quando não há nada novo.
+    """
+    grupos = sharding.group_keys(r, streams)
+    if len(grupos) == 1:
+        return r.xreadgroup(INGEST_GROUP, consumer, {stream: ">" for stream in grupos[0]},
+                            count=INGEST_BATCH_SIZE, block=INGEST_BLOCK_MS) or []
+
+    pipe = r.pipeline(transaction=False)
+    for grupo in grupos:
+        pipe.xreadgroup(INGEST_GROUP, consumer, {stream: ">" for stream in grupo}, count=INGEST_BATCH_SIZE)
+    lidas = [item for resultado in pipe.execute() for item in resultado or []]
+    if not lidas:
+        time.sleep(INGEST_POLL_SECONDS)
+    return lidas
+
+def start_ingest_workers(quantidade):
+    """Inicia os workers de ingestão em threads, com nomes de consumidor únicos no grupo."""
+    for indice in range(quantidade):
+        consumer = f"{socket.gethostname()}-{os.getpid()}-{indice}"
+        threading.Thread(target=run_ingest_worker, args=(consumer,), daemon=True).start()
+
+def update_ingest_metrics():
+    """Atualiza os gauges de atraso da ingestão e retorna (respostas pendentes, idade da mais antiga)."""
+    streams = list(r.smembers(INGEST_STREAMS_KEY))
+    pipe = r.pipeline(transaction=False)
+    for stream in streams:
+        pipe.xlen(stream)
+        pipe.xrange(stream, count=1)
+    resultados = pipe.execute()
+    pendentes = sum(resultados[0::2])
+    mais_antigas = [int(primeira[0][0].split("-")[0]) / 1000 for primeira in resultados[1::2] if primeira]
+    idade = max(get_current_time() - min(mais_antigas), 0) if mais_antigas else 0
+    INGEST_BACKLOG.set(pendentes)
+    INGEST_OLDEST_AGE.set(idade)
+    return pendentes, idade
+
+# Threads de fundo de cada processo: o listener de invalidação do cache, o scheduler de
+# retenção, a atualização dos leaderboards e, no modo "stream", os workers de ingestão
+# (0 desliga). Elas começam na primeira requisição, não no import, para que um master com
+# --preload não as perca no fork.
+background_jobs_lock = threading.Lock()
+background_jobs_started = False
+
+def start_background_jobs(settings):
+    """Inicia as threads de fundo uma única vez por processo."""
+    global background_jobs_started
+    with background_jobs_lock:
+        if background_jobs_started:
+            return
+        background_jobs_started = True
+    threading.Thread(target=run_cache_invalidation_listener, daemon=True).start()
+    if settings["RETENTION_SCHEDULER"]:
+        threading.Thread(target=run_scheduler, daemon=True).start()
+    if settings["LEADERBOARD_REFRESHER"]:
+        threading.Thread(target=run_leaderboard_refresher, daemon=True).start()
+    if ANSWER_INGEST_MODE == "stream":
+        start_ingest_workers(settings["ANSWER_INGEST_WORKERS"])
+
+@api.before_app_request
+def ensure_background_jobs():
+    if not background_jobs_started:
+        start_background_jobs(current_app.config["QUIZ_SETTINGS"])
+
+def create_app(config=None):
+    """Monta a aplicação com a configuração do ambiente, sobrescrita pelas chaves de config.
+
+    Não conecta no Redis nem inicia threads: o pool é criado no primeiro comando e as threads
+    de fundo na primeira requisição. Com REDIS_CLIENT em config, usa esse cliente já pronto.
+    config só sobrescreve as chaves de settings_from_env(); os outros ajustes vêm do ambiente.
+    """
+    settings = {**settings_from_env(), **(config or {})}
+    logging.basicConfig(level=settings["LOG_LEVEL"])
+
+    client = settings.pop("REDIS_CLIENT", None)
+    if client is not None:
+        instrument_redis_nodes(client)
+        r.configure(client=client)
+    else:
+        r.configure(factory=lambda: build_redis_client(settings))
+
+    app = Flask(__name__)
+    app.config.update(settings)
+    app.config["QUIZ_SETTINGS"] = settings
+    CORS(app)
+    app.register_blueprint(api)
+    return app
+
+# Leituras condicionais: cada rota de leitura monta um ETag com as versões de que depende,
+# lidas numa única ida ao Redis. Se o cliente já tem essa versão (If-None-Match), responde
+# 304 sem corpo; senão reaproveita o corpo já serializado do cache local enquanto o ETag
+# não muda, e só recalcula e serializa de novo quando alguma versão avança.
+response_cache = LocalCache(RESPONSE_CACHE_SIZE, float("inf"))
+
+def encode_json(payload):
+    """Serializa para bytes com o orjson (se instalado), com as chaves ordenadas como o jsonify."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+
+def version_etag(*versoes):
+    """ETag a partir das versões de que a leitura depende (contadores ausentes valem 0)."""
+    return "-".join(str(versao or 0) for versao in versoes)
+
+def body_etag(body):
+    """ETag de um corpo que não muda depois de criado (a questão): um resumo do conteúdo."""
+    return hashlib.md5(body.encode() if isinstance(body, str) else body).hexdigest()
+
+def cached_body(cache_key, etag):
+    """Corpo já serializado para esse ETag, se estiver no cache local."""
+    item = response_cache.get(cache_key)
+    if item is not None and item[0] == etag:
+        RESPONSE_CACHE.inc(1, cache_key[0], "hit")
+        return item[1]
+    RESPONSE_CACHE.inc(1, cache_key[0], "miss")
+    return None
+
+def store_body(cache_key, etag, payload):
+    """Serializa o payload, guarda o corpo no cache local com o ETag e o retorna."""
+    body = encode_json(payload)
+    if len(body) <= RESPONSE_CACHE_MAX_BYTES:
+        response_cache.set(cache_key, (etag, body))
+    return body
+
+def conditional_json(cache_key, etag, build):
+    """Responde a uma leitura com ETag; build() monta (payload, status) só quando não há corpo em cache."""
+    if request.if_none_match.contains_weak(etag):
+        RESPONSE_CACHE.inc(1, cache_key[0], "not_modified")
+        return etag_response(None, etag, 304)
+    body = cached_body(cache_key, etag)
+    if body is None:
+        payload, status = build()
+        if status != 200:
+            return jsonify(payload), status
+        body = store_body(cache_key, etag, payload)
+    return etag_response(body, etag)
+
+def etag_response(body, etag, status=200):
+    response = Response(body, status=status, mimetype="application/json")
+    response.set_etag(etag)
+    # O cliente pode guardar a resposta, mas revalida (If-None-Match) antes de cada uso
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 # Rota para adicionar usuários
-@app.route('/users', methods=['POST'])
+@api.route('/users', methods=['POST'])
 def add_users():
+    """Cadastra usuários a partir de um JSON ({"users": [...]}) ou de um upload em NDJSON/CSV.
+
+    Os usuários são gravados em lotes (parâmetro `batch_size`), cada lote num único pipeline.
+    Uploads em NDJSON/CSV são lidos do corpo da requisição sem carregá-lo inteiro na memória.
+    """
+    try:
+        batch_size = int(request.args.get('batch_size', USER_IMPORT_BATCH_SIZE))
+    except ValueError:
+        return jsonify({"error": "batch_size must be an integer"}), 400
+    if batch_size <= 0:
+        return jsonify({"error": "batch_size must be positive"}), 400
+
+    if request.mimetype in USER_IMPORT_FORMATS:
+        users = USER_IMPORT_FORMATS[request.mimetype](request.stream)
+        added, errors, batches = 0, [], []
+        for batch_number, batch in enumerate(iter_batches(users, batch_size), start=1):
+            added_users, batch_errors = import_users_batch(batch)
+            added += len(added_users)
+            errors.extend(batch_errors)
+            batches.append({"batch": batch_number, "received": len(batch),
+                            "added": len(added_users), "errors": len(batch_errors)})
+
+        if not batches:
+            return jsonify({"error": "At least one user must be provided"}), 400
+
+        resumo = {"added": added, "batches": batches}
+        if errors:
+            return jsonify({"errors": errors, **resumo}), 400
+        return jsonify({"message": "Users added successfully", **resumo}), 201
+
     data = request.json
     users = data.get('users', [])
 
@@ -70,101 +1412,162 @@ def add_users():
     added_users = []
     errors = []
 
-    for user in users:
-        username = user.get('username')
-        user_code = user.get('code')
-
-        if not username or not user_code:
-            errors.append(f"User code or username missing for user: {user}")
-            continue
-
-        if r.exists(USER_PREFIX + user_code):
-            errors.append(f"User code {user_code} already exists.")
-            continue
-
-        r.hset(USER_PREFIX + user_code, "username", username)
-        added_users.append({"user_code": user_code, "username": username})
+    for batch in iter_batches(users, batch_size):
+        batch_added, batch_errors = import_users_batch(batch)
+        added_users.extend(batch_added)
+        errors.extend(batch_errors)
 
     if errors:
         return jsonify({"errors": errors, "added_users": added_users}), 400
 
     return jsonify({"message": "Users added successfully", "added_users": added_users}), 201
 
+def import_users_batch(users):
+    """Grava um lote de usuários num único pipeline e retorna (usuários adicionados, erros).
+
+    O HSETNX detecta códigos já existentes sem uma ida extra ao Redis por usuário.
+    Cada usuário novo recebe também o seu id numérico denso.
+    """
+    validos, errors = payloads.validate_users(users)
+    if not validos:
+        return [], errors
+
+    now = get_current_time()
+    pipe = r.pipeline(transaction=False)
+    for user_code, username in validos:
+        pipe.hsetnx(USER_PREFIX + user_code, "username", username)
+    added_users, existentes = payloads.new_users(validos, pipe.execute())
+    errors.extend(existentes)
+
+    if added_users:
+        codigos = [user["user_code"] for user in added_users]
+        pipe = r.pipeline(transaction=False)
+        pipe.zadd(USERS_KEY, dict.fromkeys(codigos, now), nx=True)
+        pipe.incr(USERS_VERSION_KEY)
+        # Os ids numéricos do formato compacto são criados já no cadastro, na ordem do lote
+        assign_student_ids_script(keys=[STUDENT_IDS_KEY, STUDENT_CODES_KEY, STUDENT_NEXT_ID_KEY],
+                                  args=codigos, client=pipe)
+        payloads.store_student_ids({}, codigos, pipe.execute()[-1], student_id_cache)
+
+    return added_users, errors
+
+def iter_batches(items, batch_size):
+    """Agrupa um iterável em listas de até batch_size itens."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def read_ndjson_users(stream):
+    """Lê usuários de um corpo NDJSON (um objeto {"username", "code"} por linha)."""
+    for linha in io.TextIOWrapper(stream, encoding="utf-8"):
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            yield json.loads(linha)
+        except ValueError:
+            yield {"invalid_line": linha}
+
+def read_csv_users(stream):
+    """Lê usuários de um corpo CSV com cabeçalho contendo as colunas username e code."""
+    yield from csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline=""))
+
 # Rota para pegar todos os usuários
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
 def get_users():
-    all_users = []
-    
-    user_keys = r.keys(USER_PREFIX + "*")
-    for user_key in user_keys:
-        user_code = user_key.split(":")[-1]
-        username = r.hget(USER_PREFIX + user_code, "username")
-        all_users.append({"user_code": user_code, "username": username})
-    
-    return jsonify({"users": all_users}), 200
+    etag = version_etag(r.get(USERS_VERSION_KEY))
+    return conditional_json(("users",), etag, build_users)
+
+def build_users():
+    user_codes = get_all_students()
+    usernames = get_usernames(user_codes)
+    all_users = [{"user_code": user_code, "username": usernames[user_code]} for user_code in user_codes]
+
+    return {"users": all_users}, 200
 
 # Rota para criar um quiz
-@app.route('/quizzes', methods=['POST'])
+@api.route('/quizzes', methods=['POST'])
 def create_quiz():
     data = request.json
     quiz_id = data.get('id')
     questions = data.get('questions')
+    # Curso opcional: o quiz entra também nos leaderboards do curso
+    course = data.get('course')
 
     if not quiz_id or not questions:
         return jsonify({"error": "Quiz ID and questions are required"}), 400
 
-    if r.exists(QUIZ_PREFIX + quiz_id):
+    if course is not None and (not isinstance(course, str) or not course):
+        return jsonify({"error": "course must be a non-empty string"}), 400
+
+    if r.exists(quiz_key(quiz_id)):
         return jsonify({"error": "Quiz ID already exists"}), 400
 
-    r.hset(QUIZ_PREFIX + quiz_id, "creation_time", get_current_time())
+    creation_time = get_current_time()
+    # A transação cobre só as chaves do quiz (mesmo slot no layout "tagged"); o registro
+    # em QUIZZES_KEY vem depois, quando o quiz já existe por inteiro
+    pipe = r.pipeline()
+    pipe.hset(quiz_key(quiz_id), mapping={"creation_time": creation_time, **({"course": course} if course else {})})
+    pipe.incr(quiz_version_key(quiz_id))
 
     for question in questions:
         question_id = question['id']
-        r.hset(QUIZ_PREFIX + quiz_id + ":" + question_id, mapping={
+        pipe.hset(question_key(quiz_id, question_id), mapping={
             "text": question['text'],
             "correct_answer": question['correct_answer'],
             "options": json.dumps(question['options']),
+            "storage": PACKED_STORAGE,
         })
+        pipe.rpush(questions_key(quiz_id), question_id)
+    pipe.execute()
+    r.zadd(QUIZZES_KEY, {quiz_id: creation_time})
+
+    # Um quiz recriado com o mesmo id não pode ser servido pelo cache antigo de outro worker
+    publish_cache_invalidation(quiz_id)
 
     return jsonify({"message": "Quiz created successfully"}), 201
 
 # Rota para pegar uma questão de um quiz
-@app.route('/quizzes/<quiz_id>/questions/<question_id>', methods=['GET'])
+@api.route('/quizzes/<quiz_id>/questions/<question_id>', methods=['GET'])
 def get_question(quiz_id, question_id):
-    # Recupera os dados da questão do Redis
-    question_data = r.hgetall(QUIZ_PREFIX + quiz_id + ":" + question_id)
-
-    # Verifica se a questão existe
-    if not question_data:
-        return jsonify({"error": "Question not found"}), 404
-
-    # Verifica se já existe o "start_time" para a questão
-    start_time = r.hget(QUIZ_PREFIX + quiz_id + ":" + question_id, "start_time")
-
-    # Se "start_time" não existir, cria um novo timestamp (quando a questão foi acessada pela primeira vez)
-    if not start_time:
-        start_time = get_current_time()  # Função para obter o timestamp atual
-        r.hset(QUIZ_PREFIX + quiz_id + ":" + question_id, "start_time", start_time)
-
-    # Converte as opções da questão de JSON para um objeto Python (lista ou dicionário)
-    question_data['options'] = json.loads(question_data['options'])
-
-    # Remover a chave "correct_answer" da resposta
-    if 'correct_answer' in question_data:
-        del question_data['correct_answer']
-
-    # Adiciona o "start_time" ao dicionário para enviar na resposta
-    question_data['start_time'] = start_time
-
-    # Retorna a questão com todas as informações, sem a resposta correta
-    return jsonify({
-        "question_id": question_id,
-        "question": question_data
-    }), 200
-
+    # O conteúdo da questão não muda depois de aberta: serve o corpo já serializado do cache local
+    body = question_cache.get((quiz_id, question_id))
+    if body is None:
+        # Recupera os dados da questão do Redis, gravando o "start_time" no primeiro acesso (HSETNX)
+        agora = get_current_time()
+        question_data = open_question_script(keys=[question_key(quiz_id, question_id)], args=[agora])
+
+        # Verifica se a questão existe
+        if not question_data:
+            return jsonify({"error": "Question not found"}), 404
+
+        # Na primeira abertura, o quiz passa a ser visitado pelas atualizações dos leaderboards
+        if question_opened_now(question_data, agora):
+            r.zadd(QUIZZES_OPENED_KEY, {quiz_id: agora}, gt=True)
+
+        # Retorna a questão com todas as informações, sem a resposta correta
+        body = payloads.encode_question(question_id, question_data)
+        question_cache.set((quiz_id, question_id), body)
+
+    # Como o corpo não muda, o ETag é o próprio resumo dele
+    etag = body_etag(body)
+    if request.if_none_match.contains_weak(etag):
+        RESPONSE_CACHE.inc(1, "question", "not_modified")
+        return etag_response(None, etag, 304)
+    return etag_response(body, etag)
+
+def question_opened_now(question_data, agora):
+    """Indica se foi esta chamada do script de abertura que gravou o "start_time" da questão."""
+    question_data = dict(zip(question_data[::2], question_data[1::2]))
+    return float(question_data.get("start_time", 0)) == agora
 
 # Rota para responder a uma questão de um quiz
-@app.route('/quizzes/<quiz_id>/answer', methods=['POST'])
+@api.route('/quizzes/<quiz_id>/answer', methods=['POST'])
 def answer_quiz(quiz_id):
     data = request.json
     question_id = data.get('question_id')
@@ -177,92 +1580,177 @@ def answer_quiz(quiz_id):
     # Pega o timestamp real da resposta
     response_timestamp = get_current_time()
 
-    # Verifica se a questão está disponível para responder
-    start_time = float(r.hget(QUIZ_PREFIX + quiz_id + ":" + question_id, "start_time") or 0)
-    if response_timestamp > start_time + 20:
-        return jsonify({"error": "Time expired for answering this question"}), 400
+    # Validação e gravação acontecem num único script atômico (uma ida ao Redis)
+    status = record_answer(quiz_id, question_id, student_id, answer, response_timestamp)
 
-    if r.sismember(QUIZ_PREFIX + quiz_id + ":" + question_id + ":answered", student_id):
-        return jsonify({"error": "User has already answered this question"}), 400
+    if status in ANSWER_ERRORS:
+        return jsonify({"error": ANSWER_ERRORS[status]}), 400
+
+    if ANSWER_INGEST_MODE == "stream":
+        return jsonify({"message": "Answer accepted", "data": data}), 202
+    return jsonify({"message": "Answer recorded", "data": data}), 200
 
-    # Calcular o tempo de resposta em segundos
-    response_time_in_seconds = response_timestamp - start_time
+# Rota para enviar respostas em lote (gateways que coletam as respostas offline)
+@api.route('/quizzes/<quiz_id>/answers/batch', methods=['POST'])
+def answer_quiz_batch(quiz_id):
+    """Registra um lote de respostas ({"answers": [{question_id, student_id, answer, timestamp}]}).
 
-    # Armazena a resposta e o tempo de resposta
-    r.hset(QUIZ_PREFIX + quiz_id + ":" + question_id + ":responses", student_id, answer)
-    r.hset(TIME_PREFIX + quiz_id + ":" + question_id + ":response_time", student_id, response_time_in_seconds)
+    O timestamp é o momento (epoch, em segundos) em que o aluno respondeu, segundo o
+    gateway; valem as mesmas regras de prazo e duplicidade de answer_quiz. Retorna o
+    resultado de cada registro, na ordem enviada.
+    """
+    data = request.json
+    registros = data.get('answers') if isinstance(data, dict) else None
 
-    correct_answer = r.hget(QUIZ_PREFIX + quiz_id + ":" + question_id, "correct_answer")
-    if answer == correct_answer:
-        r.hincrby(QUIZ_PREFIX + quiz_id + ":correct_answers", student_id, 1)
+    if not registros or not isinstance(registros, list):
+        return jsonify({"error": "At least one answer must be provided"}), 400
+    if len(registros) > ANSWER_BATCH_MAX_RECORDS:
+        return jsonify({"error": f"At most {ANSWER_BATCH_MAX_RECORDS} answers per batch"}), 413
 
-    r.sadd(QUIZ_PREFIX + quiz_id + ":" + question_id + ":answered", student_id)
+    if not quiz_exists(quiz_id):
+        return jsonify({"error": f"Quiz {quiz_id} not found"}), 404
 
-    return jsonify({"message": "Answer recorded", "data": data}), 200
+    question_ids = sorted({registro.get('question_id') for registro in registros
+                           if isinstance(registro, dict) and isinstance(registro.get('question_id'), str)})
+    pipe = r.pipeline(transaction=False)
+    for question_id in question_ids:
+        pipe.exists(question_key(quiz_id, question_id))
+    existentes = {question_id for question_id, existe in zip(question_ids, pipe.execute()) if existe}
+
+    validos, resultados = payloads.validate_batch_answers(registros, existentes, get_current_time())
+    for lote in iter_batches(validos, ANSWER_BATCH_PIPELINE_SIZE):
+        for (indice, *_), status in zip(lote, record_answers_batch(quiz_id, lote)):
+            resultados[indice] = payloads.batch_answer_result(indice, status, ANSWER_INGEST_MODE == "stream")
+
+    return jsonify(payloads.summarize_batch_results(quiz_id, resultados)), 200
+
+def record_answers_batch(quiz_id, lote):
+    """Registra um lote de respostas validadas com os scripts de resposta num único pipeline.
+
+    Retorna um código ANSWER_* por registro. Alunos não cadastrados são recusados sem ir ao
+    script; questões ainda no formato antigo são migradas e os seus registros, reenviados.
+    """
+    ids = get_registered_student_ids([student_id for _, _, student_id, _, _ in lote])
+    stream = ANSWER_INGEST_MODE == "stream"
+
+    script = ingest_script if stream else answer_script
+
+    def executar(posicoes):
+        pipe = r.pipeline(transaction=False)
+        if stream:
+            register_ingest_stream(quiz_id, pipe)
+        for posicao in posicoes:
+            _, question_id, student_id, answer, timestamp = lote[posicao]
+            keys, args = answer_script_call(quiz_id, question_id, student_id, ids[student_id], answer, timestamp, stream)
+            script(keys=keys, args=args, client=pipe)
+        return pipe.execute()[1:] if stream else pipe.execute()
+
+    statuses, cadastrados = payloads.batch_statuses(lote, ids)
+    payloads.update_statuses(statuses, cadastrados, executar(cadastrados))
+    pendentes = payloads.positions_to_migrate(statuses)
+    if pendentes:
+        for question_id in {lote[posicao][1] for posicao in pendentes}:
+            migrate_question_storage(quiz_id, question_id)
+        payloads.update_statuses(statuses, pendentes, executar(pendentes))
+    return statuses
 
 # Rota para pegar as respostas de um quiz
-@app.route('/quizzes/<quiz_id>/responses', methods=['GET'])
+@api.route('/quizzes/<quiz_id>/responses', methods=['GET'])
 def get_responses_for_quiz(quiz_id):
-    """Retorna as respostas enviadas para um quiz específico ou uma questão específica do quiz."""
+    """Retorna as respostas enviadas para um quiz específico ou uma questão específica do quiz.
+
+    Além do JSON completo de sempre, aceita dois modos para quizzes grandes:
+    - `cursor` (e opcionalmente `count`): devolve uma página e o `next_cursor`;
+    - `format=ndjson` ou `format=csv`: transmite todas as respostas em streaming.
+    """
     question_id = request.args.get('question_id')
-    
-    quiz_key = QUIZ_PREFIX + quiz_id
-    if not r.exists(quiz_key):
-        return jsonify({"error": f"Quiz {quiz_id} not found"}), 404
+    formato = request.args.get('format')
+    cursor = request.args.get('cursor')
 
-    all_responses = []
+    if not r.exists(quiz_key(quiz_id)):
+        return jsonify({"error": f"Quiz {quiz_id} not found"}), 404
 
     # Verifica se question_id foi fornecido
     if question_id:
-        question_key = QUIZ_PREFIX + quiz_id + ":" + question_id
-        if not r.exists(question_key):
+        if not r.exists(question_key(quiz_id, question_id)):
             return jsonify({"error": f"Question {question_id} not found in quiz {quiz_id}"}), 404
-        
-        responses = r.hgetall(question_key + ":responses")
-        user_keys = r.keys(USER_PREFIX + "*")
-        
-        for user_key in user_keys:
-            user_code = user_key.split(":")[-1]
-            student_id = user_code
-            answer = responses.get(student_id, "0")
-            response_time = r.hget(TIME_PREFIX + quiz_id + ":" + question_id + ":response_time", student_id)
-            response_time = float(response_time) if response_time else 20.0
-            
-            all_responses.append({
-                "student_id": student_id,
-                "answer": answer,
-                "response_time": response_time
-            })
+        question_ids = [question_id]
     else:
-        # Pega todas as respostas do quiz
-        question_keys = r.keys(QUIZ_PREFIX + quiz_id + ":*")
-        question_keys = [key for key in question_keys if not key.endswith(':responses') and not key.endswith(':correct_answers') and not key.endswith(':answered')]
-        
-        for question_key in question_keys:
-            question_id = question_key.split(":")[-1]
-            responses = r.hgetall(QUIZ_PREFIX + quiz_id + ":" + question_id + ":responses")
-            
-            user_keys = r.keys(USER_PREFIX + "*")
-            for user_key in user_keys:
-                user_code = user_key.split(":")[-1]
-                student_id = user_code
-                answer = responses.get(student_id, "0")
-                response_time = r.hget(TIME_PREFIX + quiz_id + ":" + question_id + ":response_time", student_id)
-                response_time = float(response_time) if response_time else 20.0
-                
-                all_responses.append({
-                    "student_id": student_id,
-                    "answer": answer,
-                    "response_time": response_time
-                })
+        question_ids = get_question_ids(quiz_id)
+
+    try:
+        count = int(request.args.get('count', RESPONSES_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "count must be an integer"}), 400
+    if not 0 < count <= RESPONSES_MAX_PAGE_SIZE:
+        return jsonify({"error": f"count must be between 1 and {RESPONSES_MAX_PAGE_SIZE}"}), 400
+
+    if formato in RESPONSE_STREAM_FORMATS:
+        linhas = stream_responses(quiz_id, question_ids, formato, count)
+        return Response(linhas, mimetype=RESPONSE_STREAM_FORMATS[formato]), 200
+    if formato:
+        return jsonify({"error": f"Unknown format {formato}"}), 400
+
+    if cursor is not None:
+        try:
+            question_index, offset = payloads.decode_responses_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        pagina = []
+        next_cursor = None
+        for question_index, offset, rows in iter_response_pages(quiz_id, question_ids, count, question_index, offset):
+            pagina = rows
+            next_cursor = payloads.encode_responses_cursor(question_index, offset + count)
+            break
+
+        return jsonify({
+            "quiz_id": quiz_id,
+            "responses": pagina,
+            "next_cursor": next_cursor
+        }), 200
+
+    all_responses = []
+    for _, _, rows in iter_response_pages(quiz_id, question_ids, count):
+        for row in rows:
+            del row["question_id"]
+            all_responses.append(row)
 
     return jsonify({
         "quiz_id": quiz_id,
         "responses": all_responses
     }), 200
 
+def iter_response_pages(quiz_id, question_ids, page_size, question_index=0, offset=0):
+    """Percorre as respostas página a página: (índice da questão, offset, linhas).
+
+    Cada página lê um bloco de alunos do registro e busca as respostas compactas com um
+    HMGET por bucket, de modo que a memória usada não depende do tamanho do quiz.
+    """
+    while question_index < len(question_ids):
+        question_id = question_ids[question_index]
+        alunos = r.zrange(USERS_KEY, offset, offset + page_size - 1)
+        if not alunos:
+            question_index, offset = question_index + 1, 0
+            continue
+
+        ensure_packed_storage(quiz_id, question_id)
+        respostas, tempos = read_packed_answers(quiz_id, question_id, alunos)
+
+        yield question_index, offset, payloads.response_rows(question_id, alunos, respostas, tempos)
+
+        offset += page_size
+
+def stream_responses(quiz_id, question_ids, formato, page_size):
+    """Gera as respostas do quiz em NDJSON ou CSV, uma página de alunos por vez."""
+    if formato == "csv":
+        yield RESPONSES_CSV_HEADER
+
+    for _, _, rows in iter_response_pages(quiz_id, question_ids, page_size):
+        yield payloads.encode_response_rows(rows, formato)
+
 # Rota para obter as estatísticas (analytics) de uma questão de um quiz
-@app.route('/quizzes/<quiz_id>/analytics', methods=['GET'])
+@api.route('/quizzes/<quiz_id>/analytics', methods=['GET'])
 def get_quiz_analytics(quiz_id):
     """Retorna as estatísticas de respostas para uma questão específica de um quiz."""
 
@@ -271,269 +1759,947 @@ def get_quiz_analytics(quiz_id):
     if not question_id:
         return jsonify({"error": "ID da questão é obrigatório"}), 400
 
-    # Verificar se o quiz existe
-    quiz_key = QUIZ_PREFIX + quiz_id
-    if not r.exists(quiz_key):
+    # Verificar se o quiz e a questão existem, lendo na mesma ida as versões do ETag
+    chave_questao = question_key(quiz_id, question_id)
+    pipe = r.pipeline(transaction=False)
+    pipe.hmget(quiz_key(quiz_id), "creation_time", "incarnation")
+    pipe.exists(chave_questao)
+    pipe.get(question_version_key(quiz_id, question_id))
+    pipe.get(USERS_VERSION_KEY)
+    (creation_time, incarnation), questao_existe, versao_questao, versao_usuarios = pipe.execute()
+
+    if creation_time is None:
         return jsonify({"error": f"Quiz {quiz_id} não encontrado"}), 404
 
-    # Verificar se a questão existe dentro do quiz
-    question_key = QUIZ_PREFIX + quiz_id + ":" + question_id
-    if not r.exists(question_key):
+    if not questao_existe:
         return jsonify({"error": f"Questão {question_id} não encontrada no quiz {quiz_id}"}), 404
 
-    # Obter todas as respostas para a questão
-    responses = r.hgetall(question_key + ":responses")
-    if not responses:
-        return jsonify({"error": "Nenhuma resposta encontrada para esta questão"}), 404
-
-    # Contabilizando as respostas
-    total_respostas = len(responses)
-    acertos = 0
-    distribuicao_respostas = {opcao: 0 for opcao in json.loads(r.hget(question_key, "options") or "[]")}
-    tempo_total_respostas = 0
-    desempenho_alunos = {}  # Armazenará desempenho de cada aluno (acertos, tempo, etc.)
-
-    # Iterar sobre as respostas para calcular as estatísticas
-    for student_id, answer in responses.items():
-        # Contabilizando as respostas corretas
-        resposta_correta = r.hget(question_key, "correct_answer")
-        is_correct = 1 if answer == resposta_correta else 0
-        acertos += is_correct
-
-        # Atualizar a distribuição de respostas
-        if answer in distribuicao_respostas:
-            distribuicao_respostas[answer] += 1
-
-        # Contabilizar o tempo de resposta
-        tempo_resposta = r.hget(TIME_PREFIX + quiz_id + ":" + question_id + ":response_time", student_id)
-        tempo_resposta = float(tempo_resposta) if tempo_resposta else 20.0
-        tempo_total_respostas += tempo_resposta
-
-        # Obter o nome do aluno
-        username = r.hget(USER_PREFIX + student_id, "username")
-
-        # Armazenar informações do aluno para cálculo de desempenho
-        desempenho_alunos[student_id] = {
-            'is_correct': is_correct,
-            'tempo_resposta': tempo_resposta,
-            'username': username  # Incluir o nome do aluno
-        }
+    try:
+        limite = request.args.get('limit')
+        limite = int(limite) if limite is not None else None
+    except ValueError:
+        return jsonify({"error": "limit deve ser um número inteiro"}), 400
+
+    if limite is not None and limite <= 0:
+        return jsonify({"error": "limit deve ser positivo"}), 400
+
+    # O momento da criação e a encarnação entram no ETag porque um quiz recriado ou
+    # reimportado volta a contar as versões do zero
+    etag = version_etag(creation_time, incarnation, versao_questao, versao_usuarios)
+    return conditional_json(("analytics", quiz_id, question_id, limite), etag,
+                            lambda: build_quiz_analytics(quiz_id, question_id, limite))
+
+def build_quiz_analytics(quiz_id, question_id, limite):
+    """Lê os agregados mantidos por answer_quiz, sem percorrer as respostas, e monta o analytics."""
+    chave_questao = question_key(quiz_id, question_id)
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(stats_key(quiz_id, question_id))
+    pipe.hget(chave_questao, "options")
+    pipe.zrange(correct_students_key(quiz_id, question_id), 0, -1 if limite is None else limite - 1, withscores=True)
+    pipe.zcard(USERS_KEY)
+    estatisticas, opcoes, alunos_que_acertaram, total_alunos = pipe.execute()
+
+    if not int(estatisticas.get("total", 0)):
+        return {"error": "Nenhuma resposta encontrada para esta questão"}, 404
+
+    nomes = get_usernames(payloads.analytics_students(estatisticas, alunos_que_acertaram))
+    return payloads.analytics_payload(quiz_id, question_id, estatisticas, opcoes, alunos_que_acertaram,
+                                      total_alunos, nomes), 200
+
+@api.route('/quizzes/<quiz_id>/ranking', methods=['GET'])
+def get_quiz_ranking(quiz_id):
+    """Retorna o ranking geral dos alunos de um quiz, considerando todas as questões.
 
-    # Calcular o tempo médio de resposta
-    tempo_medio_resposta = tempo_total_respostas / total_respostas if total_respostas > 0 else 0
-
-    # Cálculo das novas métricas
-    # 1. Alternativa mais votada (retornar apenas a mais votada)
-    alternativas_mais_votadas = sorted(distribuicao_respostas.items(), key=lambda x: x[1], reverse=True)
-    alternativa_mais_votada = alternativas_mais_votadas[0] if alternativas_mais_votadas else None  # Apenas a mais votada
-
-    # 2. Questões com mais abstenções (em relação a total de alunos que poderiam responder)
-    total_alunos = len(r.keys(USER_PREFIX + "*"))
-    absteve = total_alunos - total_respostas
-
-    # 3. Alunos com maior acerto e mais rápidos
-    # Ordenamos os alunos com base no número de acertos e no tempo de resposta
-    ranking_alunos = sorted(desempenho_alunos.items(), key=lambda x: (x[1]['is_correct'], -x[1]['tempo_resposta']), reverse=True)
-    melhor_aluno = ranking_alunos[0] if ranking_alunos else None  # O melhor aluno (maior acerto e mais rápido)
-
-    # 4. Alunos com maior acerto (sem considerar o tempo de resposta)
-    alunos_com_maior_acerto = sorted(desempenho_alunos.items(), key=lambda x: x[1]['is_correct'], reverse=True)
-    alunos_com_maior_acerto = [
-        {"id": aluno[0], "aluno": aluno[1]['username'], "acertos": aluno[1]['is_correct']} 
-        for aluno in alunos_com_maior_acerto if aluno[1]['is_correct'] == 1
-    ]  # Só os que acertaram
-
-    # 5. Alunos mais rápidos (sem considerar os acertos)
-    alunos_mais_rapidos = sorted(desempenho_alunos.items(), key=lambda x: x[1]['tempo_resposta'])
-    melhor_aluno_por_velocidade = alunos_mais_rapidos[0] if alunos_mais_rapidos else None  # O aluno mais rápido
-
-    # Preparar a resposta de analytics
-    dados_analytics = {
-        "total_respostas": total_respostas,
-        "acertos": acertos,
-        "erros": total_respostas - acertos,
-        "Respostas_mais_votadas": alternativa_mais_votada,
-        "tempo_medio_resposta": tempo_medio_resposta,
-        "melhor_aluno": {
-            "id": melhor_aluno[0] if melhor_aluno else None,
-            "Aluno": melhor_aluno[1]['username'] if melhor_aluno else None,
-            "acertos": melhor_aluno[1]['is_correct'] if melhor_aluno else None,
-            "tempo_resposta": melhor_aluno[1]['tempo_resposta'] if melhor_aluno else None
-        },
-        "alunos_com_maior_acerto": alunos_com_maior_acerto,
-        "melhor_aluno_por_velocidade": {
-            "id": melhor_aluno_por_velocidade[0] if melhor_aluno_por_velocidade else None,
-            "aluno": melhor_aluno_por_velocidade[1]['username'] if melhor_aluno_por_velocidade else None,
-            "tempo_resposta em segundos": melhor_aluno_por_velocidade[1]['tempo_resposta'] if melhor_aluno_por_velocidade else None
-        },
-        "abstencoes": absteve
-    }
+    O ranking é lido do leaderboard mantido por answer_quiz. Aceita paginação com
+    `limit`/`offset` e a consulta da posição de um aluno com `student_id`.
+    """
 
-    return jsonify({
-        "quiz_id": quiz_id,
-        "question_id": question_id,
-        "analytics": dados_analytics
-    }), 200
+    # Verificar se o quiz existe, lendo na mesma ida as versões do ETag
+    pipe = r.pipeline(transaction=False)
+    pipe.hmget(quiz_key(quiz_id), "creation_time", "incarnation")
+    pipe.get(quiz_version_key(quiz_id))
+    pipe.get(USERS_VERSION_KEY)
+    (creation_time, incarnation), versao_quiz, versao_usuarios = pipe.execute()
 
-@app.route('/quizzes/<quiz_id>/ranking', methods=['GET'])
-def get_quiz_ranking(quiz_id):
-    """Retorna o ranking geral dos alunos de um quiz, considerando todas as questões."""
-    
-    # Verificar se o quiz existe
-    if not quiz_exists(quiz_id):
+    if creation_time is None:
         return jsonify({"error": f"Quiz {quiz_id} não encontrado"}), 404
 
-    alunos = get_all_students()  # Obter todos os alunos
-    desempenho_alunos = initialize_student_performance(alunos)  # Inicializar desempenho dos alunos
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return jsonify({"error": "limit e offset devem ser números inteiros"}), 400
+
+    if offset < 0 or (limit is not None and limit < 0):
+        return jsonify({"error": "limit e offset não podem ser negativos"}), 400
 
-    # Obter todas as chaves de perguntas do quiz
-    question_keys = get_question_keys(quiz_id)
-    
-    # Processar as respostas para cada questão
-    for question_key in question_keys:
-        question_id = extract_question_id(question_key)
-        process_respostas_for_question(quiz_id, question_id, alunos, question_key, desempenho_alunos)
+    student_id = request.args.get('student_id')
+    etag = version_etag(creation_time, incarnation, versao_quiz, versao_usuarios)
+    return conditional_json(("ranking", quiz_id, offset, limit, student_id), etag,
+                            lambda: build_quiz_ranking(quiz_id, offset, limit, student_id))
 
-    # Calcular o tempo médio de resposta de todos os alunos
-    calculate_average_response_time(desempenho_alunos)
+def build_quiz_ranking(quiz_id, offset, limit, student_id):
+    total_questoes = r.llen(questions_key(quiz_id))
 
-    # Ordenar o ranking com base no número de acertos e no tempo de resposta
-    ranking = sort_ranking(desempenho_alunos)
+    if student_id:
+        posicao = get_student_rank(quiz_id, student_id)
+        if posicao is None:
+            return {"error": f"Aluno {student_id} não encontrado"}, 404
+        offset, entrada = posicao
+        ranking = [entrada]
+    else:
+        ranking = get_ranking_page(quiz_id, offset, limit)
 
     # Retornar o ranking formatado
-    return jsonify({
-        "quiz_id": quiz_id,
-        "ranking": format_ranking(ranking)
-    }), 200
+    nomes = get_usernames([aluno_id for aluno_id, _ in ranking])
+    return payloads.ranking_payload(quiz_id, ranking, offset, total_questoes, nomes), 200
+
+# Rota para os leaderboards globais e por curso
+@api.route('/leaderboards/<window>', methods=['GET'])
+def get_leaderboard(window):
+    """Retorna uma página do leaderboard de uma janela ("day", "week" ou "term") de todos os quizzes.
+
+    Com `course`, só os quizzes do curso; `period` escolhe outra janela (o padrão é a atual,
+    por exemplo 2024-05-13, 2024-W20 ou 2024-T1). Aceita paginação com `limit`/`offset` e
+    a consulta da posição de um aluno com `student_id`. As janelas são atualizadas por
+    refresh_leaderboards, a cada LEADERBOARD_REFRESH_SECONDS.
+    """
+    if window not in LEADERBOARD_KEEP_DAYS:
+        return jsonify({"error": f"Janela {window} desconhecida (use {', '.join(LEADERBOARD_KEEP_DAYS)})"}), 400
+
+    period = request.args.get('period') or leaderboard_period(window, get_current_time())[0]
+    if not re.fullmatch(LEADERBOARD_PERIOD_FORMATS[window], period):
+        return jsonify({"error": f"Período {period} inválido para a janela {window}"}), 400
+
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', LEADERBOARD_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit e offset devem ser números inteiros"}), 400
+
+    if offset < 0 or not 0 < limit <= LEADERBOARD_MAX_PAGE_SIZE:
+        return jsonify({"error": f"offset não pode ser negativo e limit deve estar entre 1 e {LEADERBOARD_MAX_PAGE_SIZE}"}), 400
+
+    course = request.args.get('course') or None
+    student_id = request.args.get('student_id')
+    pipe = r.pipeline(transaction=False)
+    pipe.get(LEADERBOARD_VERSION_KEY)
+    pipe.get(USERS_VERSION_KEY)
+    # O período entra no ETag: sem `period`, a janela atual muda na virada do dia/semana
+    etag = version_etag(period, *pipe.execute())
+    return conditional_json(("leaderboard", window, period, course, offset, limit, student_id), etag,
+                            lambda: build_leaderboard(window, period, course, offset, limit, student_id))
+
+def build_leaderboard(window, period, course, offset, limit, student_id):
+    chave = leaderboard_window_key(window, period, course)
+    pipe = r.pipeline(transaction=False)
+    pipe.zcard(chave)
+    if student_id:
+        pipe.zrevrank(chave, student_id)
+        pipe.zscore(chave, student_id)
+        total, posicao, score = pipe.execute()
+        if posicao is None:
+            return {"error": f"Aluno {student_id} não está no leaderboard"}, 404
+        offset, ranking = posicao, [(student_id, score)]
+    else:
+        pipe.zrevrange(chave, offset, offset + limit - 1, withscores=True)
+        total, ranking = pipe.execute()
+
+    nomes = get_usernames([aluno_id for aluno_id, _ in ranking])
+    return payloads.leaderboard_payload(window, period, course, total, ranking, offset, nomes), 200
 
 # Funções auxiliares
 def quiz_exists(quiz_id):
     """Verifica se o quiz existe no banco de dados."""
-    quiz_key = QUIZ_PREFIX + quiz_id
-    return r.exists(quiz_key)
+    return r.exists(quiz_key(quiz_id))
 
 def get_all_students():
     """Retorna uma lista com todos os alunos cadastrados."""
-    alunos = r.keys(USER_PREFIX + "*")
-    return [aluno.split(":")[-1] for aluno in alunos]
-
-def initialize_student_performance(alunos):
-    """Inicializa o desempenho de todos os alunos."""
-    return {aluno: {
-                "total_acertos": 0,
-                "total_respostas": 0,
-                "tempo_total_resposta": 0,
-                "tempo_medio_resposta": 0
-            } for aluno in alunos}
+    return r.zrange(USERS_KEY, 0, -1)
 
-def get_question_keys(quiz_id):
-    """Retorna as chaves de todas as questões de um quiz, excluindo respostas e respostas corretas."""
-    question_keys = r.keys(QUIZ_PREFIX + quiz_id + ":*")
-    return [key for key in question_keys if not key.endswith(":responses") and not key.endswith(":correct_answers")]
-
-def extract_question_id(question_key):
-    """Extrai o ID da questão a partir da chave."""
-    return question_key.split(":")[-1]
-
-def process_respostas_for_question(quiz_id, question_id, alunos, question_key, desempenho_alunos):
-    """Processa as respostas de todos os alunos para uma questão específica e atualiza o desempenho."""
-    respostas = r.hgetall(question_key + ":responses")
-    
-    for aluno, resposta in respostas.items():
-        is_correct = check_answer(question_key, resposta)
-        tempo_resposta = calculate_response_time(quiz_id, question_id, aluno, question_key)
-        
-        if tempo_resposta is not None:  # Considera apenas alunos com tempo de resposta válido
-            update_student_performance(aluno, is_correct, tempo_resposta, desempenho_alunos)
-    
-    # Para os alunos que não responderam à questão, atribui o tempo de resposta padrão (20s).
+def get_usernames(alunos):
+    """Retorna um dicionário aluno -> nome, buscando todos os nomes num único pipeline."""
+    pipe = r.pipeline(transaction=False)
     for aluno in alunos:
-        if aluno not in respostas:
-            # Atribui 20 segundos para alunos que não responderam
-            desempenho_alunos[aluno]["total_respostas"] += 1
-            desempenho_alunos[aluno]["tempo_total_resposta"] += 20.0  # Tempo padrão de 20 segundos
-
-def check_answer(question_key, resposta):
-    """Verifica se a resposta está correta."""
-    resposta_correta = r.hget(question_key, "correct_answer")
-    return resposta == resposta_correta
-
-def calculate_response_time(quiz_id, question_id, aluno, question_key):
-    """Calcula o tempo de resposta de um aluno para uma questão, usando a diferença entre os timestamps."""
-
-    # Obter o timestamp de início da questão (quando o GET foi feito)
-    start_time_raw = r.hget(question_key, "start_time")
-    
-    # Verificar se o start_time existe e é válido
-    if not start_time_raw:
-        logging.error(f"start_time não encontrado para {question_key} | quiz_id: {quiz_id}, question_id: {question_id}")
-        return None  # Se start_time não existir, não há como calcular o tempo
+        pipe.hget(USER_PREFIX + aluno, "username")
+    return dict(zip(alunos, pipe.execute()))
 
-    try:
-        start_time = float(start_time_raw)
-        logging.debug(f"start_time para {question_key}: {start_time}")
-    except ValueError:
-        logging.error(f"Valor inválido para start_time: {start_time_raw} | quiz_id: {quiz_id}, question_id: {question_id}")
-        return None
+def get_question_ids(quiz_id):
+    """Retorna os ids das questões de um quiz, na ordem em que foram criadas."""
+    return r.lrange(questions_key(quiz_id), 0, -1)
 
-    # Obter o timestamp de resposta do aluno (quando a resposta foi submetida)
-    tempo_resposta_raw = r.hget(TIME_PREFIX + quiz_id + ":" + question_id + ":response_time", aluno)
+def get_question_keys(quiz_id):
+    """Retorna as chaves de todas as questões de um quiz."""
+    return [question_key(quiz_id, question_id) for question_id in get_question_ids(quiz_id)]
+
+def get_ranking_page(quiz_id, offset, limit):
+    """Retorna uma página do ranking como lista de (aluno, pontuação).
+
+    Depois dos alunos que responderam vêm os alunos cadastrados sem nenhuma resposta.
+    """
+    leaderboard = leaderboard_key(quiz_id)
+    faixa = payloads.ranking_page_range(offset, limit)
+    if faixa is None:
+        return []
+
+    total_no_leaderboard = r.zcard(leaderboard)
+    pagina = []
+    if offset < total_no_leaderboard:
+        pagina = r.zrevrange(leaderboard, *faixa, withscores=True)
+
+    # Completa a página com os alunos que ainda não responderam nada
+    ausentes = payloads.UnrankedStudents(offset, limit, total_no_leaderboard, len(pagina))
+    inicio = 0
+    while not ausentes.done:
+        alunos = r.zrange(USERS_KEY, inicio, inicio + RANKING_SCAN_BATCH - 1)
+        if not alunos:
+            break
+        inicio += len(alunos)
+
+        pipe = r.pipeline(transaction=False)
+        for aluno in alunos:
+            pipe.zscore(leaderboard, aluno)
+        pagina.extend(ausentes.take(alunos, pipe.execute()))
+
+    return pagina
+
+def get_student_rank(quiz_id, student_id):
+    """Retorna (posição, (aluno, pontuação)) de um aluno, com posição começando em zero.
+
+    Alunos sem respostas empatam logo depois do último aluno do leaderboard.
+    """
+    leaderboard = leaderboard_key(quiz_id)
+    pipe = r.pipeline(transaction=False)
+    pipe.zrevrank(leaderboard, student_id)
+    pipe.zscore(leaderboard, student_id)
+    pipe.zcard(leaderboard)
+    pipe.zscore(USERS_KEY, student_id)
+    return payloads.student_rank(student_id, *pipe.execute())
+
+def format_ranking(ranking, offset, total_questoes):
+    """Formata o ranking para exibição na resposta."""
+    nomes = get_usernames([aluno_id for aluno_id, _ in ranking])
+    return payloads.format_ranking_entries(ranking, offset, total_questoes, nomes)
 
-    # Verificar se o tempo de resposta existe
-    if not tempo_resposta_raw:
-        return None  # Se o tempo de resposta não existir, retornar None
-    
-    try:
-        tempo_resposta = float(tempo_resposta_raw)
-    except (ValueError, TypeError):
-        return None
+# Rota para o relatório psicométrico de um quiz inteiro
+@api.route('/quizzes/<quiz_id>/report', methods=['GET'])
+def get_quiz_report(quiz_id):
+    """Retorna dificuldade, discriminação, percentis de tempo e distratores de todas as questões.
 
-    # Calcular o tempo real de resposta (diferença entre timestamp_resposta e timestamp_start)
-    tempo_real_resposta = tempo_resposta 
+    O relatório é calculado com NumPy e guardado no Redis com a versão do quiz; enquanto
+    nenhuma resposta nova chegar, é servido direto do cache.
+    """
+    if psychometrics.np is None:
+        return jsonify({"error": "NumPy não está instalado; relatório indisponível"}), 501
 
-    # Log da diferença do tempo
-    logging.debug(f"Diferença entre tempo_resposta e start_time para aluno {aluno}: {tempo_real_resposta}")
+    if not quiz_exists(quiz_id):
+        return jsonify({"error": f"Quiz {quiz_id} não encontrado"}), 404
 
-    # Verificar se o tempo real de resposta é válido
-    if tempo_real_resposta <= 0:
-        return None  # Se o tempo for inválido (zero ou negativo), retornamos None
+    return Response(get_quiz_report_body(quiz_id), mimetype="application/json"), 200
+
+def get_quiz_report_body(quiz_id):
+    """Retorna o relatório serializado do cache, ou o recalcula se o quiz mudou desde então."""
+    pipe = r.pipeline(transaction=False)
+    pipe.get(quiz_version_key(quiz_id))
+    pipe.hmget(report_key(quiz_id), "version", "body")
+    versao, (versao_em_cache, corpo) = pipe.execute()
+    versao = versao or "0"
+    if corpo is not None and versao_em_cache == versao:
+        return corpo
+
+    # A versão é lida antes da carga: respostas que chegarem durante o cálculo invalidam o resultado
+    total_ids, items = load_report_items(quiz_id)
+    corpo = json.dumps(payloads.report_payload(quiz_id, versao, total_ids, items))
+
+    pipe = r.pipeline()
+    pipe.hset(report_key(quiz_id), mapping={"version": versao, "body": corpo})
+    pipe.expire(report_key(quiz_id), int(REPORT_CACHE_TTL))
+    pipe.execute()
+    return corpo
+
+def load_report_items(quiz_id):
+    """Carrega as respostas do quiz como colunas da matriz aluno × questão.
+
+    Os buckets de todas as questões são lidos em pipelines de REPORT_PIPELINE_SIZE comandos.
+    Retorna (quantidade de ids de alunos, lista de psychometrics.Item).
+    """
+    question_ids = get_question_ids(quiz_id)
+    pipe = r.pipeline(transaction=False)
+    pipe.get(STUDENT_NEXT_ID_KEY)
+    for question_id in question_ids:
+        ensure_packed_storage(quiz_id, question_id)
+        pipe.hmget(question_key(quiz_id, question_id), "correct_answer", "options")
+    total_ids, *questoes = pipe.execute()
+    total_ids = int(total_ids or 0)
+    total_buckets = (total_ids + PACKED_BUCKET_SIZE - 1) // PACKED_BUCKET_SIZE
+
+    opcoes = [list(json.loads(opcoes_json or "[]")) for _, opcoes_json in questoes]
+    indices_opcoes = [{opcao: indice for indice, opcao in enumerate(lista)} for lista in opcoes]
+    colunas = [([], [], []) for _ in question_ids]  # alunos, alternativas, tempos em ms
+
+    leituras = [(indice, bucket) for indice in range(len(question_ids)) for bucket in range(total_buckets)]
+    for lote in iter_batches(leituras, REPORT_PIPELINE_SIZE):
+        pipe = r.pipeline(transaction=False)
+        for indice, bucket in lote:
+            pipe.hgetall(packed_bucket_key(quiz_id, question_ids[indice], bucket))
+        for (indice, bucket), campos in zip(lote, pipe.execute()):
+            if not campos:
+                continue
+            alunos, alternativas, tempos = colunas[indice]
+            indice_opcao, fora_das_opcoes = indices_opcoes[indice], len(opcoes[indice])
+            base = bucket * PACKED_BUCKET_SIZE
+            for field, valor in campos.items():
+                response_ms, answer = valor.split(":", 1)
+                alunos.append(base + int(field))
+                alternativas.append(indice_opcao.get(answer, fora_das_opcoes))
+                tempos.append(int(response_ms))
+
+    np = psychometrics.np
+    return total_ids, [
+        psychometrics.Item(
+            question_id=question_id,
+            options=opcoes[indice],
+            correct=indices_opcoes[indice].get(questoes[indice][0], -1),
+            rows=np.array(alunos, dtype=np.int64),
+            choices=np.array(alternativas, dtype=np.int64),
+            times=np.array(tempos, dtype=np.float64) / 1000,
+        )
+        for indice, (question_id, (alunos, alternativas, tempos)) in enumerate(zip(question_ids, colunas))
+    ]
+
+# Rota para exportar um quiz (definições, respostas e pontuações) num arquivo colunar
+@api.route('/quizzes/<quiz_id>/archive', methods=['GET'])
+def export_quiz(quiz_id):
+    """Baixa o quiz em Parquet (`format=parquet`, requer pyarrow) ou CSV com gzip (`format=csv`)."""
+    formato = request.args.get('format', archive.default_format())
+    if formato not in archive.available_formats():
+        return jsonify({"error": f"Formato {formato} indisponível (use um de {', '.join(archive.available_formats())})"}), 400
 
-    return tempo_real_resposta
+    if not quiz_exists(quiz_id):
+        return jsonify({"error": f"Quiz {quiz_id} não encontrado"}), 404
 
-def update_student_performance(aluno, is_correct, tempo_real_resposta, desempenho_alunos):
-    """Atualiza o desempenho de um aluno com base na resposta e no tempo de resposta."""
-    if is_correct:
-        desempenho_alunos[aluno]["total_acertos"] += 1
-    desempenho_alunos[aluno]["total_respostas"] += 1
-    desempenho_alunos[aluno]["tempo_total_resposta"] += tempo_real_resposta
+    arquivo = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE)
+    try:
+        write_quiz_archive(quiz_id, arquivo, formato)
+    except ValueError as e:
+        arquivo.close()
+        return jsonify({"error": str(e)}), 409
+    arquivo.seek(0)
+    mimetype, extensao = archive.FORMATS[formato]
+    return send_file(arquivo, mimetype=mimetype, as_attachment=True, download_name=quiz_id + extensao)
+
+# Rota para importar um quiz a partir de um arquivo gerado pela exportação
+@api.route('/quizzes/archive', methods=['POST'])
+def import_quiz():
+    """Recria o quiz do arquivo enviado no corpo (Parquet ou CSV com gzip)."""
+    arquivo = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE)
+    try:
+        while True:
+            bloco = request.stream.read(1024 * 1024)
+            if not bloco:
+                break
+            arquivo.write(bloco)
+        arquivo.seek(0)
+        quiz_id, totais = import_quiz_archive(arquivo)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        arquivo.close()
+
+    return jsonify({"message": "Quiz imported successfully", "quiz_id": quiz_id, "rows": totais}), 201
+
+def write_quiz_archive(quiz_id, arquivo, formato):
+    """Grava o quiz no arquivo (binário, já aberto) e retorna a quantidade de linhas por tipo.
+
+    Lança ValueError se o quiz ainda tiver respostas aguardando a ingestão (modo "stream").
+    """
+    if r.xlen(ingest_stream_key(quiz_id)):
+        raise ValueError(f"Quiz {quiz_id} tem respostas aguardando a ingestão; tente novamente em instantes")
+
+    writer = archive.ArchiveWriter(arquivo, formato)
+    totais = Counter()
+    for linha in iter_quiz_archive(quiz_id):
+        totais[linha[0]] += 1
+        writer.write([linha])
+    writer.close()
+    return dict(totais)
+
+def iter_quiz_archive(quiz_id):
+    """Gera as linhas do arquivo: o quiz, as questões, as respostas e as pontuações.
+
+    As respostas vêm dos buckets compactos (lidos em pipelines) e as pontuações do
+    leaderboard, percorrido com ZSCAN, com os acertos buscados em lotes.
+    """
+    creation_time, course = r.hmget(quiz_key(quiz_id), "creation_time", "course")
+    yield archive.record("quiz", data=json.dumps({
+        "id": quiz_id, "creation_time": float(creation_time) if creation_time else None, "course": course}))
+
+    question_ids = get_question_ids(quiz_id)
+    pipe = r.pipeline(transaction=False)
+    for question_id in question_ids:
+        pipe.hgetall(question_key(quiz_id, question_id))
+    for question_id, campos in zip(question_ids, pipe.execute()):
+        campos.pop("storage", None)
+        yield archive.record("question", question_id=question_id, data=json.dumps(campos))
+
+    for question_id in question_ids:
+        ensure_packed_storage(quiz_id, question_id)
+        for registros in iter_packed_records(quiz_id, question_id):
+            for _, aluno, valor in registros:
+                response_ms, answer = valor.split(":", 1)
+                yield archive.record("response", question_id=question_id, student_id=aluno,
+                                     answer=answer, response_ms=int(response_ms))
+
+    pontuacoes = r.zscan_iter(leaderboard_key(quiz_id), count=ARCHIVE_PIPELINE_SIZE)
+    for lote in iter_batches(pontuacoes, ARCHIVE_PIPELINE_SIZE):
+        acertos = r.hmget(correct_answers_key(quiz_id), [aluno for aluno, _ in lote])
+        for (aluno, score), corretas in zip(lote, acertos):
+            yield archive.record("score", student_id=aluno, score=score, correct=int(corretas or 0))
+
+def import_quiz_archive(arquivo):
+    """Carrega um arquivo gerado por write_quiz_archive e retorna (id do quiz, linhas por tipo).
+
+    Questões, respostas e pontuações são gravadas em pipelines, e os agregados de analytics
+    recalculados a partir das respostas. O hash do quiz é gravado por último: até lá o quiz
+    não aparece como existente. Lança ValueError se o arquivo for inválido ou o quiz já existir.
+    """
+    quiz_id = None
+    creation_time = None
+    course = None
+    question_ids = []
+    opened_time = None
+    totais = Counter()
+    for lote in archive.read_archive(arquivo):
+        respostas, pontuacoes = [], []
+        pipe = r.pipeline(transaction=False)
+        for linha in lote:
+            kind = linha["kind"]
+            if kind == "quiz" and quiz_id is None:
+                dados = json.loads(linha["data"])
+                quiz_id, creation_time = dados["id"], dados["creation_time"] or get_current_time()
+                course = dados.get("course")
+                if quiz_exists(quiz_id):
+                    raise ValueError(f"Quiz ID {quiz_id} already exists")
+                # Restos de uma importação interrompida não podem duplicar a lista de questões
+                pipe.delete(questions_key(quiz_id))
+            elif quiz_id is None:
+                raise ValueError("O arquivo deve começar pela linha do quiz")
+            elif kind == "question":
+                dados = json.loads(linha["data"])
+                pipe.hset(question_key(quiz_id, linha["question_id"]), mapping={**dados, "storage": PACKED_STORAGE})
+                if dados.get("start_time"):
+                    opened_time = max(opened_time or 0, float(dados["start_time"]))
+                pipe.rpush(questions_key(quiz_id), linha["question_id"])
+                question_ids.append(linha["question_id"])
+            elif kind == "response":
+                respostas.append(linha)
+            elif kind == "score":
+                pontuacoes.append(linha)
+            else:
+                raise ValueError(f"Tipo de linha desconhecido: {kind}")
+            totais[kind] += 1
+        pipe.execute()
+        import_archived_responses(quiz_id, respostas)
+        import_archived_scores(quiz_id, pontuacoes)
+
+    if quiz_id is None:
+        raise ValueError("Arquivo vazio")
+    for question_id in question_ids:
+        packed_questions.set((quiz_id, question_id), True)
+        rebuild_question_stats(quiz_id, question_id)
+    # O quiz volta com o momento da criação original, mas as versões recomeçam do zero: a
+    # encarnação nova impede que um ETag de antes da remoção volte a valer
+    pipe = r.pipeline()
+    pipe.hset(quiz_key(quiz_id), mapping={"creation_time": creation_time, "incarnation": uuid.uuid4().hex,
+                                          **({"course": course} if course else {})})
+    pipe.incr(quiz_version_key(quiz_id))
+    pipe.execute()
+    r.zadd(QUIZZES_KEY, {quiz_id: creation_time})
+    if opened_time is not None:
+        r.zadd(QUIZZES_OPENED_KEY, {quiz_id: opened_time})
+    publish_cache_invalidation(quiz_id)
+    return quiz_id, dict(totais)
+
+def import_archived_responses(quiz_id, linhas):
+    """Grava as respostas do arquivo no formato compacto, criando os ids dos alunos que faltam."""
+    for lote in iter_batches(linhas, ARCHIVE_PIPELINE_SIZE):
+        ids = get_student_ids(list(dict.fromkeys(linha["student_id"] for linha in lote)), create=True)
+        pipe = r.pipeline(transaction=False)
+        for linha in lote:
+            student_num_id = ids[linha["student_id"]]
+            bucket, field = packed_location(student_num_id)
+            pipe.setbit(answered_bits_key(quiz_id, linha["question_id"]), student_num_id, 1)
+            pipe.hset(packed_bucket_key(quiz_id, linha["question_id"], bucket), field,
+                      f"{linha['response_ms']}:{linha['answer']}")
+        pipe.execute()
+
+def import_archived_scores(quiz_id, linhas):
+    """Grava o leaderboard e os acertos de cada aluno, como estavam na exportação."""
+    for lote in iter_batches(linhas, ARCHIVE_PIPELINE_SIZE):
+        pipe = r.pipeline(transaction=False)
+        pipe.zadd(leaderboard_key(quiz_id), {linha["student_id"]: linha["score"] for linha in lote})
+        acertos = {linha["student_id"]: linha["correct"] for linha in lote if linha["correct"]}
+        if acertos:
+            pipe.hset(correct_answers_key(quiz_id), mapping=acertos)
+        pipe.execute()
+
+def evict_quiz(quiz_id):
+    """Remove do Redis todas as chaves de um quiz (já arquivado) e retorna quantas foram apagadas."""
+    question_ids = get_question_ids(quiz_id)
+    total_buckets = (int(r.get(STUDENT_NEXT_ID_KEY) or 0) + PACKED_BUCKET_SIZE - 1) // PACKED_BUCKET_SIZE
+    # O hash do quiz sai primeiro: a partir daí as rotas já respondem que o quiz não existe
+    keys = [quiz_key(quiz_id), questions_key(quiz_id), leaderboard_key(quiz_id), correct_answers_key(quiz_id),
+            quiz_version_key(quiz_id), report_key(quiz_id), ingest_stream_key(quiz_id)]
+    for question_id in question_ids:
+        keys += [question_key(quiz_id, question_id), stats_key(quiz_id, question_id),
+                 correct_students_key(quiz_id, question_id), answered_bits_key(quiz_id, question_id),
+                 question_version_key(quiz_id, question_id), *legacy_answer_keys(quiz_id, question_id)]
+        keys += [packed_bucket_key(quiz_id, question_id, bucket) for bucket in range(total_buckets)]
+
+    r.zrem(QUIZZES_KEY, quiz_id)
+    r.zrem(QUIZZES_OPENED_KEY, quiz_id)
+    apagadas = sum(r.delete(*lote) for lote in iter_batches(keys, ARCHIVE_PIPELINE_SIZE))
+    # Sem a versão aplicada, o quiz volta a ser somado se for recriado ou reimportado; o
+    # snapshot (por momento da criação) evita somar de novo as pontuações de um reimportado
+    r.hdel(LEADERBOARD_APPLIED_KEY, quiz_id)
+    r.srem(INGEST_STREAMS_KEY, ingest_stream_key(quiz_id))
+    packed_questions.invalidate(lambda key: key[0] == quiz_id)
+    publish_cache_invalidation(quiz_id)
+    return apagadas
+
+# Rota SSE com o ranking e as contagens de respostas de um quiz, ao vivo
+@api.route('/quizzes/<quiz_id>/stream', methods=['GET'])
+def stream_quiz(quiz_id):
+    """Envia (Server-Sent Events) o top do ranking e as respostas por questão a cada atualização.
+
+    As atualizações de um quiz são agrupadas: no máximo LIVE_UPDATES_PER_SECOND por segundo,
+    calculadas uma única vez por worker, não importa quantas telas estejam conectadas.
+    """
+    if not quiz_exists(quiz_id):
+        return jsonify({"error": f"Quiz {quiz_id} não encontrado"}), 404
 
-def calculate_average_response_time(desempenho_alunos):
-    """Calcula o tempo médio de resposta de todos os alunos."""
-    for aluno in desempenho_alunos:
-        total_respostas = desempenho_alunos[aluno]["total_respostas"]
-        if total_respostas > 0:
-            desempenho_alunos[aluno]["tempo_medio_resposta"] = desempenho_alunos[aluno]["tempo_total_resposta"] / total_respostas
-        else:
-            desempenho_alunos[aluno]["tempo_medio_resposta"] = 0
+    fila = live_updates.subscribe(quiz_id)
+
+    def eventos():
+        try:
+            yield format_sse(quiz_snapshot(quiz_id))
+            while True:
+                try:
+                    yield format_sse(fila.get(timeout=LIVE_HEARTBEAT_SECONDS))
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            live_updates.unsubscribe(quiz_id, fila)
+
+    return Response(eventos(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def format_sse(snapshot):
+    return "event: update\ndata: " + json.dumps(snapshot) + "\n\n"
+
+def quiz_snapshot(quiz_id):
+    """Estado ao vivo do quiz: top do ranking e total de respostas por questão."""
+    question_ids = get_question_ids(quiz_id)
+    pipe = r.pipeline(transaction=False)
+    for question_id in question_ids:
+        pipe.hget(stats_key(quiz_id, question_id), "total")
+    respostas = {question_id: int(total or 0) for question_id, total in zip(question_ids, pipe.execute())}
+
+    return {
+        "quiz_id": quiz_id,
+        "ranking": format_ranking(get_ranking_page(quiz_id, 0, LIVE_RANKING_SIZE), 0, len(question_ids)),
+        "respostas": respostas,
+        "total_respostas": sum(respostas.values()),
+    }
 
-def sort_ranking(desempenho_alunos):
-    """Ordena os alunos pelo número de acertos (decrescente) e pelo tempo de resposta (crescente)."""
-    return sorted(desempenho_alunos.items(), key=lambda x: (-x[1]["total_acertos"], x[1]["tempo_medio_resposta"]))
+class LiveUpdates:
+    """Distribui as atualizações ao vivo dos quizzes para as conexões SSE deste worker.
+
+    Uma thread escuta os eventos publicados por answer_quiz e marca os quizzes alterados;
+    outra, a cada tick, calcula um único snapshot por quiz alterado e o entrega a todos os
+    inscritos. As threads só são iniciadas quando a primeira conexão chega.
+    """
+
+    def __init__(self, updates_per_second):
+        self.interval = 1 / updates_per_second
+        self._subscribers = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def subscribe(self, quiz_id):
+        fila = queue.Queue(maxsize=1)
+        with self._lock:
+            self._subscribers.setdefault(quiz_id, set()).add(fila)
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._listen, daemon=True).start()
+                threading.Thread(target=self._tick, daemon=True).start()
+        return fila
+
+    def unsubscribe(self, quiz_id, fila):
+        with self._lock:
+            inscritos = self._subscribers.get(quiz_id, set())
+            inscritos.discard(fila)
+            if not inscritos:
+                self._subscribers.pop(quiz_id, None)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = r.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(events_channel("*"))
+                for message in pubsub.listen():
+                    quiz_id = quiz_id_from_key(message["channel"], ":events")
+                    with self._lock:
+                        if quiz_id in self._subscribers:
+                            self._dirty.add(quiz_id)
+            except redis.exceptions.RedisError:
+                logging.exception("Falha ao escutar os eventos dos quizzes; reconectando")
+                time.sleep(1)
+
+    def _tick(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                alterados, self._dirty = self._dirty, set()
+            for quiz_id in alterados:
+                try:
+                    snapshot = quiz_snapshot(quiz_id)
+                except redis.exceptions.RedisError:
+                    logging.exception(f"Falha ao calcular a atualização ao vivo do quiz {quiz_id}")
+                    continue
+                with self._lock:
+                    inscritos = list(self._subscribers.get(quiz_id, ()))
+                for fila in inscritos:
+                    # Cada conexão só precisa do snapshot mais recente
+                    try:
+                        fila.get_nowait()
+                    except queue.Empty:
+                        pass
+                    try:
+                        fila.put_nowait(snapshot)
+                    except queue.Full:
+                        pass
+
+live_updates = LiveUpdates(LIVE_UPDATES_PER_SECOND)
+
+def rebuild_leaderboard(quiz_id):
+    """Recalcula o leaderboard de um quiz a partir das respostas gravadas."""
+    pontuacoes = {}
+    for question_id in get_question_ids(quiz_id):
+        ensure_packed_storage(quiz_id, question_id)
+        resposta_correta = r.hget(question_key(quiz_id, question_id), "correct_answer")
+        for registros in iter_packed_records(quiz_id, question_id):
+            for _, aluno, valor in registros:
+                resposta, tempo_resposta = unpack_answer(valor)
+                pontuacoes[aluno] = pontuacoes.get(aluno, 0) + payloads.ranking_score(resposta == resposta_correta, tempo_resposta)
+
+    pipe = r.pipeline()
+    pipe.delete(leaderboard_key(quiz_id))
+    if pontuacoes:
+        pipe.zadd(leaderboard_key(quiz_id), pontuacoes)
+    pipe.incr(quiz_version_key(quiz_id))
+    pipe.execute()
+    return len(pontuacoes)
+
+def rebuild_question_stats(quiz_id, question_id):
+    """Recalcula os agregados de analytics de uma questão a partir das respostas gravadas."""
+    ensure_packed_storage(quiz_id, question_id)
+    resposta_correta = r.hget(question_key(quiz_id, question_id), "correct_answer")
+
+    estatisticas = {"total": 0, "correct": 0, "time_total": 0.0}
+    alunos_que_acertaram = {}
+    for registros in iter_packed_records(quiz_id, question_id):
+        for _, aluno, valor in registros:
+            resposta, tempo_resposta = unpack_answer(valor)
+            estatisticas["total"] += 1
+            estatisticas["time_total"] += tempo_resposta
+            estatisticas["opt:" + resposta] = estatisticas.get("opt:" + resposta, 0) + 1
+            if resposta == resposta_correta:
+                estatisticas["correct"] += 1
+                alunos_que_acertaram[aluno] = tempo_resposta
+            if "fastest_time" not in estatisticas or tempo_resposta < estatisticas["fastest_time"]:
+                estatisticas["fastest_id"] = aluno
+                estatisticas["fastest_time"] = tempo_resposta
+
+    pipe = r.pipeline()
+    pipe.delete(stats_key(quiz_id, question_id), correct_students_key(quiz_id, question_id))
+    if estatisticas["total"]:
+        pipe.hset(stats_key(quiz_id, question_id), mapping=estatisticas)
+    if alunos_que_acertaram:
+        pipe.zadd(correct_students_key(quiz_id, question_id), alunos_que_acertaram)
+    pipe.incr(question_version_key(quiz_id, question_id))
+    pipe.execute()
+    return estatisticas["total"]
+
+# Comando para recalcular os agregados de analytics a partir das respostas já gravadas.
+# Uso: flask --app ProjetoInmemory rebuild-analytics [QUIZ_ID]
+@api.cli.command("rebuild-analytics")
+@click.argument("quiz_id", required=False)
+def rebuild_analytics_command(quiz_id):
+    """Reconstrói os agregados de todas as questões de um quiz (ou de todos os quizzes)."""
+    quiz_ids = [quiz_id] if quiz_id else r.zrange(QUIZZES_KEY, 0, -1)
+    for quiz in quiz_ids:
+        for question_id in get_question_ids(quiz):
+            total = rebuild_question_stats(quiz, question_id)
+            print(f"Quiz {quiz}, questão {question_id}: {total} respostas.")
+
+# Comando para executar uma rodada de retenção imediatamente.
+# Uso: flask --app ProjetoInmemory purge-answers
+@api.cli.command("purge-answers")
+def purge_answers_command():
+    """Expurga as respostas mais antigas que RETENTION_DAYS."""
+    total = purge_answers()
+    if total is None:
+        print("Outro worker já está executando a retenção.")
+    else:
+        print(f"{total} respostas expurgadas.")
+
+# Comando para recalcular os leaderboards a partir das respostas já gravadas.
+# Uso: flask --app ProjetoInmemory rebuild-leaderboard [QUIZ_ID]
+@api.cli.command("rebuild-leaderboard")
+@click.argument("quiz_id", required=False)
+def rebuild_leaderboard_command(quiz_id):
+    """Reconstrói o leaderboard de um quiz (ou de todos os quizzes)."""
+    quiz_ids = [quiz_id] if quiz_id else r.zrange(QUIZZES_KEY, 0, -1)
+    for quiz in quiz_ids:
+        total = rebuild_leaderboard(quiz)
+        print(f"Quiz {quiz}: {total} alunos no leaderboard.")
+
+# Comando para atualizar os leaderboards globais imediatamente (ou por um cron, com
+# LEADERBOARD_REFRESHER=0). Com --full, percorre todos os quizzes, não só os do período atual.
+# Uso: flask --app ProjetoInmemory refresh-leaderboards [--full]
+@api.cli.command("refresh-leaderboards")
+@click.option("--full", is_flag=True, help="Percorre todos os quizzes (ex.: ao ativar os leaderboards).")
+def refresh_leaderboards_command(full):
+    """Soma às janelas globais e por curso as pontuações novas dos quizzes."""
+    total = refresh_leaderboards(full)
+    if total is None:
+        print("Outro worker já está atualizando os leaderboards.")
+    else:
+        print(f"{total} quizzes aplicados aos leaderboards.")
+
+# Comando para converter as respostas gravadas no formato antigo para o compacto, com a
+# aplicação no ar (cada questão é trocada de forma atômica; as demais seguem atendendo).
+# Uso: flask --app ProjetoInmemory migrate-storage [QUIZ_ID]
+@api.cli.command("migrate-storage")
+@click.argument("quiz_id", required=False)
+def migrate_storage_command(quiz_id):
+    """Migra as questões de um quiz (ou de todos os quizzes) para o formato compacto."""
+    quiz_ids = [quiz_id] if quiz_id else (quiz for quiz, _ in r.zscan_iter(QUIZZES_KEY, count=RETENTION_BATCH_SIZE))
+    total = 0
+    for quiz in quiz_ids:
+        for question_id in get_question_ids(quiz):
+            migradas = migrate_question_storage(quiz, question_id)
+            if migradas:
+                print(f"Quiz {quiz}, questão {question_id}: {migradas} respostas migradas.")
+            total += migradas
+    print(f"{total} respostas migradas.")
+
+def keys_memory_usage(keys):
+    """Soma o MEMORY USAGE (com todas as amostras) de uma lista de chaves."""
+    total = 0
+    for lote in iter_batches(keys, 1000):
+        pipe = r.pipeline(transaction=False)
+        for key in lote:
+            pipe.memory_usage(key, samples=0)
+        total += sum(uso or 0 for uso in pipe.execute())
+    return total
+
+def question_memory_usage(quiz_id, question_id):
+    """Retorna {formato: (bytes, respostas)} das respostas de uma questão, como estão gravadas."""
+    legacy_keys = legacy_answer_keys(quiz_id, question_id)
+    total_buckets = (int(r.get(STUDENT_NEXT_ID_KEY) or 0) + PACKED_BUCKET_SIZE - 1) // PACKED_BUCKET_SIZE
+    packed_keys = [answered_bits_key(quiz_id, question_id)]
+    packed_keys += [packed_bucket_key(quiz_id, question_id, bucket) for bucket in range(total_buckets)]
+    return {
+        "antigo": (keys_memory_usage(legacy_keys), r.hlen(legacy_keys[0])),
+        "compacto": (keys_memory_usage(packed_keys), r.bitcount(packed_keys[0])),
+    }
 
+def sample_memory_usage(total_respostas):
+    """Grava uma questão sintética nos dois formatos, mede a memória de cada um e apaga tudo.
 
-def format_ranking(ranking):
-    """Formata o ranking para exibição na resposta."""
-    ranking_formatado = []
-    for i, (aluno_id, dados) in enumerate(ranking, start=1):
-        nome_aluno = r.hget(USER_PREFIX + aluno_id, "username")
-        ranking_formatado.append({
-            "posicao": i,
-            "student_id": aluno_id,
-            "nome": nome_aluno,
-            "acertos": dados["total_acertos"],
-            "tempo_medio_resposta": round(dados["tempo_medio_resposta"], 2)
-        })
-    return ranking_formatado
+    Os alunos têm códigos de matrícula de 9 dígitos e ids densos de 0 a total_respostas - 1.
+    """
+    prefixo = "memory-report:" + uuid.uuid4().hex + ":"
+    legacy_keys = [prefixo + "responses", prefixo + "response_time", prefixo + "answered", prefixo + "answered_at"]
+    bits_key = prefixo + "answered_bits"
+    bucket_keys = set()
+    now = get_current_time()
+    try:
+        for inicio in range(0, total_respostas, 1000):
+            pipe = r.pipeline(transaction=False)
+            for student_num_id in range(inicio, min(inicio + 1000, total_respostas)):
+                aluno = str(200000000 + student_num_id)
+                resposta = "abcd"[student_num_id % 4]
+                tempo_resposta = (student_num_id * 7919 % 20000) / 1000 + 0.000123456789
+                bucket, field = packed_location(student_num_id)
+                pipe.hset(legacy_keys[0], aluno, resposta)
+                pipe.hset(legacy_keys[1], aluno, repr(tempo_resposta))
+                pipe.sadd(legacy_keys[2], aluno)
+                pipe.zadd(legacy_keys[3], {aluno: now + tempo_resposta})
+                pipe.setbit(bits_key, student_num_id, 1)
+                pipe.hset(prefixo + "packed:" + str(bucket), field, pack_answer(resposta, tempo_resposta))
+                bucket_keys.add(prefixo + "packed:" + str(bucket))
+            pipe.execute()
+        return {
+            "antigo": keys_memory_usage(legacy_keys),
+            "compacto": keys_memory_usage([bits_key, *bucket_keys]),
+        }
+    finally:
+        for lote in iter_batches([*legacy_keys, bits_key, *bucket_keys], 1000):
+            r.delete(*lote)
+
+# Comando para comparar a memória ocupada pelas respostas no formato antigo e no compacto.
+# Uso: flask --app ProjetoInmemory memory-report [QUIZ_ID] [--sample 50000]
+@api.cli.command("memory-report")
+@click.argument("quiz_id", required=False)
+@click.option("--sample", type=int, default=0,
+              help="Mede também uma questão sintética com esse número de respostas nos dois formatos.")
+def memory_report_command(quiz_id, sample):
+    """Mostra a memória das respostas de cada questão, por formato, e o custo por resposta."""
+    quiz_ids = [quiz_id] if quiz_id else (quiz for quiz, _ in r.zscan_iter(QUIZZES_KEY, count=RETENTION_BATCH_SIZE))
+    totais = {"antigo": [0, 0], "compacto": [0, 0]}
+    for quiz in quiz_ids:
+        for question_id in get_question_ids(quiz):
+            uso = question_memory_usage(quiz, question_id)
+            for formato, (memoria, respostas) in uso.items():
+                totais[formato][0] += memoria
+                totais[formato][1] += respostas
+            print(f"Quiz {quiz}, questão {question_id}: "
+                  + ", ".join(f"{formato} {memoria} bytes / {respostas} respostas"
+                              for formato, (memoria, respostas) in uso.items()))
+
+    for formato, (memoria, respostas) in totais.items():
+        por_resposta = f" ({memoria / respostas:.1f} bytes por resposta)" if respostas else ""
+        print(f"Total no formato {formato}: {memoria} bytes, {respostas} respostas{por_resposta}")
+    mapeamento = keys_memory_usage([STUDENT_IDS_KEY, STUDENT_CODES_KEY])
+    print(f"Mapeamento código <-> id dos alunos (pago uma vez por aluno): {mapeamento} bytes")
+
+    if sample > 0:
+        uso = sample_memory_usage(sample)
+        print(f"Questão sintética com {sample} respostas:")
+        for formato, memoria in uso.items():
+            print(f"  {formato}: {memoria} bytes ({memoria / sample:.1f} bytes por resposta)")
+        if uso["compacto"]:
+            print(f"  redução: {uso['antigo'] / uso['compacto']:.1f}x")
+
+# Comando para rodar os workers de ingestão (modo "stream") num processo à parte; nesse caso
+# use ANSWER_INGEST_WORKERS=0 nos processos web para que eles só enfileirem.
+# Uso: ANSWER_INGEST_MODE=stream ANSWER_INGEST_WORKERS=0 flask --app ProjetoInmemory ingest-workers --workers 4
+@api.cli.command("ingest-workers")
+@click.option("--workers", type=int, default=lambda: settings_from_env()["ANSWER_INGEST_WORKERS"], help="Quantidade de threads consumidoras.")
+def ingest_workers_command(workers):
+    """Aplica as respostas enfileiradas nos streams de ingestão até ser interrompido."""
+    start_ingest_workers(workers)
+    while True:
+        time.sleep(INGEST_REFRESH_SECONDS)
+        pendentes, idade = update_ingest_metrics()
+        logging.info(f"Ingestão: {pendentes} respostas pendentes, a mais antiga há {idade:.1f}s")
+
+# Comando para arquivar quizzes em arquivos colunares e, com --evict, tirá-los do Redis.
+# Uso: flask --app ProjetoInmemory export-quizzes [QUIZ_ID] --output-dir DIR [--format csv]
+#      [--older-than-days 90] [--evict]
+@api.cli.command("export-quizzes")
+@click.argument("quiz_id", required=False)
+@click.option("--output-dir", default=".", type=click.Path(file_okay=False), help="Diretório dos arquivos.")
+@click.option("--format", "formato", type=click.Choice(list(archive.FORMATS)), default=archive.default_format())
+@click.option("--older-than-days", type=float, help="Só os quizzes criados há mais que isso.")
+@click.option("--evict", is_flag=True, help="Apaga do Redis cada quiz depois de gravar o seu arquivo.")
+def export_quizzes_command(quiz_id, output_dir, formato, older_than_days, evict):
+    """Exporta um quiz (ou todos, ou os mais antigos) para Parquet ou CSV com gzip."""
+    if quiz_id:
+        quiz_ids = [quiz_id]
+    elif older_than_days is not None:
+        quiz_ids = r.zrangebyscore(QUIZZES_KEY, "-inf", get_current_time() - older_than_days * 24 * 60 * 60)
+    else:
+        quiz_ids = r.zrange(QUIZZES_KEY, 0, -1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for quiz in quiz_ids:
+        caminho = os.path.join(output_dir, quiz + archive.FORMATS[formato][1])
+        # Grava num arquivo temporário e renomeia: um arquivo com o nome final está sempre completo
+        try:
+            with open(caminho + ".tmp", "wb") as arquivo:
+                totais = write_quiz_archive(quiz, arquivo, formato)
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+        except ValueError as e:
+            os.remove(caminho + ".tmp")
+            print(f"Quiz {quiz} não exportado: {e}")
+            continue
+        os.replace(caminho + ".tmp", caminho)
+        print(f"Quiz {quiz}: {totais.get('response', 0)} respostas e {totais.get('score', 0)} pontuações em {caminho}")
+        if evict:
+            print(f"Quiz {quiz}: {evict_quiz(quiz)} chaves removidas do Redis.")
+
+# Comando para recarregar quizzes arquivados por export-quizzes.
+# Uso: flask --app ProjetoInmemory import-quizzes ARQUIVO...
+@api.cli.command("import-quizzes")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+def import_quizzes_command(paths):
+    """Importa os quizzes dos arquivos (Parquet ou CSV com gzip)."""
+    for caminho in paths:
+        with open(caminho, "rb") as arquivo:
+            try:
+                quiz_id, totais = import_quiz_archive(arquivo)
+            except ValueError as e:
+                print(f"{caminho} não importado: {e}")
+                continue
+        print(f"Quiz {quiz_id}: {totais.get('response', 0)} respostas e {totais.get('score', 0)} pontuações importadas.")
+
+# Formatos aceitos no upload de usuários (Content-Type -> leitor)
+USER_IMPORT_FORMATS = {
+    "application/x-ndjson": read_ndjson_users,
+    "text/csv": read_csv_users,
+}
+
+# Comando para criar o índice do RediSearch, uma vez por deployment (não mais a cada import).
+# Uso: flask --app ProjetoInmemory create-search-index
+@api.cli.command("create-search-index")
+def create_search_index_command():
+    """Cria o índice 'idx_votes' do RediSearch, se ainda não existir."""
+    create_search_index()
+
+# Comando para criar os registros de usuários, quizzes e questões a partir dos dados existentes.
+# Uso: flask --app ProjetoInmemory migrate-indexes
+@api.cli.command("migrate-indexes")
+def migrate_indexes():
+    """Constrói os registros (users, quizzes e questões de cada quiz) com SCAN, sem bloquear o Redis."""
+    now = get_current_time()
+    total_users = 0
+    quizzes = {}
+    questions = {}
+
+    pipe = r.pipeline(transaction=False)
+    for user_key in r.scan_iter(match=USER_PREFIX + "*", count=1000):
+        pipe.zadd(USERS_KEY, {user_key[len(USER_PREFIX):]: now}, nx=True)
+        total_users += 1
+        if total_users % 1000 == 0:
+            pipe.execute()
+    pipe.incr(USERS_VERSION_KEY)
+    pipe.execute()
+
+    for key in r.scan_iter(match=QUIZ_PREFIX + "*", count=1000):
+        parts = key.split(":")
+        if len(parts) == 2:
+            quizzes[strip_key_tag(parts[1])] = key
+        elif len(parts) == 3 and r.type(key) == "hash" and r.hexists(key, "text"):
+            questions.setdefault(strip_key_tag(parts[1]), []).append(parts[2])
+
+    for quiz_id, quiz_key in quizzes.items():
+        creation_time = float(r.hget(quiz_key, "creation_time") or now)
+        r.zadd(QUIZZES_KEY, {quiz_id: creation_time}, nx=True)
+
+        # A ordem original das questões não é conhecida; usamos a ordem dos ids
+        question_ids = sorted(questions.get(quiz_id, []))
+        if question_ids and not r.exists(questions_key(quiz_id)):
+            r.rpush(questions_key(quiz_id), *question_ids)
+
+    print(f"{total_users} usuários e {len(quizzes)} quizzes registrados.")
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
+    create_app({"LOG_LEVEL": "DEBUG"}).run(debug=True, port=5001)
@@ -0,0 +1,166 @@
+"""Arquivo colunar de um quiz: definições, respostas e pontuações numa única tabela.
+
+Cada linha tem um `kind`:
+
+- quiz: `data` com o JSON do quiz (id, momento da criação e curso);
+- question: `question_id` e `data` com o JSON da questão (texto, alternativas, resposta, início);
+- response: `question_id`, `student_id`, `answer` e `response_ms`;
+- score: `student_id`, `score` (pontuação no leaderboard) e `correct` (acertos).
+
+As colunas que não se aplicam ao tipo ficam vazias. Em Parquet (com pyarrow) as colunas
+repetitivas, como kind e question_id, viram dicionários e os vazios quase não ocupam espaço;
+sem o pyarrow o arquivo é um CSV compactado com gzip. A leitura reconhece o formato pelo
+início do arquivo.
+
+O pyarrow é opcional: sem ele só o formato "csv" está disponível. Ele é importado no
+primeiro uso do Parquet (load_pyarrow), já que o import é a maior parte do custo de
+subir a aplicação e só os arquivos o usam.
+"""
+import csv
+import gzip
+import importlib.util
+import io
+
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+pa = pq = None
+
+COLUMNS = ("kind", "question_id", "student_id", "answer", "response_ms", "score", "correct", "data")
+INT_COLUMNS = ("response_ms", "correct")
+FLOAT_COLUMNS = ("score",)
+# Tipos de arquivo: mimetype e extensão
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "csv": ("application/gzip", ".csv.gz"),
+}
+# Linhas acumuladas antes de gravar um row group (Parquet)
+BATCH_ROWS = 50000
+
+PARQUET_MAGIC = b"PAR1"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def load_pyarrow():
+    global pa, pq
+    if pa is None:
+        import pyarrow
+        import pyarrow.parquet
+        pa, pq = pyarrow, pyarrow.parquet
+    return pa, pq
+
+
+def available_formats():
+    return [formato for formato in FORMATS if formato != "parquet" or PYARROW_AVAILABLE]
+
+
+def default_format():
+    return "parquet" if PYARROW_AVAILABLE else "csv"
+
+
+def record(kind, **campos):
+    """Monta uma linha do arquivo; os campos não informados ficam vazios."""
+    return (kind, *(campos.get(coluna) for coluna in COLUMNS[1:]))
+
+
+class ArchiveWriter:
+    """Grava as linhas (tuplas de record) num arquivo binário já aberto, no formato escolhido."""
+
+    def __init__(self, arquivo, formato):
+        if formato not in available_formats():
+            raise ValueError(f"Formato {formato} indisponível (use um de {', '.join(available_formats())})")
+        self.formato = formato
+        self.total = 0
+        self._linhas = []
+        if formato == "parquet":
+            load_pyarrow()
+            self._writer = pq.ParquetWriter(arquivo, parquet_schema(), compression="zstd")
+        else:
+            self._gzip = gzip.GzipFile(fileobj=arquivo, mode="wb")
+            self._texto = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="")
+            self._writer = csv.writer(self._texto, lineterminator="\n")
+            self._writer.writerow(COLUMNS)
+
+    def write(self, linhas):
+        for linha in linhas:
+            self._linhas.append(linha)
+            self.total += 1
+            if len(self._linhas) >= BATCH_ROWS:
+                self._flush()
+
+    def _flush(self):
+        if not self._linhas:
+            return
+        if self.formato == "parquet":
+            colunas = list(zip(*self._linhas))
+            self._writer.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(colunas, parquet_schema())],
+                schema=parquet_schema()))
+        else:
+            self._writer.writerows(("" if valor is None else valor for valor in linha) for linha in self._linhas)
+        self._linhas = []
+
+    def close(self):
+        self._flush()
+        if self.formato == "parquet":
+            self._writer.close()
+        else:
+            self._texto.flush()
+            self._texto.detach()
+            self._gzip.close()
+
+
+def parquet_schema():
+    return pa.schema([
+        ("kind", pa.dictionary(pa.int8(), pa.string())),
+        ("question_id", pa.dictionary(pa.int32(), pa.string())),
+        ("student_id", pa.string()),
+        ("answer", pa.dictionary(pa.int32(), pa.string())),
+        ("response_ms", pa.int32()),
+        ("score", pa.float64()),
+        ("correct", pa.int32()),
+        ("data", pa.string()),
+    ])
+
+
+def detect_format(arquivo):
+    """Reconhece o formato pelos primeiros bytes de um arquivo binário posicionável."""
+    inicio = arquivo.read(4)
+    arquivo.seek(0)
+    if inicio == PARQUET_MAGIC:
+        if not PYARROW_AVAILABLE:
+            raise ValueError("Arquivo Parquet, mas o pyarrow não está instalado")
+        load_pyarrow()
+        return "parquet"
+    if inicio[:2] == GZIP_MAGIC:
+        return "csv"
+    raise ValueError("Formato de arquivo desconhecido (esperado Parquet ou CSV com gzip)")
+
+
+def read_archive(arquivo):
+    """Percorre as linhas do arquivo como dicionários (coluna -> valor ou None), em blocos."""
+    if detect_format(arquivo) == "parquet":
+        for lote in pq.ParquetFile(arquivo).iter_batches(batch_size=BATCH_ROWS):
+            yield lote.to_pylist()
+        return
+
+    with gzip.GzipFile(fileobj=arquivo, mode="rb") as compactado:
+        leitor = csv.DictReader(io.TextIOWrapper(compactado, encoding="utf-8", newline=""))
+        if tuple(leitor.fieldnames or ()) != COLUMNS:
+            raise ValueError("Cabeçalho do CSV não corresponde ao formato do arquivo de quiz")
+        lote = []
+        for linha in leitor:
+            lote.append({coluna: parse_value(coluna, valor) for coluna, valor in linha.items()})
+            if len(lote) >= BATCH_ROWS:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+
+def parse_value(coluna, valor):
+    if valor == "":
+        return None
+    if coluna in INT_COLUMNS:
+        return int(valor)
+    if coluna in FLOAT_COLUMNS:
+        return float(valor)
+    return valor
@@ -0,0 +1,732 @@
+"""Entrada assíncrona (ASGI) com as mesmas rotas do ProjetoInmemory, usando redis.asyncio.
+
+Cada worker atende muitas requisições concorrentes enquanto espera o Redis, então as
+rajadas de respostas precisam de bem menos processos que a versão síncrona.
+
+Dependências extras: quart e um servidor ASGI (uvicorn ou hypercorn).
+
+    uvicorn asgi:app --workers 2 --port 8000
+
+O pool de conexões usa as mesmas variáveis de ambiente da versão síncrona
+(REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT,
+REDIS_SOCKET_TIMEOUT, REDIS_CONNECT_TIMEOUT), inclusive a topologia (REDIS_MODE,
+REDIS_NODES) e o layout das chaves (REDIS_KEY_LAYOUT). Como na versão síncrona, importar
+o módulo não conecta: o pool e as threads de fundo começam quando o servidor sobe.
+"""
+import asyncio
+import csv
+import json
+import logging
+import re
+import tempfile
+
+from quart import Quart, request, jsonify, Response
+
+import ProjetoInmemory as core
+import payloads
+import sharding
+from payloads import ANSWER_ERRORS, ANSWER_NEEDS_MIGRATION, ANSWER_UNKNOWN_STUDENT
+from ProjetoInmemory import (
+    LEADERBOARD_KEEP_DAYS, LEADERBOARD_MAX_PAGE_SIZE,
+    LEADERBOARD_PAGE_SIZE, LEADERBOARD_PERIOD_FORMATS, LEADERBOARD_VERSION_KEY, PACKED_STORAGE,
+    QUIZZES_KEY, QUIZZES_OPENED_KEY, RANKING_SCAN_BATCH,
+    RESPONSES_MAX_PAGE_SIZE, RESPONSES_PAGE_SIZE,
+    RESPONSE_STREAM_FORMATS, RESPONSES_CSV_HEADER, STUDENT_CODES_KEY, STUDENT_IDS_KEY,
+    STUDENT_NEXT_ID_KEY, USER_IMPORT_BATCH_SIZE, USER_PREFIX, USERS_KEY, USERS_VERSION_KEY,
+)
+
+app = Quart(__name__)
+
+# Configuração do Redis assíncrono (criado no primeiro uso)
+def create_async_redis_client(settings):
+    return sharding.create_async_client(settings["REDIS_MODE"], settings["REDIS_NODES"],
+                                        core.redis_pool_options(settings))
+
+ar = sharding.LazyClient(lambda: create_async_redis_client(core.settings_from_env()))
+
+answer_script = ar.register_script(core.ANSWER_LUA)
+open_question_script = ar.register_script(core.OPEN_QUESTION_LUA)
+assign_student_ids_script = ar.register_script(core.ASSIGN_STUDENT_IDS_LUA)
+ingest_script = ar.register_script(core.INGEST_LUA)
+
+@app.before_serving
+async def start_serving():
+    settings = core.settings_from_env()
+    logging.basicConfig(level=settings["LOG_LEVEL"])
+    # As funções síncronas reaproveitadas (arquivo, migração) e o cache de questões usam o
+    # cliente e as threads de fundo do ProjetoInmemory
+    core.start_background_jobs(settings)
+    # No Redis Cluster os scripts precisam estar em todos os primários antes de irem em pipelines
+    ar.register_scripts()
+    if isinstance(ar.client, sharding.AsyncClusterClient):
+        await ar.load_scripts()
+
+# Formatos aceitos no upload de usuários
+USER_IMPORT_MIMETYPES = ("application/x-ndjson", "text/csv")
+
+# Leituras condicionais (ETag/304 e corpos serializados em cache), como na versão síncrona
+async def conditional_json(cache_key, etag, build):
+    """Versão assíncrona de ProjetoInmemory.conditional_json."""
+    if request.if_none_match.contains_weak(etag):
+        core.RESPONSE_CACHE.inc(1, cache_key[0], "not_modified")
+        return etag_response(None, etag, 304)
+    body = core.cached_body(cache_key, etag)
+    if body is None:
+        payload, status = await build()
+        if status != 200:
+            return jsonify(payload), status
+        body = core.store_body(cache_key, etag, payload)
+    return etag_response(body, etag)
+
+def etag_response(body, etag, status=200):
+    response = Response(body, status=status, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# Métodos anunciados nos preflights de CORS (os mesmos do padrão do flask_cors)
+CORS_ALLOW_METHODS = "DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+
+@app.after_request
+async def add_cors_headers(response):
+    # Mesmo comportamento do flask_cors com as opções padrão: qualquer origem e, no preflight
+    # (OPTIONS com Access-Control-Request-Method), os métodos e os cabeçalhos pedidos
+    response.headers.setdefault("Access-Control-Allow-Origin", "*")
+    if request.method == "OPTIONS" and "Access-Control-Request-Method" in request.headers:
+        response.headers["Access-Control-Allow-Methods"] = CORS_ALLOW_METHODS
+        cabecalhos = request.headers.get("Access-Control-Request-Headers")
+        if cabecalhos:
+            response.headers["Access-Control-Allow-Headers"] = cabecalhos
+    return response
+
+# Rota para adicionar usuários
+@app.route('/users', methods=['POST'])
+async def add_users():
+    try:
+        batch_size = int(request.args.get('batch_size', USER_IMPORT_BATCH_SIZE))
+    except ValueError:
+        return jsonify({"error": "batch_size must be an integer"}), 400
+    if batch_size <= 0:
+        return jsonify({"error": "batch_size must be positive"}), 400
+
+    if request.mimetype in USER_IMPORT_MIMETYPES:
+        added, errors, batches = 0, [], []
+        batch_number = 0
+        async for batch in iter_uploaded_users(request.mimetype, batch_size):
+            batch_number += 1
+            added_users, batch_errors = await import_users_batch(batch)
+            added += len(added_users)
+            errors.extend(batch_errors)
+            batches.append({"batch": batch_number, "received": len(batch),
+                            "added": len(added_users), "errors": len(batch_errors)})
+
+        if not batches:
+            return jsonify({"error": "At least one user must be provided"}), 400
+
+        resumo = {"added": added, "batches": batches}
+        if errors:
+            return jsonify({"errors": errors, **resumo}), 400
+        return jsonify({"message": "Users added successfully", **resumo}), 201
+
+    data = await request.get_json()
+    users = data.get('users', [])
+
+    if not users:
+        return jsonify({"error": "At least one user must be provided"}), 400
+
+    added_users = []
+    errors = []
+
+    for batch in core.iter_batches(users, batch_size):
+        batch_added, batch_errors = await import_users_batch(batch)
+        added_users.extend(batch_added)
+        errors.extend(batch_errors)
+
+    if errors:
+        return jsonify({"errors": errors, "added_users": added_users}), 400
+
+    return jsonify({"message": "Users added successfully", "added_users": added_users}), 201
+
+async def import_users_batch(users):
+    """Versão assíncrona de ProjetoInmemory.import_users_batch."""
+    validos, errors = payloads.validate_users(users)
+    if not validos:
+        return [], errors
+
+    now = core.get_current_time()
+    pipe = ar.pipeline(transaction=False)
+    for user_code, username in validos:
+        pipe.hsetnx(USER_PREFIX + user_code, "username", username)
+    added_users, existentes = payloads.new_users(validos, await pipe.execute())
+    errors.extend(existentes)
+
+    if added_users:
+        codigos = [user["user_code"] for user in added_users]
+        pipe = ar.pipeline(transaction=False)
+        pipe.zadd(USERS_KEY, dict.fromkeys(codigos, now), nx=True)
+        pipe.incr(USERS_VERSION_KEY)
+        await assign_student_ids_script(keys=[STUDENT_IDS_KEY, STUDENT_CODES_KEY, STUDENT_NEXT_ID_KEY],
+                                        args=codigos, client=pipe)
+        payloads.store_student_ids({}, codigos, (await pipe.execute())[-1], core.student_id_cache)
+
+    return added_users, errors
+
+async def iter_body_lines():
+    """Lê o corpo da requisição linha a linha, sem carregá-lo inteiro na memória."""
+    pendente = b""
+    async for chunk in request.body:
+        pendente += chunk
+        *linhas, pendente = pendente.split(b"\n")
+        for linha in linhas:
+            yield linha.decode("utf-8").rstrip("\r")
+    if pendente:
+        yield pendente.decode("utf-8").rstrip("\r")
+
+async def iter_uploaded_users(mimetype, batch_size):
+    """Agrupa em lotes os usuários enviados em NDJSON ou CSV (com cabeçalho username,code)."""
+    cabecalho = None
+    batch = []
+    async for linha in iter_body_lines():
+        if not linha.strip():
+            continue
+        if mimetype == "text/csv":
+            if cabecalho is None:
+                cabecalho = next(csv.reader([linha]))
+                continue
+            batch.append(dict(zip(cabecalho, next(csv.reader([linha])))))
+        else:
+            try:
+                batch.append(json.loads(linha))
+            except ValueError:
+                batch.append({"invalid_line": linha})
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Rota para pegar todos os usuários
+@app.route('/users', methods=['GET'])
+async def get_users():
+    etag = core.version_etag(await ar.get(USERS_VERSION_KEY))
+    return await conditional_json(("users",), etag, build_users)
+
+async def build_users():
+    user_codes = await ar.zrange(USERS_KEY, 0, -1)
+    usernames = await get_usernames(user_codes)
+    all_users = [{"user_code": user_code, "username": usernames[user_code]} for user_code in user_codes]
+
+    return {"users": all_users}, 200
+
+# Rota para criar um quiz
+@app.route('/quizzes', methods=['POST'])
+async def create_quiz():
+    data = await request.get_json()
+    quiz_id = data.get('id')
+    questions = data.get('questions')
+    course = data.get('course')
+
+    if not quiz_id or not questions:
+        return jsonify({"error": "Quiz ID and questions are required"}), 400
+
+    if course is not None and (not isinstance(course, str) or not course):
+        return jsonify({"error": "course must be a non-empty string"}), 400
+
+    if await ar.exists(core.quiz_key(quiz_id)):
+        return jsonify({"error": "Quiz ID already exists"}), 400
+
+    creation_time = core.get_current_time()
+    pipe = ar.pipeline()
+    pipe.hset(core.quiz_key(quiz_id), mapping={"creation_time": creation_time, **({"course": course} if course else {})})
+    pipe.incr(core.quiz_version_key(quiz_id))
+
+    for question in questions:
+        question_id = question['id']
+        pipe.hset(core.question_key(quiz_id, question_id), mapping={
+            "text": question['text'],
+            "correct_answer": question['correct_answer'],
+            "options": json.dumps(question['options']),
+            "storage": PACKED_STORAGE,
+        })
+        pipe.rpush(core.questions_key(quiz_id), question_id)
+    await pipe.execute()
+    await ar.zadd(QUIZZES_KEY, {quiz_id: creation_time})
+
+    await ar.publish(core.CACHE_INVALIDATION_CHANNEL, json.dumps({"quiz_id": quiz_id, "question_id": None}))
+
+    return jsonify({"message": "Quiz created successfully"}), 201
+
+# Rota para pegar uma questão de um quiz
+@app.route('/quizzes/<quiz_id>/questions/<question_id>', methods=['GET'])
+async def get_question(quiz_id, question_id):
+    body = core.question_cache.get((quiz_id, question_id))
+    if body is None:
+        agora = core.get_current_time()
+        question_data = await open_question_script(keys=[core.question_key(quiz_id, question_id)], args=[agora])
+        if not question_data:
+            return jsonify({"error": "Question not found"}), 404
+        if core.question_opened_now(question_data, agora):
+            await ar.zadd(QUIZZES_OPENED_KEY, {quiz_id: agora}, gt=True)
+
+        body = payloads.encode_question(question_id, question_data)
+        core.question_cache.set((quiz_id, question_id), body)
+
+    etag = core.body_etag(body)
+    if request.if_none_match.contains_weak(etag):
+        core.RESPONSE_CACHE.inc(1, "question", "not_modified")
+        return etag_response(None, etag, 304)
+    return etag_response(body, etag)
+
+# Rota para responder a uma questão de um quiz
+@app.route('/quizzes/<quiz_id>/answer', methods=['POST'])
+async def answer_quiz(quiz_id):
+    data = await request.get_json()
+    question_id = data.get('question_id')
+    answer = data.get('answer')
+    student_id = data.get('student_id')
+
+    if not question_id or not answer or not student_id:
+        return jsonify({"error": "Question ID, answer, and student ID are required"}), 400
+
+    response_timestamp = core.get_current_time()
+    student_num_id = (await get_registered_student_ids([student_id])).get(student_id)
+    if student_num_id is None:
+        return jsonify({"error": ANSWER_ERRORS[ANSWER_UNKNOWN_STUDENT]}), 400
+    stream = core.ANSWER_INGEST_MODE == "stream"
+    keys, args = core.answer_script_call(quiz_id, question_id, student_id, student_num_id, answer,
+                                         response_timestamp, stream)
+    if stream:
+        async def executar():
+            pipe = ar.pipeline(transaction=False)
+            core.register_ingest_stream(quiz_id, pipe)
+            await ingest_script(keys=keys, args=args, client=pipe)
+            return (await pipe.execute())[-1]
+    else:
+        async def executar():
+            return await answer_script(keys=keys, args=args)
+
+    status = await executar()
+    if status == ANSWER_NEEDS_MIGRATION:
+        await ensure_packed_storage(quiz_id, question_id)
+        status = await executar()
+
+    if status in ANSWER_ERRORS:
+        return jsonify({"error": ANSWER_ERRORS[status]}), 400
+
+    if stream:
+        return jsonify({"message": "Answer accepted", "data": data}), 202
+    return jsonify({"message": "Answer recorded", "data": data}), 200
+
+# Rota para enviar respostas em lote (gateways que coletam as respostas offline)
+@app.route('/quizzes/<quiz_id>/answers/batch', methods=['POST'])
+async def answer_quiz_batch(quiz_id):
+    data = await request.get_json()
+    registros = data.get('answers') if isinstance(data, dict) else None
+
+    if not registros or not isinstance(registros, list):
+        return jsonify({"error": "At least one answer must be provided"}), 400
+    if len(registros) > core.ANSWER_BATCH_MAX_RECORDS:
+        return jsonify({"error": f"At most {core.ANSWER_BATCH_MAX_RECORDS} answers per batch"}), 413
+
+    if not await ar.exists(core.quiz_key(quiz_id)):
+        return jsonify({"error": f"Quiz {quiz_id} not found"}), 404
+
+    question_ids = sorted({registro.get('question_id') for registro in registros
+                           if isinstance(registro, dict) and isinstance(registro.get('question_id'), str)})
+    pipe = ar.pipeline(transaction=False)
+    for question_id in question_ids:
+        pipe.exists(core.question_key(quiz_id, question_id))
+    existentes = {question_id for question_id, existe in zip(question_ids, await pipe.execute()) if existe}
+
+    validos, resultados = payloads.validate_batch_answers(registros, existentes, core.get_current_time())
+    for lote in core.iter_batches(validos, core.ANSWER_BATCH_PIPELINE_SIZE):
+        for (indice, *_), status in zip(lote, await record_answers_batch(quiz_id, lote)):
+            resultados[indice] = payloads.batch_answer_result(indice, status, core.ANSWER_INGEST_MODE == "stream")
+
+    return jsonify(payloads.summarize_batch_results(quiz_id, resultados)), 200
+
+async def record_answers_batch(quiz_id, lote):
+    """Versão assíncrona de ProjetoInmemory.record_answers_batch."""
+    ids = await get_registered_student_ids([student_id for _, _, student_id, _, _ in lote])
+    stream = core.ANSWER_INGEST_MODE == "stream"
+
+    script = ingest_script if stream else answer_script
+
+    async def executar(posicoes):
+        pipe = ar.pipeline(transaction=False)
+        if stream:
+            core.register_ingest_stream(quiz_id, pipe)
+        for posicao in posicoes:
+            _, question_id, student_id, answer, timestamp = lote[posicao]
+            keys, args = core.answer_script_call(quiz_id, question_id, student_id, ids[student_id],
+                                                 answer, timestamp, stream)
+            await script(keys=keys, args=args, client=pipe)
+        resultados = await pipe.execute()
+        return resultados[1:] if stream else resultados
+
+    statuses, cadastrados = payloads.batch_statuses(lote, ids)
+    payloads.update_statuses(statuses, cadastrados, await executar(cadastrados))
+    pendentes = payloads.positions_to_migrate(statuses)
+    if pendentes:
+        for question_id in {lote[posicao][1] for posicao in pendentes}:
+            await ensure_packed_storage(quiz_id, question_id)
+        payloads.update_statuses(statuses, pendentes, await executar(pendentes))
+    return statuses
+
+# Rota para pegar as respostas de um quiz
+@app.route('/quizzes/<quiz_id>/responses', methods=['GET'])
+async def get_responses_for_quiz(quiz_id):
+    question_id = request.args.get('question_id')
+    formato = request.args.get('format')
+    cursor = request.args.get('cursor')
+
+    if not await ar.exists(core.quiz_key(quiz_id)):
+        return jsonify({"error": f"Quiz {quiz_id} not found"}), 404
+
+    if question_id:
+        if not await ar.exists(core.question_key(quiz_id, question_id)):
+            return jsonify({"error": f"Question {question_id} not found in quiz {quiz_id}"}), 404
+        question_ids = [question_id]
+    else:
+        question_ids = await ar.lrange(core.questions_key(quiz_id), 0, -1)
+
+    try:
+        count = int(request.args.get('count', RESPONSES_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "count must be an integer"}), 400
+    if not 0 < count <= RESPONSES_MAX_PAGE_SIZE:
+        return jsonify({"error": f"count must be between 1 and {RESPONSES_MAX_PAGE_SIZE}"}), 400
+
+    if formato in RESPONSE_STREAM_FORMATS:
+        return Response(stream_responses(quiz_id, question_ids, formato, count),
+                        mimetype=RESPONSE_STREAM_FORMATS[formato]), 200
+    if formato:
+        return jsonify({"error": f"Unknown format {formato}"}), 400
+
+    if cursor is not None:
+        try:
+            question_index, offset = payloads.decode_responses_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        pagina = []
+        next_cursor = None
+        async for question_index, offset, rows in iter_response_pages(quiz_id, question_ids, count, question_index, offset):
+            pagina = rows
+            next_cursor = payloads.encode_responses_cursor(question_index, offset + count)
+            break
+
+        return jsonify({"quiz_id": quiz_id, "responses": pagina, "next_cursor": next_cursor}), 200
+
+    all_responses = []
+    async for _, _, rows in iter_response_pages(quiz_id, question_ids, count):
+        for row in rows:
+            del row["question_id"]
+            all_responses.append(row)
+
+    return jsonify({"quiz_id": quiz_id, "responses": all_responses}), 200
+
+async def iter_response_pages(quiz_id, question_ids, page_size, question_index=0, offset=0):
+    """Versão assíncrona de ProjetoInmemory.iter_response_pages."""
+    while question_index < len(question_ids):
+        question_id = question_ids[question_index]
+        alunos = await ar.zrange(USERS_KEY, offset, offset + page_size - 1)
+        if not alunos:
+            question_index, offset = question_index + 1, 0
+            continue
+
+        await ensure_packed_storage(quiz_id, question_id)
+        respostas, tempos = await read_packed_answers(quiz_id, question_id, alunos)
+
+        yield question_index, offset, payloads.response_rows(question_id, alunos, respostas, tempos)
+
+        offset += page_size
+
+async def read_packed_answers(quiz_id, question_id, alunos):
+    """Versão assíncrona de ProjetoInmemory.read_packed_answers."""
+    lookups = core.packed_lookups(quiz_id, question_id, alunos, await get_student_ids(alunos))
+    pipe = ar.pipeline(transaction=False)
+    for bucket_key, campos, _ in lookups:
+        pipe.hmget(bucket_key, campos)
+    return core.unpack_lookups(len(alunos), lookups, await pipe.execute())
+
+async def stream_responses(quiz_id, question_ids, formato, page_size):
+    if formato == "csv":
+        yield RESPONSES_CSV_HEADER
+
+    async for _, _, rows in iter_response_pages(quiz_id, question_ids, page_size):
+        yield payloads.encode_response_rows(rows, formato)
+
+# Rota para obter as estatísticas (analytics) de uma questão de um quiz
+@app.route('/quizzes/<quiz_id>/analytics', methods=['GET'])
+async def get_quiz_analytics(quiz_id):
+    question_id = request.args.get('question_id')
+    if not question_id:
+        return jsonify({"error": "ID da questão é obrigatório"}), 400
+
+    question_key = core.question_key(quiz_id, question_id)
+    pipe = ar.pipeline(transaction=False)
+    pipe.hmget(core.quiz_key(quiz_id), "creation_time", "incarnation")
+    pipe.exists(question_key)
+    pipe.get(core.question_version_key(quiz_id, question_id))
+    pipe.get(USERS_VERSION_KEY)
+    (creation_time, incarnation), questao_existe, versao_questao, versao_usuarios = await pipe.execute()
+
+    if creation_time is None:
+        return jsonify({"error": f"Quiz {quiz_id} não encontrado"}), 404
+
+    if not questao_existe:
+        return jsonify({"error": f"Questão {question_id} não encontrada no quiz {quiz_id}"}), 404
+
+    try:
+        limite = request.args.get('limit')
+        limite = int(limite) if limite is not None else None
+    except ValueError:
+        return jsonify({"error": "limit deve ser um número inteiro"}), 400
+
+    if limite is not None and limite <= 0:
+        return jsonify({"error": "limit deve ser positivo"}), 400
+
+    etag = core.version_etag(creation_time, incarnation, versao_questao, versao_usuarios)
+    return await conditional_json(("analytics", quiz_id, question_id, limite), etag,
+                                  lambda: build_quiz_analytics(quiz_id, question_id, limite))
+
+async def build_quiz_analytics(quiz_id, question_id, limite):
+    question_key = core.question_key(quiz_id, question_id)
+    pipe = ar.pipeline(transaction=False)
+    pipe.hgetall(core.stats_key(quiz_id, question_id))
+    pipe.hget(question_key, "options")
+    pipe.zrange(core.correct_students_key(quiz_id, question_id), 0, -1 if limite is None else limite - 1, withscores=True)
+    pipe.zcard(USERS_KEY)
+    estatisticas, opcoes, alunos_que_acertaram, total_alunos = await pipe.execute()
+
+    if not int(estatisticas.get("total", 0)):
+        return {"error": "Nenhuma resposta encontrada para esta questão"}, 404
+
+    nomes = await get_usernames(payloads.analytics_students(estatisticas, alunos_que_acertaram))
+    return payloads.analytics_payload(quiz_id, question_id, estatisticas, opcoes, alunos_que_acertaram,
+                                      total_alunos, nomes), 200
+
+# Rota para o relatório psicométrico de um quiz inteiro
+@app.route('/quizzes/<quiz_id>/report', methods=['GET'])
+async def get_quiz_report(quiz_id):
+    if core.psychometrics.np is None:
+        return jsonify({"error": "NumPy não está instalado; relatório indisponível"}), 501
+
+    if not await ar.exists(core.quiz_key(quiz_id)):
+        return jsonify({"error": f"Quiz {quiz_id} não encontrado"}), 404
+
+    # A carga e os cálculos são longos e em boa parte CPU: rodam numa thread, com o cliente síncrono
+    body = await asyncio.to_thread(core.get_quiz_report_body, quiz_id)
+    return Response(body, mimetype="application/json"), 200
+
+# Rota para exportar um quiz num arquivo colunar (Parquet ou CSV com gzip)
+@app.route('/quizzes/<quiz_id>/archive', methods=['GET'])
+async def export_quiz(quiz_id):
+    formato = request.args.get('format', core.archive.default_format())
+    if formato not in core.archive.available_formats():
+        return jsonify({"error": f"Formato {formato} indisponível (use um de {', '.join(core.archive.available_formats())})"}), 400
+
+    if not await ar.exists(core.quiz_key(quiz_id)):
+        return jsonify({"error": f"Quiz {quiz_id} não encontrado"}), 404
+
+    # A leitura e a codificação rodam numa thread, com o cliente síncrono (como o relatório)
+    arquivo = tempfile.SpooledTemporaryFile(max_size=core.ARCHIVE_SPOOL_SIZE)
+    try:
+        await asyncio.to_thread(core.write_quiz_archive, quiz_id, arquivo, formato)
+    except ValueError as e:
+        arquivo.close()
+        return jsonify({"error": str(e)}), 409
+    arquivo.seek(0)
+
+    async def conteudo():
+        with arquivo:
+            while bloco := arquivo.read(1024 * 1024):
+                yield bloco
+
+    mimetype, extensao = core.archive.FORMATS[formato]
+    return Response(conteudo(), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={quiz_id}{extensao}"}), 200
+
+# Rota para importar um quiz a partir de um arquivo gerado pela exportação
+@app.route('/quizzes/archive', methods=['POST'])
+async def import_quiz():
+    arquivo = tempfile.SpooledTemporaryFile(max_size=core.ARCHIVE_SPOOL_SIZE)
+    try:
+        async for bloco in request.body:
+            arquivo.write(bloco)
+        arquivo.seek(0)
+        quiz_id, totais = await asyncio.to_thread(core.import_quiz_archive, arquivo)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        arquivo.close()
+
+    return jsonify({"message": "Quiz imported successfully", "quiz_id": quiz_id, "rows": totais}), 201
+
+# Rota para obter o ranking de um quiz
+@app.route('/quizzes/<quiz_id>/ranking', methods=['GET'])
+async def get_quiz_ranking(quiz_id):
+    pipe = ar.pipeline(transaction=False)
+    pipe.hmget(core.quiz_key(quiz_id), "creation_time", "incarnation")
+    pipe.get(core.quiz_version_key(quiz_id))
+    pipe.get(USERS_VERSION_KEY)
+    (creation_time, incarnation), versao_quiz, versao_usuarios = await pipe.execute()
+
+    if creation_time is None:
+        return jsonify({"error": f"Quiz {quiz_id} não encontrado"}), 404
+
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return jsonify({"error": "limit e offset devem ser números inteiros"}), 400
+
+    if offset < 0 or (limit is not None and limit < 0):
+        return jsonify({"error": "limit e offset não podem ser negativos"}), 400
+
+    student_id = request.args.get('student_id')
+    etag = core.version_etag(creation_time, incarnation, versao_quiz, versao_usuarios)
+    return await conditional_json(("ranking", quiz_id, offset, limit, student_id), etag,
+                                  lambda: build_quiz_ranking(quiz_id, offset, limit, student_id))
+
+async def build_quiz_ranking(quiz_id, offset, limit, student_id):
+    total_questoes = await ar.llen(core.questions_key(quiz_id))
+
+    if student_id:
+        posicao = await get_student_rank(quiz_id, student_id)
+        if posicao is None:
+            return {"error": f"Aluno {student_id} não encontrado"}, 404
+        offset, entrada = posicao
+        ranking = [entrada]
+    else:
+        ranking = await get_ranking_page(quiz_id, offset, limit)
+
+    nomes = await get_usernames([aluno_id for aluno_id, _ in ranking])
+    return payloads.ranking_payload(quiz_id, ranking, offset, total_questoes, nomes), 200
+
+@app.route('/leaderboards/<window>', methods=['GET'])
+async def get_leaderboard(window):
+    if window not in LEADERBOARD_KEEP_DAYS:
+        return jsonify({"error": f"Janela {window} desconhecida (use {', '.join(LEADERBOARD_KEEP_DAYS)})"}), 400
+
+    period = request.args.get('period') or core.leaderboard_period(window, core.get_current_time())[0]
+    if not re.fullmatch(LEADERBOARD_PERIOD_FORMATS[window], period):
+        return jsonify({"error": f"Período {period} inválido para a janela {window}"}), 400
+
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', LEADERBOARD_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit e offset devem ser números inteiros"}), 400
+
+    if offset < 0 or not 0 < limit <= LEADERBOARD_MAX_PAGE_SIZE:
+        return jsonify({"error": f"offset não pode ser negativo e limit deve estar entre 1 e {LEADERBOARD_MAX_PAGE_SIZE}"}), 400
+
+    course = request.args.get('course') or None
+    student_id = request.args.get('student_id')
+    pipe = ar.pipeline(transaction=False)
+    pipe.get(LEADERBOARD_VERSION_KEY)
+    pipe.get(USERS_VERSION_KEY)
+    etag = core.version_etag(period, *await pipe.execute())
+    return await conditional_json(("leaderboard", window, period, course, offset, limit, student_id), etag,
+                                  lambda: build_leaderboard(window, period, course, offset, limit, student_id))
+
+async def build_leaderboard(window, period, course, offset, limit, student_id):
+    """Versão assíncrona de ProjetoInmemory.build_leaderboard."""
+    chave = core.leaderboard_window_key(window, period, course)
+    pipe = ar.pipeline(transaction=False)
+    pipe.zcard(chave)
+    if student_id:
+        pipe.zrevrank(chave, student_id)
+        pipe.zscore(chave, student_id)
+        total, posicao, score = await pipe.execute()
+        if posicao is None:
+            return {"error": f"Aluno {student_id} não está no leaderboard"}, 404
+        offset, ranking = posicao, [(student_id, score)]
+    else:
+        pipe.zrevrange(chave, offset, offset + limit - 1, withscores=True)
+        total, ranking = await pipe.execute()
+
+    nomes = await get_usernames([aluno_id for aluno_id, _ in ranking])
+    return payloads.leaderboard_payload(window, period, course, total, ranking, offset, nomes), 200
+
+async def get_ranking_page(quiz_id, offset, limit):
+    """Versão assíncrona de ProjetoInmemory.get_ranking_page."""
+    leaderboard = core.leaderboard_key(quiz_id)
+    faixa = payloads.ranking_page_range(offset, limit)
+    if faixa is None:
+        return []
+
+    total_no_leaderboard = await ar.zcard(leaderboard)
+    pagina = []
+    if offset < total_no_leaderboard:
+        pagina = await ar.zrevrange(leaderboard, *faixa, withscores=True)
+
+    ausentes = payloads.UnrankedStudents(offset, limit, total_no_leaderboard, len(pagina))
+    inicio = 0
+    while not ausentes.done:
+        alunos = await ar.zrange(USERS_KEY, inicio, inicio + RANKING_SCAN_BATCH - 1)
+        if not alunos:
+            break
+        inicio += len(alunos)
+
+        pipe = ar.pipeline(transaction=False)
+        for aluno in alunos:
+            pipe.zscore(leaderboard, aluno)
+        pagina.extend(ausentes.take(alunos, await pipe.execute()))
+
+    return pagina
+
+async def get_student_rank(quiz_id, student_id):
+    """Versão assíncrona de ProjetoInmemory.get_student_rank."""
+    leaderboard = core.leaderboard_key(quiz_id)
+    pipe = ar.pipeline(transaction=False)
+    pipe.zrevrank(leaderboard, student_id)
+    pipe.zscore(leaderboard, student_id)
+    pipe.zcard(leaderboard)
+    pipe.zscore(USERS_KEY, student_id)
+    return payloads.student_rank(student_id, *await pipe.execute())
+
+async def get_usernames(alunos):
+    """Retorna um dicionário aluno -> nome, buscando todos os nomes num único pipeline."""
+    pipe = ar.pipeline(transaction=False)
+    for aluno in alunos:
+        pipe.hget(USER_PREFIX + aluno, "username")
+    return dict(zip(alunos, await pipe.execute()))
+
+async def get_student_ids(alunos, create=False):
+    """Versão assíncrona de ProjetoInmemory.get_student_ids (com o mesmo cache local)."""
+    ids, faltando = payloads.cached_student_ids(alunos, core.student_id_cache)
+    if not faltando:
+        return ids
+
+    if create:
+        encontrados = await assign_student_ids_script(
+            keys=[STUDENT_IDS_KEY, STUDENT_CODES_KEY, STUDENT_NEXT_ID_KEY], args=faltando)
+    else:
+        encontrados = await ar.hmget(STUDENT_IDS_KEY, faltando)
+    return payloads.store_student_ids(ids, faltando, encontrados, core.student_id_cache)
+
+async def get_registered_student_ids(alunos):
+    """Versão assíncrona de ProjetoInmemory.get_registered_student_ids."""
+    ids = await get_student_ids(alunos)
+    faltando = payloads.students_without_ids(alunos, ids)
+    if faltando:
+        pipe = ar.pipeline(transaction=False)
+        for aluno in faltando:
+            pipe.zscore(USERS_KEY, aluno)
+        cadastrados = payloads.registered_students(faltando, await pipe.execute())
+        if cadastrados:
+            ids.update(await get_student_ids(cadastrados, create=True))
+    return ids
+
+async def ensure_packed_storage(quiz_id, question_id):
+    """Garante o formato compacto; a migração (rara) roda com o cliente síncrono numa thread."""
+    if core.packed_questions.get((quiz_id, question_id)) is not None:
+        return
+    if await ar.hget(core.question_key(quiz_id, question_id), "storage") == PACKED_STORAGE:
+        core.packed_questions.set((quiz_id, question_id), True)
+        return
+    await asyncio.to_thread(core.migrate_question_storage, quiz_id, question_id)
@@ -0,0 +1,137 @@
+"""Benchmark de answer_quiz: sequência antiga de comandos x script Lua atômico.
+
+Uso (com um Redis local rodando, o mesmo usado pela aplicação):
+
+    python benchmarks/bench_answer.py --students 5000
+
+Cadastra alunos temporários (só alunos cadastrados podem responder), cria um quiz
+temporário, grava uma resposta por aluno com cada estratégia e imprime as respostas por
+segundo, com a contagem dos códigos de retorno de cada estratégia: se alguma deixou de
+gravar respostas, o benchmark aborta em vez de comparar tempos. No final apaga as chaves
+do quiz e os alunos (cadastro e ids numéricos), e devolve o contador de ids ao valor
+anterior se nenhum outro id foi criado no meio tempo.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ProjetoInmemory as app_module  # noqa: E402
+import payloads  # noqa: E402
+
+r = app_module.r
+
+
+def legacy_answer(quiz_id, question_id, student_id, answer, response_timestamp):
+    """Reproduz a sequência de chamadas usada antes do script (6 a 7 idas ao Redis)."""
+    question_key = app_module.question_key(quiz_id, question_id)
+    responses_key, response_time_key, _, _ = app_module.legacy_answer_keys(quiz_id, question_id)
+    start_time = float(r.hget(question_key, "start_time") or 0)
+    if response_timestamp > start_time + payloads.ANSWER_WINDOW:
+        return payloads.ANSWER_EXPIRED
+    if r.sismember(question_key + ":answered", student_id):
+        return payloads.ANSWER_DUPLICATE
+    r.hset(responses_key, student_id, answer)
+    r.hset(response_time_key, student_id, response_timestamp - start_time)
+    correct_answer = r.hget(question_key, "correct_answer")
+    if answer == correct_answer:
+        r.hincrby(app_module.correct_answers_key(quiz_id), student_id, 1)
+    r.sadd(question_key + ":answered", student_id)
+    return payloads.ANSWER_RECORDED
+
+
+def setup_question(quiz_id, question_id):
+    """Cria a questão aberta agora e retorna o seu start_time."""
+    start_time = app_module.get_current_time()
+    r.hset(app_module.question_key(quiz_id, question_id), mapping={
+        "text": "benchmark",
+        "correct_answer": "a",
+        "options": '{"a": "1", "b": "2"}',
+        "start_time": start_time,
+        "storage": app_module.PACKED_STORAGE,
+    })
+    return start_time
+
+
+def cleanup(quiz_id):
+    keys = list(r.scan_iter(app_module.quiz_key(quiz_id) + "*"))
+    keys += list(r.scan_iter(app_module.TIME_PREFIX + app_module.key_tag(quiz_id) + "*"))
+    if keys:
+        r.delete(*keys)
+
+
+def register_students(students):
+    """Cadastra os alunos do benchmark e retorna (códigos, valor anterior do contador de ids)."""
+    proximo_id = int(r.get(app_module.STUDENT_NEXT_ID_KEY) or 0)
+    codigos = [f"bench-{student}" for student in range(students)]
+    for lote in app_module.iter_batches(codigos, app_module.USER_IMPORT_BATCH_SIZE):
+        app_module.import_users_batch([{"username": codigo, "code": codigo} for codigo in lote])
+    return codigos, proximo_id
+
+
+def cleanup_students(codigos, proximo_id):
+    for lote in app_module.iter_batches(codigos, app_module.USER_IMPORT_BATCH_SIZE):
+        ids = r.hmget(app_module.STUDENT_IDS_KEY, lote)
+        pipe = r.pipeline(transaction=False)
+        for codigo in lote:
+            pipe.delete(app_module.USER_PREFIX + codigo)
+        pipe.zrem(app_module.USERS_KEY, *lote)
+        pipe.hdel(app_module.STUDENT_IDS_KEY, *lote)
+        pipe.hdel(app_module.STUDENT_CODES_KEY, *[student_num_id for student_num_id in ids if student_num_id is not None])
+        pipe.execute()
+    r.incr(app_module.USERS_VERSION_KEY)
+    # Os ids do benchmark são os últimos criados, a menos que outro cliente tenha cadastrado alunos
+    if int(r.get(app_module.STUDENT_NEXT_ID_KEY) or 0) == proximo_id + len(codigos):
+        r.set(app_module.STUDENT_NEXT_ID_KEY, proximo_id)
+    removidos = set(codigos)
+    app_module.student_id_cache.invalidate(lambda aluno: aluno in removidos)
+
+
+def run(strategy, quiz_id, codigos):
+    """Grava uma resposta por aluno e retorna (respostas por segundo, contagem dos códigos de retorno)."""
+    start_time = setup_question(quiz_id, "q1")
+    statuses = Counter()
+    started = time.perf_counter()
+    for indice, codigo in enumerate(codigos):
+        answer = "a" if indice % 2 else "b"
+        # Timestamps espalhados dentro da janela, qualquer que seja a duração da rodada
+        response_timestamp = start_time + payloads.ANSWER_WINDOW * indice / len(codigos)
+        statuses[strategy(quiz_id, "q1", codigo, answer, response_timestamp)] += 1
+    elapsed = time.perf_counter() - started
+    cleanup(quiz_id)
+    return len(codigos) / elapsed, statuses
+
+
+def format_statuses(statuses):
+    return ", ".join(f"{payloads.ANSWER_STATUS_NAMES.get(status, status)}={total}"
+                     for status, total in sorted(statuses.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=5000)
+    args = parser.parse_args()
+
+    codigos, proximo_id = register_students(args.students)
+    try:
+        results = {
+            "legacy": run(legacy_answer, "bench-legacy", codigos),
+            "script": run(app_module.record_answer, "bench-script", codigos),
+        }
+    finally:
+        cleanup_students(codigos, proximo_id)
+    for name, (rate, statuses) in results.items():
+        print(f"{name:>8}: {rate:10.0f} respostas/s  ({format_statuses(statuses)})")
+
+    # Só faz sentido comparar os tempos se as duas estratégias gravaram todas as respostas
+    gravadas = {name: statuses[payloads.ANSWER_RECORDED] for name, (_, statuses) in results.items()}
+    if set(gravadas.values()) != {len(codigos)}:
+        sys.exit(f"respostas gravadas diferem do esperado ({len(codigos)}): {gravadas}")
+    print(f"ganho: {results['script'][0] / results['legacy'][0]:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Compara a aplicação síncrona (Flask) com a entrada ASGI (asgi.py) numa rajada de respostas.
+
+Suba as duas versões apontando para o mesmo Redis, por exemplo:
+
+    gunicorn -w 4 --threads 8 -b :5001 'ProjetoInmemory:create_app()'
+    uvicorn asgi:app --workers 2 --port 8000
+
+e rode:
+
+    python benchmarks/bench_async.py --students 5000 --concurrency 200
+
+Para cada servidor o benchmark cadastra os alunos, cria um quiz, abre a questão e
+dispara uma resposta por aluno com `concurrency` requisições simultâneas, imprimindo
+respostas por segundo e as latências p50/p95/p99. Depende de httpx.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+
+def percentile(valores, p):
+    valores = sorted(valores)
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[indice]
+
+
+async def run(base_url, students, concurrency):
+    prefixo = uuid.uuid4().hex[:8]
+    quiz_id = "bench-" + prefixo
+    alunos = [f"{prefixo}-{i}" for i in range(students)]
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await client.post("/users", json={"users": [{"username": aluno, "code": aluno} for aluno in alunos]})
+        await client.post("/quizzes", json={"id": quiz_id, "questions": [{
+            "id": "q1", "text": "benchmark", "correct_answer": "a", "options": {"a": "1", "b": "2"},
+        }]})
+        await client.get(f"/quizzes/{quiz_id}/questions/q1")
+
+        semaforo = asyncio.Semaphore(concurrency)
+        latencias = []
+
+        async def responder(aluno):
+            async with semaforo:
+                inicio = time.perf_counter()
+                resposta = await client.post(f"/quizzes/{quiz_id}/answer", json={
+                    "question_id": "q1", "answer": "a", "student_id": aluno,
+                })
+                latencias.append(time.perf_counter() - inicio)
+                return resposta.status_code
+
+        inicio = time.perf_counter()
+        status = await asyncio.gather(*(responder(aluno) for aluno in alunos))
+        duracao = time.perf_counter() - inicio
+
+    return {
+        "respostas/s": students / duracao,
+        "p50 (ms)": percentile(latencias, 50) * 1000,
+        "p95 (ms)": percentile(latencias, 95) * 1000,
+        "p99 (ms)": percentile(latencias, 99) * 1000,
+        "erros": sum(1 for codigo in status if codigo not in (200, 202)),  # 202: modo "stream"
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sync-url", default="http://localhost:5001")
+    parser.add_argument("--async-url", default="http://localhost:8000")
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    for nome, url in (("sync", args.sync_url), ("async", args.async_url)):
+        resultado = asyncio.run(run(url, args.students, args.concurrency))
+        print(f"{nome:>6}: " + ", ".join(f"{chave} {valor:.1f}" for chave, valor in resultado.items()))
+
+
+if __name__ == '__main__':
+    main()
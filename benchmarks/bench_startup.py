@@ -0,0 +1,78 @@
+"""Benchmark de inicialização: custo de importar o ProjetoInmemory e de montar a aplicação.
+
+Uso (não precisa de Redis):
+
+    python benchmarks/bench_startup.py --runs 10
+
+Cada rodada é um interpretador novo que importa o módulo e chama create_app(), medindo o
+tempo de cada passo, as threads vivas depois de cada um e as tentativas de conexão de
+rede (o socket é interceptado e recusa a conexão). Importar e montar a aplicação não
+deveria abrir conexões nem iniciar threads; o Redis e as threads de fundo ficam para o
+primeiro comando e a primeira requisição. São impressas as medianas das rodadas.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Código de cada rodada, executado num interpretador novo
+RODADA = """
+import json, socket, threading, time
+
+tentativas = []
+
+def connect(self, address):
+    tentativas.append(str(address))
+    raise ConnectionRefusedError(address)
+
+socket.socket.connect = connect
+
+inicio = time.perf_counter()
+import ProjetoInmemory
+importado = time.perf_counter()
+threads_import, conexoes_import = threading.active_count(), len(tentativas)
+app = ProjetoInmemory.create_app()
+criado = time.perf_counter()
+print(json.dumps({
+    "import_ms": (importado - inicio) * 1000,
+    "create_app_ms": (criado - importado) * 1000,
+    "threads_import": threads_import,
+    "threads_create_app": threading.active_count(),
+    "connections_import": conexoes_import,
+    "connections_create_app": len(tentativas),
+}))
+"""
+
+
+def rodada(env):
+    inicio = time.perf_counter()
+    saida = subprocess.run([sys.executable, "-c", RODADA], cwd=RAIZ, env=env,
+                           capture_output=True, text=True, check=True)
+    resultado = json.loads(saida.stdout.strip().splitlines()[-1])
+    resultado["process_ms"] = (time.perf_counter() - inicio) * 1000
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    rodada(env)  # aquece o cache do sistema de arquivos
+    rodadas = [rodada(env) for _ in range(args.runs)]
+
+    for chave in ("process_ms", "import_ms", "create_app_ms"):
+        valores = [resultado[chave] for resultado in rodadas]
+        print(f"{chave:>24}: mediana {statistics.median(valores):8.1f} ms  (min {min(valores):.1f}, max {max(valores):.1f})")
+    for chave in ("threads_import", "threads_create_app", "connections_import", "connections_create_app"):
+        print(f"{chave:>24}: {max(resultado[chave] for resultado in rodadas)}")
+
+
+if __name__ == '__main__':
+    main()
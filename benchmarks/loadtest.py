@@ -0,0 +1,286 @@
+"""Harness de carga que simula uma aula ao vivo contra as rotas do ProjetoInmemory.
+
+As requisições passam pelo app Flask em processo (test client), contra o Redis
+configurado pelas variáveis REDIS_* ou contra um fakeredis (--fake). Cenários:
+
+- bulk_users: cadastro dos alunos em lotes NDJSON;
+- create_quiz: criação dos quizzes;
+- burst: cada aluno abre a questão e responde dentro da janela de 20 s, enquanto
+  telas consultam /ranking e /analytics em paralelo (com If-None-Match, como um navegador);
+- idle_poll: depois da rajada, as telas continuam consultando sem que nada mude, e
+  cada consulta deveria custar só a leitura das versões (304);
+- export: exportação das respostas em NDJSON e paginada por cursor.
+
+Para cada rota são reportados vazão, latências p50/p95/p99 e comandos Redis por
+requisição. Use --json para gravar o resultado e comparar entre versões.
+
+    python benchmarks/loadtest.py --fake --students 2000 --concurrency 32
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+import sharding  # noqa: E402
+
+
+def load_app(fake):
+    """Importa o módulo e cria a aplicação; com fake=True, o cliente Redis é um fakeredis em memória."""
+    import ProjetoInmemory
+    if not fake:
+        return ProjetoInmemory, ProjetoInmemory.create_app()
+
+    import fakeredis
+    client = fakeredis.FakeStrictRedis(decode_responses=True)
+    return ProjetoInmemory, ProjetoInmemory.create_app({"REDIS_CLIENT": client})
+
+
+class CommandCounter:
+    """Conta os comandos enviados ao Redis por thread, para atribuí-los a cada requisição."""
+
+    def __init__(self, client):
+        self._local = threading.local()
+        for node in sharding.node_clients(client):
+            metrics.instrument_redis_client(node, self._add)
+
+    def _add(self, quantidade, segundos):
+        self._local.total = self.current() + quantidade
+
+    def current(self):
+        return getattr(self._local, "total", 0)
+
+
+class Recorder:
+    """Acumula latências e comandos Redis por rota."""
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.samples = defaultdict(list)
+        self.commands = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.elapsed = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def call(self, route, request, ok_status=(200, 201, 202)):
+        comandos_antes = self.counter.current()
+        inicio = time.perf_counter()
+        resposta = request()
+        resposta.get_data()  # consome respostas em streaming
+        duracao = time.perf_counter() - inicio
+        comandos = self.counter.current() - comandos_antes
+        with self._lock:
+            self.samples[route].append(duracao)
+            self.commands[route] += comandos
+            if resposta.status_code not in ok_status:
+                self.errors[route] += 1
+        return resposta
+
+    def scenario(self, routes, elapsed):
+        for route in routes:
+            self.elapsed[route] += elapsed
+
+    def report(self):
+        resultado = {}
+        for route, latencias in self.samples.items():
+            latencias = sorted(latencias)
+            total = len(latencias)
+            resultado[route] = {
+                "requests": total,
+                "errors": self.errors[route],
+                "throughput_rps": total / self.elapsed[route] if self.elapsed[route] else 0.0,
+                "p50_ms": percentile(latencias, 50) * 1000,
+                "p95_ms": percentile(latencias, 95) * 1000,
+                "p99_ms": percentile(latencias, 99) * 1000,
+                "redis_cmds_per_request": self.commands[route] / total,
+            }
+        return resultado
+
+
+def percentile(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    indice = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+
+def conditional_get(cliente, etags, url):
+    """GET com o ETag da última resposta dessa URL, como faria o navegador da tela."""
+    headers = {"If-None-Match": etags[url]} if url in etags else {}
+    resposta = cliente.get(url, headers=headers)
+    if resposta.headers.get("ETag"):
+        etags[url] = resposta.headers["ETag"]
+    return resposta
+
+
+def timed(recorder, routes, funcao):
+    inicio = time.perf_counter()
+    funcao()
+    recorder.scenario(routes, time.perf_counter() - inicio)
+
+
+def run(args):
+    app_module, flask_app = load_app(args.fake)
+    counter = CommandCounter(app_module.r)
+    recorder = Recorder(counter)
+    client = flask_app.test_client()
+
+    prefixo = "lt-" + uuid.uuid4().hex[:8]
+    alunos = [f"{prefixo}-{i}" for i in range(args.students)]
+    quizzes = [f"{prefixo}-quiz-{i}" for i in range(args.quizzes)]
+    question_ids = [f"q{i}" for i in range(args.questions)]
+
+    # 1. Cadastro dos alunos em lotes NDJSON
+    def bulk_users():
+        for inicio in range(0, len(alunos), args.upload_size):
+            corpo = "".join(json.dumps({"username": aluno, "code": aluno}) + "\n"
+                            for aluno in alunos[inicio:inicio + args.upload_size])
+            recorder.call("POST /users (ndjson)", lambda: client.post(
+                "/users", data=corpo, content_type="application/x-ndjson"))
+    timed(recorder, ["POST /users (ndjson)"], bulk_users)
+
+    # 2. Criação dos quizzes
+    def create_quizzes():
+        for quiz_id in quizzes:
+            recorder.call("POST /quizzes", lambda: client.post("/quizzes", json={"id": quiz_id, "questions": [{
+                "id": question_id, "text": f"Questão {question_id}", "correct_answer": "a",
+                "options": {"a": "1", "b": "2", "c": "3", "d": "4"},
+            } for question_id in question_ids]}))
+    timed(recorder, ["POST /quizzes"], create_quizzes)
+
+    # 3. Rajada: cada aluno abre a questão e responde, com telas consultando ranking e analytics
+    burst_routes = ["GET /questions/<id>", "POST /answer", "GET /ranking", "GET /analytics"]
+
+    def burst():
+        quiz_id = quizzes[0]
+        for question_id in question_ids:
+            terminou = threading.Event()
+
+            def aluno_responde(indice):
+                cliente = flask_app.test_client()
+                aluno = alunos[indice]
+                recorder.call("GET /questions/<id>", lambda: cliente.get(
+                    f"/quizzes/{quiz_id}/questions/{question_id}"))
+                recorder.call("POST /answer", lambda: cliente.post(f"/quizzes/{quiz_id}/answer", json={
+                    "question_id": question_id, "answer": "abcd"[indice % 4], "student_id": aluno,
+                }))
+
+            def tela():
+                cliente = flask_app.test_client()
+                etags = {}
+                while not terminou.is_set():
+                    recorder.call("GET /ranking", lambda: conditional_get(
+                        cliente, etags, f"/quizzes/{quiz_id}/ranking?limit=10"), ok_status=(200, 304))
+                    recorder.call("GET /analytics", lambda: conditional_get(
+                        cliente, etags, f"/quizzes/{quiz_id}/analytics?question_id={question_id}&limit=10"),
+                        ok_status=(200, 304, 404))
+                    terminou.wait(args.poll_interval)
+
+            telas = [threading.Thread(target=tela) for _ in range(args.pollers)]
+            for thread in telas:
+                thread.start()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(aluno_responde, range(len(alunos))))
+            terminou.set()
+            for thread in telas:
+                thread.join()
+    timed(recorder, burst_routes, burst)
+
+    # 4. Telas consultando depois da rajada, sem respostas novas
+    idle_routes = ["GET /ranking (idle)", "GET /analytics (idle)"]
+
+    def idle_poll():
+        quiz_id = quizzes[0]
+        question_id = question_ids[-1]
+
+        def tela(_):
+            cliente = flask_app.test_client()
+            etags = {}
+            for _ in range(args.idle_polls):
+                recorder.call("GET /ranking (idle)", lambda: conditional_get(
+                    cliente, etags, f"/quizzes/{quiz_id}/ranking?limit=10"), ok_status=(200, 304))
+                recorder.call("GET /analytics (idle)", lambda: conditional_get(
+                    cliente, etags, f"/quizzes/{quiz_id}/analytics?question_id={question_id}&limit=10"),
+                    ok_status=(200, 304))
+
+        with ThreadPoolExecutor(max_workers=args.pollers) as executor:
+            list(executor.map(tela, range(args.pollers)))
+    timed(recorder, idle_routes, idle_poll)
+
+    # 5. Exportação das respostas
+    def export():
+        quiz_id = quizzes[0]
+        recorder.call("GET /responses (ndjson)", lambda: client.get(
+            f"/quizzes/{quiz_id}/responses?format=ndjson&count={args.page_size}"))
+        cursor = ""
+        while cursor is not None:
+            resposta = recorder.call("GET /responses (cursor)", lambda: client.get(
+                f"/quizzes/{quiz_id}/responses?count={args.page_size}&cursor={cursor}"))
+            pagina = resposta.get_json()
+            cursor = pagina["next_cursor"] if pagina["responses"] else None
+    timed(recorder, ["GET /responses (ndjson)", "GET /responses (cursor)"], export)
+
+    if not args.fake:
+        cleanup(app_module, prefixo, alunos)
+
+    return recorder.report()
+
+
+def cleanup(app_module, prefixo, alunos):
+    """Remove do Redis real os dados criados pelo harness."""
+    r = app_module.r
+    for inicio in range(0, len(alunos), 1000):
+        lote = alunos[inicio:inicio + 1000]
+        r.delete(*(app_module.USER_PREFIX + aluno for aluno in lote))
+        r.zrem(app_module.USERS_KEY, *lote)
+    # Os ids dos quizzes começam pelo prefixo: no layout "tagged" o * fica dentro da hash tag
+    for padrao in (app_module.quiz_key(prefixo + "*") + "*", app_module.TIME_PREFIX + app_module.key_tag(prefixo + "*") + "*"):
+        chaves = list(r.scan_iter(match=padrao, count=1000))
+        for inicio in range(0, len(chaves), 1000):
+            r.delete(*chaves[inicio:inicio + 1000])
+    quizzes = [quiz for quiz in r.zrange(app_module.QUIZZES_KEY, 0, -1) if quiz.startswith(prefixo)]
+    if quizzes:
+        r.zrem(app_module.QUIZZES_KEY, *quizzes)
+        r.zrem(app_module.QUIZZES_OPENED_KEY, *quizzes)
+
+
+def print_report(resultado):
+    cabecalho = f"{'rota':<26}{'reqs':>7}{'erros':>7}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'cmds/req':>10}"
+    print(cabecalho)
+    print("-" * len(cabecalho))
+    for route, m in resultado.items():
+        print(f"{route:<26}{m['requests']:>7}{m['errors']:>7}{m['throughput_rps']:>10.1f}"
+              f"{m['p50_ms']:>9.2f}{m['p95_ms']:>9.2f}{m['p99_ms']:>9.2f}{m['redis_cmds_per_request']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fake", action="store_true", help="usa fakeredis em vez do Redis configurado")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--quizzes", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=32, help="alunos respondendo ao mesmo tempo")
+    parser.add_argument("--pollers", type=int, default=4, help="telas consultando ranking/analytics")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--idle-polls", type=int, default=100, help="consultas de cada tela depois da rajada")
+    parser.add_argument("--upload-size", type=int, default=5000, help="alunos por upload NDJSON")
+    parser.add_argument("--page-size", type=int, default=1000, help="alunos por página na exportação")
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args()
+
+    resultado = run(args)
+    print_report(resultado)
+    if args.json:
+        with open(args.json, "w") as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env bash
+# Sobe vários redis-server locais para testar a aplicação num anel de nós ou num Redis Cluster.
+#
+#   benchmarks/redis_nodes.sh ring 3       # 3 nós independentes nas portas 7000-7002
+#   benchmarks/redis_nodes.sh cluster 3    # Redis Cluster com 3 primários (sem réplicas)
+#   benchmarks/redis_nodes.sh stop         # derruba os nós e apaga os dados
+#
+# Depois, aponte a aplicação (ou o loadtest) para os nós com as variáveis impressas no final.
+set -euo pipefail
+
+MODE=${1:-ring}
+NODES=${2:-3}
+BASE_PORT=${BASE_PORT:-7000}
+DATA_DIR=${DATA_DIR:-/tmp/projetoinmemory-nodes}
+
+stop_nodes() {
+    for pidfile in "$DATA_DIR"/*/redis.pid; do
+        [ -e "$pidfile" ] && kill "$(cat "$pidfile")" 2>/dev/null || true
+    done
+    rm -rf "$DATA_DIR"
+}
+
+if [ "$MODE" = "stop" ]; then
+    stop_nodes
+    exit 0
+fi
+
+if [ "$MODE" != "ring" ] && [ "$MODE" != "cluster" ]; then
+    echo "uso: $0 ring|cluster [nós] | stop" >&2
+    exit 1
+fi
+
+stop_nodes
+addresses=()
+for ((i = 0; i < NODES; i++)); do
+    port=$((BASE_PORT + i))
+    dir="$DATA_DIR/$port"
+    mkdir -p "$dir"
+    args=(--port "$port" --dir "$dir" --daemonize yes --pidfile "$dir/redis.pid"
+          --logfile "$dir/redis.log" --save "" --appendonly no)
+    if [ "$MODE" = "cluster" ]; then
+        args+=(--cluster-enabled yes --cluster-config-file "$dir/nodes.conf")
+    fi
+    redis-server "${args[@]}"
+    addresses+=("127.0.0.1:$port")
+done
+
+for address in "${addresses[@]}"; do
+    until redis-cli -p "${address##*:}" ping >/dev/null 2>&1; do sleep 0.1; done
+done
+
+if [ "$MODE" = "cluster" ]; then
+    redis-cli --cluster create "${addresses[@]}" --cluster-replicas 0 --cluster-yes >/dev/null
+    until redis-cli -p "$BASE_PORT" cluster info | grep -q "cluster_state:ok"; do sleep 0.2; done
+fi
+
+nodes=$(IFS=,; echo "${addresses[*]}")
+echo "export REDIS_MODE=$MODE REDIS_NODES=$nodes"
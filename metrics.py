@@ -0,0 +1,180 @@
+"""Métricas em memória (contadores, gauges e histogramas) expostas no formato texto do Prometheus.
+
+As métricas são por processo: com vários workers, cada um expõe os próprios números
+(o Prometheus agrega pelas labels de instância). Registrar uma observação custa uma
+busca binária e um lock, barato o bastante para ficar ligado em produção.
+"""
+import bisect
+import threading
+import time
+
+# Buckets padrão para durações, em segundos
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Buckets para contagens de comandos Redis por requisição
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500, 1000)
+# Buckets para tamanhos de payload, em bytes
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def format_labels(names, values, extra=()):
+    pares = [f'{nome}="{escape_label(valor)}"' for nome, valor in zip(names, values)]
+    pares.extend(f'{nome}="{valor}"' for nome, valor in extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def escape_label(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_number(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Counter:
+    """Contador monotônico com labels."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def expose(self):
+        linhas = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            valores = sorted(self._values.items())
+        for labelvalues, valor in valores:
+            linhas.append(f"{self.name}_total{format_labels(self.labelnames, labelvalues)} {format_number(valor)}")
+        return linhas
+
+
+class Gauge:
+    """Valor instantâneo com labels; cada set substitui o valor anterior."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def expose(self):
+        linhas = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            valores = sorted(self._values.items())
+        for labelvalues, valor in valores:
+            linhas.append(f"{self.name}{format_labels(self.labelnames, labelvalues)} {format_number(valor)}")
+        return linhas
+
+
+class Histogram:
+    """Histograma cumulativo com buckets fixos e labels."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        indice = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            serie = self._series.get(labelvalues)
+            if serie is None:
+                serie = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += value
+            serie[2] += 1
+
+    def expose(self):
+        linhas = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, ([*contagens], soma, total)) for labels, (contagens, soma, total) in self._series.items())
+        for labelvalues, (contagens, soma, total) in series:
+            acumulado = 0
+            for limite, contagem in zip((*self.buckets, float("inf")), contagens):
+                acumulado += contagem
+                labels = format_labels(self.labelnames, labelvalues, [("le", format_number(limite))])
+                linhas.append(f"{self.name}_bucket{labels} {acumulado}")
+            labels = format_labels(self.labelnames, labelvalues)
+            linhas.append(f"{self.name}_sum{labels} {format_number(soma)}")
+            linhas.append(f"{self.name}_count{labels} {total}")
+        return linhas
+
+
+class Registry:
+    """Conjunto de métricas de um processo."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labelnames=()):
+        metric = Gauge(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self):
+        """Retorna todas as métricas no formato texto do Prometheus (versão 0.0.4)."""
+        linhas = []
+        for metric in self._metrics:
+            linhas.extend(metric.expose())
+        return "\n".join(linhas) + "\n"
+
+
+def instrument_redis_client(client, on_commands):
+    """Chama on_commands(quantidade, segundos) a cada comando ou pipeline executado pelo cliente.
+
+    Funciona com qualquer instância de redis.Redis (inclusive fakeredis): os scripts Lua
+    passam por execute_command e os pipelines são contados pelos comandos enfileirados.
+    """
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def instrumented_execute_command(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return execute_command(*args, **kwargs)
+        finally:
+            on_commands(1, time.perf_counter() - inicio)
+
+    def instrumented_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def instrumented_execute(*execute_args, **execute_kwargs):
+            quantidade = len(pipe.command_stack)
+            inicio = time.perf_counter()
+            try:
+                return execute(*execute_args, **execute_kwargs)
+            finally:
+                on_commands(quantidade, time.perf_counter() - inicio)
+
+        pipe.execute = instrumented_execute
+        return pipe
+
+    client.execute_command = instrumented_execute_command
+    client.pipeline = instrumented_pipeline
+    return client
@@ -0,0 +1,409 @@
+"""Corpos das respostas da API e a lógica em volta deles, sem Redis nem framework web.
+
+A versão síncrona (ProjetoInmemory) e a assíncrona (asgi) leem os dados do Redis cada uma
+com o seu cliente e passam o que leram para estas funções, para que as duas respondam
+exatamente com os mesmos JSONs: validação de usuários e de lotes de respostas, questões,
+exportação de respostas, analytics, rankings, leaderboards e relatório psicométrico. As
+decisões entre uma ida e outra ao Redis (ids já em cache, alunos cadastrados, registros a
+reenviar, como completar uma página do ranking) também ficam aqui; nas duas versões sobra
+só o I/O.
+"""
+import csv
+import io
+import json
+import os
+
+import psychometrics
+
+# Janela (em segundos) para responder uma questão depois que ela foi aberta
+ANSWER_WINDOW = 20
+
+# Códigos de retorno do script de resposta (ANSWER_UNKNOWN_STUDENT é decidido antes do script)
+ANSWER_TOO_EARLY = -4
+ANSWER_UNKNOWN_STUDENT = -3
+ANSWER_NEEDS_MIGRATION = -2
+ANSWER_EXPIRED = -1
+ANSWER_DUPLICATE = 0
+ANSWER_RECORDED = 1
+ANSWER_ERRORS = {
+    ANSWER_TOO_EARLY: "timestamp is before the question was opened",
+    ANSWER_UNKNOWN_STUDENT: "Student is not registered",
+    ANSWER_EXPIRED: "Time expired for answering this question",
+    ANSWER_DUPLICATE: "User has already answered this question",
+}
+ANSWER_STATUS_NAMES = {
+    ANSWER_TOO_EARLY: "too_early",
+    ANSWER_UNKNOWN_STUDENT: "unknown_student",
+    ANSWER_EXPIRED: "expired",
+    ANSWER_DUPLICATE: "duplicate",
+    ANSWER_RECORDED: "recorded",
+}
+
+# Tolerância para relógios adiantados ou atrasados nos timestamps enviados nos lotes
+ANSWER_BATCH_CLOCK_SKEW = float(os.environ.get("ANSWER_BATCH_CLOCK_SKEW_SECONDS", 5))
+
+# Peso de um acerto na pontuação do leaderboard. O tempo poupado em cada questão
+# (ANSWER_WINDOW - tempo de resposta) entra como desempate e nunca chega a esse valor.
+RANKING_SCORE_SCALE = 10_000_000
+
+
+# Usuários, ids numéricos e questões
+def validate_users(users):
+    """Separa os usuários válidos, como (código, nome), das mensagens de erro."""
+    validos = []
+    errors = []
+    for user in users:
+        username = user.get('username') if isinstance(user, dict) else None
+        user_code = user.get('code') if isinstance(user, dict) else None
+
+        if not username or not user_code:
+            errors.append(f"User code or username missing for user: {user}")
+            continue
+        validos.append((str(user_code), username))
+    return validos, errors
+
+
+def new_users(validos, criados):
+    """Separa os usuários gravados pelo HSETNX dos códigos que já existiam: (adicionados, erros)."""
+    added_users = []
+    errors = []
+    for (user_code, username), criado in zip(validos, criados):
+        if not criado:
+            errors.append(f"User code {user_code} already exists.")
+            continue
+        added_users.append({"user_code": user_code, "username": username})
+    return added_users, errors
+
+
+def cached_student_ids(alunos, cache):
+    """Separa os ids numéricos já no cache local dos alunos a buscar: (aluno -> id, faltando)."""
+    ids = {}
+    faltando = []
+    for aluno in alunos:
+        student_num_id = cache.get(aluno)
+        if student_num_id is None:
+            faltando.append(aluno)
+        else:
+            ids[aluno] = student_num_id
+    return ids, faltando
+
+
+def store_student_ids(ids, alunos, encontrados, cache):
+    """Junta a ids (e ao cache local) os ids lidos do Redis; alunos sem id ficam de fora."""
+    for aluno, student_num_id in zip(alunos, encontrados):
+        if student_num_id is not None:
+            ids[aluno] = int(student_num_id)
+            cache.set(aluno, int(student_num_id))
+    return ids
+
+
+def students_without_ids(alunos, ids):
+    """Alunos (sem repetição) que ficaram sem id numérico."""
+    return [aluno for aluno in dict.fromkeys(alunos) if aluno not in ids]
+
+
+def registered_students(alunos, cadastros):
+    """Filtra os alunos cujo ZSCORE no registro de usuários existe."""
+    return [aluno for aluno, cadastro in zip(alunos, cadastros) if cadastro is not None]
+
+
+def encode_question(question_id, question_data):
+    """Serializa a questão (resultado do HGETALL em lista plana) para o corpo da resposta."""
+    question_data = dict(zip(question_data[::2], question_data[1::2]))
+
+    # Converte as opções da questão de JSON para um objeto Python (lista ou dicionário)
+    question_data['options'] = json.loads(question_data['options'])
+
+    # Remover a chave "correct_answer" (e o formato interno das respostas) da resposta
+    question_data.pop('correct_answer', None)
+    question_data.pop('storage', None)
+
+    return json.dumps({
+        "question_id": question_id,
+        "question": question_data
+    }, sort_keys=True)
+
+
+# Respostas em lote
+def validate_batch_answers(registros, question_ids, agora):
+    """Separa os registros válidos, como (índice, questão, aluno, resposta, timestamp), dos inválidos.
+
+    Retorna também a lista de resultados, já preenchida para os registros inválidos.
+    """
+    validos = []
+    resultados = [None] * len(registros)
+    for indice, registro in enumerate(registros):
+        registro = registro if isinstance(registro, dict) else {}
+        question_id = registro.get('question_id')
+        student_id = registro.get('student_id')
+        answer = registro.get('answer')
+        timestamp = registro.get('timestamp')
+
+        if not question_id or not answer or not student_id:
+            erro = "Question ID, answer, and student ID are required"
+        elif isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+            erro = "timestamp must be a number (seconds since the epoch)"
+        elif timestamp > agora + ANSWER_BATCH_CLOCK_SKEW:
+            erro = "timestamp is in the future"
+        elif question_id not in question_ids:
+            erro = f"Question {question_id} not found"
+        else:
+            validos.append((indice, str(question_id), str(student_id), str(answer), float(timestamp)))
+            continue
+        resultados[indice] = {"index": indice, "status": "invalid", "error": erro}
+    return validos, resultados
+
+
+def batch_statuses(lote, ids):
+    """Códigos iniciais do lote (todos ANSWER_UNKNOWN_STUDENT) e as posições dos alunos com id."""
+    statuses = [ANSWER_UNKNOWN_STUDENT] * len(lote)
+    cadastrados = [posicao for posicao, (_, _, student_id, _, _) in enumerate(lote) if student_id in ids]
+    return statuses, cadastrados
+
+
+def update_statuses(statuses, posicoes, resultados):
+    """Grava os códigos devolvidos pelo pipeline nas posições dos registros enviados."""
+    for posicao, status in zip(posicoes, resultados):
+        statuses[posicao] = status
+    return statuses
+
+
+def positions_to_migrate(statuses):
+    """Posições dos registros cujas questões ainda estão no formato antigo."""
+    return [posicao for posicao, status in enumerate(statuses) if status == ANSWER_NEEDS_MIGRATION]
+
+
+def batch_answer_result(indice, status, stream=False):
+    """Resultado de um registro do lote; no modo "stream" as respostas gravadas são "accepted"."""
+    if status in ANSWER_ERRORS:
+        return {"index": indice, "status": ANSWER_STATUS_NAMES[status], "error": ANSWER_ERRORS[status]}
+    return {"index": indice, "status": "accepted" if stream else "recorded"}
+
+
+def summarize_batch_results(quiz_id, resultados):
+    aceitos = sum(1 for resultado in resultados if "error" not in resultado)
+    return {
+        "quiz_id": quiz_id,
+        "received": len(resultados),
+        "recorded": aceitos,
+        "rejected": len(resultados) - aceitos,
+        "results": resultados,
+    }
+
+
+# Exportação de respostas
+def response_rows(question_id, alunos, respostas, tempos):
+    """Monta as linhas da exportação; quem não respondeu aparece com "0" e o tempo máximo."""
+    return [{
+        "question_id": question_id,
+        "student_id": student_id,
+        "answer": answer if answer is not None else "0",
+        "response_time": float(response_time) if response_time is not None else float(ANSWER_WINDOW)
+    } for student_id, answer, response_time in zip(alunos, respostas, tempos)]
+
+
+def encode_response_rows(rows, formato):
+    """Serializa um bloco de linhas da exportação em NDJSON ou CSV."""
+    if formato == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerows((row["question_id"], row["student_id"], row["answer"], row["response_time"]) for row in rows)
+        return buffer.getvalue()
+    return "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def encode_responses_cursor(question_index, offset):
+    return f"{question_index}:{offset}"
+
+
+def decode_responses_cursor(cursor):
+    """Converte o cursor de paginação em (índice da questão, offset); lança ValueError se for inválido."""
+    if not cursor:
+        return 0, 0
+    question_index, offset = (int(parte) for parte in cursor.split(":"))
+    if question_index < 0 or offset < 0:
+        raise ValueError(cursor)
+    return question_index, offset
+
+
+# Analytics de uma questão
+def analytics_students(estatisticas, alunos_que_acertaram):
+    """Retorna os alunos cujos nomes aparecem no analytics da questão."""
+    return list({estatisticas.get("fastest_id"), *(aluno for aluno, _ in alunos_que_acertaram)} - {None})
+
+
+def build_analytics(estatisticas, opcoes, alunos_que_acertaram, total_alunos, nomes):
+    """Monta o analytics de uma questão a partir dos agregados lidos do Redis."""
+    total_respostas = int(estatisticas.get("total", 0))
+    acertos = int(estatisticas.get("correct", 0))
+    tempo_total_respostas = float(estatisticas.get("time_total", 0))
+    distribuicao_respostas = {opcao: int(estatisticas.get("opt:" + opcao, 0)) for opcao in json.loads(opcoes or "[]")}
+
+    # Calcular o tempo médio de resposta
+    tempo_medio_resposta = tempo_total_respostas / total_respostas if total_respostas > 0 else 0
+
+    # 1. Alternativa mais votada (retornar apenas a mais votada)
+    alternativas_mais_votadas = sorted(distribuicao_respostas.items(), key=lambda x: x[1], reverse=True)
+    alternativa_mais_votada = alternativas_mais_votadas[0] if alternativas_mais_votadas else None  # Apenas a mais votada
+
+    # 2. Questões com mais abstenções (em relação a total de alunos que poderiam responder)
+    absteve = total_alunos - total_respostas
+
+    # 3. Aluno mais rápido entre os que acertaram (ou o mais rápido, se ninguém acertou)
+    mais_rapido = (estatisticas.get("fastest_id"), float(estatisticas.get("fastest_time", 0)))
+    if alunos_que_acertaram:
+        melhor_aluno = (alunos_que_acertaram[0][0], 1, alunos_que_acertaram[0][1])
+    else:
+        melhor_aluno = (mais_rapido[0], 0, mais_rapido[1])
+
+    # 4. Alunos com maior acerto (os que acertaram, do mais rápido ao mais lento)
+    alunos_com_maior_acerto = [
+        {"id": aluno, "aluno": nomes.get(aluno), "acertos": 1}
+        for aluno, _ in alunos_que_acertaram
+    ]
+
+    return {
+        "total_respostas": total_respostas,
+        "acertos": acertos,
+        "erros": total_respostas - acertos,
+        "Respostas_mais_votadas": alternativa_mais_votada,
+        "tempo_medio_resposta": tempo_medio_resposta,
+        "melhor_aluno": {
+            "id": melhor_aluno[0],
+            "Aluno": nomes.get(melhor_aluno[0]),
+            "acertos": melhor_aluno[1],
+            "tempo_resposta": melhor_aluno[2]
+        },
+        "alunos_com_maior_acerto": alunos_com_maior_acerto,
+        "melhor_aluno_por_velocidade": {
+            "id": mais_rapido[0],
+            "aluno": nomes.get(mais_rapido[0]),
+            "tempo_resposta em segundos": mais_rapido[1]
+        },
+        "abstencoes": absteve
+    }
+
+
+def analytics_payload(quiz_id, question_id, estatisticas, opcoes, alunos_que_acertaram, total_alunos, nomes):
+    return {
+        "quiz_id": quiz_id,
+        "question_id": question_id,
+        "analytics": build_analytics(estatisticas, opcoes, alunos_que_acertaram, total_alunos, nomes)
+    }
+
+
+# Rankings e leaderboards
+def ranking_score(is_correct, tempo_resposta):
+    """Pontuação de uma resposta no leaderboard: acertos pesam mais que qualquer soma de tempos."""
+    return (RANKING_SCORE_SCALE if is_correct else 0) + (ANSWER_WINDOW - tempo_resposta)
+
+
+def split_ranking_score(score, total_questoes):
+    """Separa a pontuação do leaderboard em (acertos, tempo médio de resposta).
+
+    Questões não respondidas contam com o tempo máximo (ANSWER_WINDOW), como antes.
+    """
+    acertos = int((score + 1e-6) // RANKING_SCORE_SCALE)  # tolera erro de arredondamento do float
+    tempo_poupado = max(score - acertos * RANKING_SCORE_SCALE, 0)
+    if not total_questoes:
+        return acertos, 0
+    return acertos, (ANSWER_WINDOW * total_questoes - tempo_poupado) / total_questoes
+
+
+def ranking_page_range(offset, limit):
+    """Faixa (início, fim) do ZREVRANGE de uma página do ranking, ou None se a página é vazia."""
+    if limit == 0:
+        return None
+    return offset, -1 if limit is None else offset + limit - 1
+
+
+class UnrankedStudents:
+    """Completa uma página do ranking com os alunos cadastrados que ainda não responderam.
+
+    Eles vêm depois de todo o leaderboard, na ordem do registro de usuários: take recebe um
+    bloco do registro com os ZSCORE no leaderboard e devolve as entradas (aluno, 0) da página.
+    """
+
+    def __init__(self, offset, limit, total_no_leaderboard, na_pagina):
+        self.pular = max(offset - total_no_leaderboard, 0)
+        self.faltam = None if limit is None else limit - na_pagina
+
+    @property
+    def done(self):
+        return self.faltam is not None and self.faltam <= 0
+
+    def take(self, alunos, scores):
+        ausentes = [aluno for aluno, score in zip(alunos, scores) if score is None]
+        if self.pular:
+            descartados = min(self.pular, len(ausentes))
+            ausentes = ausentes[descartados:]
+            self.pular -= descartados
+        if self.faltam is not None:
+            ausentes = ausentes[:self.faltam]
+            self.faltam -= len(ausentes)
+        return [(aluno, 0) for aluno in ausentes]
+
+
+def student_rank(student_id, posicao, score, total_no_leaderboard, cadastrado):
+    """(posição, (aluno, pontuação)) de um aluno a partir do ZREVRANK/ZSCORE, ou None se não existe.
+
+    Alunos sem respostas empatam logo depois do último aluno do leaderboard.
+    """
+    if posicao is not None:
+        return posicao, (student_id, score)
+    if cadastrado is not None:
+        return total_no_leaderboard, (student_id, 0)
+    return None
+
+
+def format_ranking_entries(ranking, offset, total_questoes, nomes):
+    """Monta as entradas do ranking a partir das pontuações e dos nomes já carregados."""
+    ranking_formatado = []
+    for i, (aluno_id, score) in enumerate(ranking, start=offset + 1):
+        acertos, tempo_medio = split_ranking_score(score, total_questoes)
+        ranking_formatado.append({
+            "posicao": i,
+            "student_id": aluno_id,
+            "nome": nomes[aluno_id],
+            "acertos": acertos,
+            "tempo_medio_resposta": round(tempo_medio, 2)
+        })
+    return ranking_formatado
+
+
+def ranking_payload(quiz_id, ranking, offset, total_questoes, nomes):
+    return {
+        "quiz_id": quiz_id,
+        "ranking": format_ranking_entries(ranking, offset, total_questoes, nomes)
+    }
+
+
+def format_leaderboard_entries(ranking, offset, nomes):
+    """Monta as entradas de um leaderboard agregado: acertos e tempo poupado somados nos quizzes."""
+    entradas = []
+    for i, (aluno_id, score) in enumerate(ranking, start=offset + 1):
+        acertos, _ = split_ranking_score(score, 0)
+        entradas.append({
+            "posicao": i,
+            "student_id": aluno_id,
+            "nome": nomes[aluno_id],
+            "acertos": acertos,
+            "tempo_poupado": round(max(score - acertos * RANKING_SCORE_SCALE, 0), 2)
+        })
+    return entradas
+
+
+def leaderboard_payload(window, period, course, total, ranking, offset, nomes):
+    return {
+        "window": window,
+        "period": period,
+        "course": course,
+        "total": total,
+        "ranking": format_leaderboard_entries(ranking, offset, nomes)
+    }
+
+
+# Relatório psicométrico
+def report_payload(quiz_id, versao, total_ids, items):
+    """Relatório do quiz calculado a partir das colunas (psychometrics.Item) das questões."""
+    return {"quiz_id": quiz_id, "version": int(versao), **psychometrics.build_report(total_ids, items)}
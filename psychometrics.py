@@ -0,0 +1,129 @@
+"""Estatísticas psicométricas de um quiz: dificuldade, discriminação, tempos e distratores.
+
+Os cálculos usam NumPy sobre as colunas da matriz aluno × questão: cada questão traz os
+ids numéricos dos alunos que a responderam, o índice da alternativa escolhida e o tempo
+de resposta. Alunos sem nenhuma resposta no quiz ficam fora do relatório; questões não
+respondidas contam como erro na nota total do aluno.
+
+O NumPy é opcional: sem ele, `np` fica None e a aplicação desliga apenas o relatório.
+"""
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Percentis dos tempos de resposta incluídos no relatório
+PERCENTILES = (10, 25, 50, 75, 90)
+# Fração de alunos nos grupos superior e inferior da análise de distratores (Kelley)
+GROUP_FRACTION = 0.27
+
+# Uma coluna da matriz: options são os rótulos das alternativas; choices usa len(options)
+# para respostas fora das alternativas; correct é o índice da correta (-1 se não houver)
+Item = namedtuple("Item", "question_id options correct rows choices times")
+
+
+def number(valor, casas=4):
+    """Converte um escalar NumPy em float arredondado, ou None se não for finito."""
+    valor = float(valor)
+    return round(valor, casas) if np.isfinite(valor) else None
+
+
+def time_percentiles(tempos):
+    if not len(tempos):
+        return None
+    return {f"p{p}": number(valor, 3) for p, valor in zip(PERCENTILES, np.percentile(tempos, PERCENTILES))}
+
+
+def build_report(total_ids, items):
+    """Calcula o relatório do quiz a partir das colunas (Item) de cada questão."""
+    notas = np.zeros(total_ids, dtype=np.int64)
+    respondeu = np.zeros(total_ids, dtype=bool)
+    acertaram = []
+    for item in items:
+        alunos_que_acertaram = item.rows[item.choices == item.correct]
+        notas[alunos_que_acertaram] += 1  # cada aluno aparece no máximo uma vez por questão
+        respondeu[item.rows] = True
+        acertaram.append(alunos_que_acertaram)
+
+    total_alunos = int(respondeu.sum())
+    notas_alunos = notas[respondeu].astype(np.float64)
+    media = notas_alunos.mean() if total_alunos else 0.0
+    variancia = notas_alunos.var() if total_alunos else 0.0
+
+    # Ponto-bisserial pela covariância entre o acerto no item (0/1) e a nota total, sem
+    # montar a matriz densa: a soma das notas de quem acertou basta para a covariância.
+    # A discriminação usa a nota sem o próprio item (correlação item-resto).
+    total_corretas = np.array([len(alunos) for alunos in acertaram], dtype=np.float64)
+    soma_notas_corretas = np.array([notas[alunos].sum() for alunos in acertaram], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dificuldade = total_corretas / total_alunos if total_alunos else np.full(len(items), np.nan)
+        variancia_item = dificuldade * (1 - dificuldade)
+        covariancia = soma_notas_corretas / total_alunos - dificuldade * media
+        ponto_bisserial = covariancia / np.sqrt(variancia_item * variancia)
+        variancia_resto = variancia + variancia_item - 2 * covariancia
+        discriminacao = (covariancia - variancia_item) / np.sqrt(variancia_item * variancia_resto)
+
+    k = len(items)
+    confiabilidade = None
+    if k > 1 and variancia > 0:
+        confiabilidade = number(k / (k - 1) * (1 - np.nansum(variancia_item) / variancia))
+
+    # Grupos superior e inferior pela nota total, para a análise de distratores
+    if total_alunos:
+        limite_inferior, limite_superior = np.quantile(notas_alunos, [GROUP_FRACTION, 1 - GROUP_FRACTION])
+    else:
+        limite_inferior = limite_superior = 0
+    grupo_superior = respondeu & (notas >= limite_superior)
+    grupo_inferior = respondeu & (notas <= limite_inferior)
+    tamanho_grupos = (int(grupo_superior.sum()), int(grupo_inferior.sum()))
+
+    itens = []
+    for indice, item in enumerate(items):
+        itens.append({
+            "question_id": item.question_id,
+            "respostas": int(len(item.rows)),
+            "dificuldade": number(dificuldade[indice]),
+            "discriminacao": number(discriminacao[indice]),
+            "ponto_bisserial": number(ponto_bisserial[indice]),
+            "tempo_medio_resposta": number(item.times.mean(), 3) if len(item.times) else None,
+            "percentis_tempo_resposta": time_percentiles(item.times),
+            "distratores": distractors(item, notas, grupo_superior, grupo_inferior, tamanho_grupos),
+        })
+
+    todos_os_tempos = np.concatenate([item.times for item in items]) if items else np.array([])
+    return {
+        "alunos": total_alunos,
+        "questoes": k,
+        "nota_media": number(media),
+        "desvio_padrao_nota": number(np.sqrt(variancia)),
+        "confiabilidade_kr20": confiabilidade,
+        "percentis_tempo_resposta": time_percentiles(todos_os_tempos),
+        "itens": itens,
+    }
+
+
+def distractors(item, notas, grupo_superior, grupo_inferior, tamanho_grupos):
+    """Para cada alternativa: escolhas, nota média de quem a escolheu e proporção nos grupos extremos."""
+    total_opcoes = len(item.options) + 1
+    escolhas = np.bincount(item.choices, minlength=total_opcoes)
+    soma_notas = np.bincount(item.choices, weights=notas[item.rows], minlength=total_opcoes)
+    superior = np.bincount(item.choices[grupo_superior[item.rows]], minlength=total_opcoes)
+    inferior = np.bincount(item.choices[grupo_inferior[item.rows]], minlength=total_opcoes)
+    total_respostas = len(item.rows)
+
+    resultado = []
+    for indice, opcao in enumerate([*item.options, None]):
+        if opcao is None and not escolhas[indice]:
+            continue
+        resultado.append({
+            "opcao": opcao,  # None agrupa as respostas fora das alternativas
+            "correta": indice == item.correct,
+            "respostas": int(escolhas[indice]),
+            "proporcao": number(escolhas[indice] / total_respostas) if total_respostas else None,
+            "nota_media": number(soma_notas[indice] / escolhas[indice]) if escolhas[indice] else None,
+            "grupo_superior": number(superior[indice] / tamanho_grupos[0]) if tamanho_grupos[0] else None,
+            "grupo_inferior": number(inferior[indice] / tamanho_grupos[1]) if tamanho_grupos[1] else None,
+        })
+    return resultado
@@ -0,0 +1,461 @@
+"""Clientes Redis para um nó só, um Redis Cluster ou um anel de hash consistente de nós independentes.
+
+O modo (REDIS_MODE) escolhe o cliente:
+
+- standalone: um único redis-server (REDIS_HOST/REDIS_PORT), como sempre foi;
+- cluster: Redis Cluster, descoberto a partir dos nós iniciais de REDIS_NODES;
+- ring: redis-servers independentes em REDIS_NODES, cada chave no nó escolhido por hash consistente.
+
+REDIS_NODES é uma lista "host:porta,host:porta". Nos modos distribuídos a chave é roteada
+pela hash tag (o trecho entre a primeira "{" e a "}" seguinte, a mesma regra do Redis
+Cluster), então as chaves de um quiz (quiz:{id}:...) ficam no mesmo nó e os scripts Lua e
+transações do quiz continuam atômicos. O anel não move dados: acrescentar ou remover um nó
+muda o dono de ~1/N das tags, e essas chaves precisam ser copiadas para o novo dono.
+
+Para testar localmente com vários redis-server, veja benchmarks/redis_nodes.sh.
+"""
+import asyncio
+import bisect
+import hashlib
+import threading
+
+import redis
+import redis.asyncio as aioredis
+import redis.asyncio.cluster as aiocluster
+import redis.cluster
+
+REDIS_MODES = ("standalone", "cluster", "ring")
+# Pontos de cada nó no anel: mais pontos distribuem as tags de forma mais uniforme
+RING_REPLICAS = 160
+# Espera máxima em cada nó enquanto ShardedPubSub.listen() aguarda mensagens
+PUBSUB_POLL_SECONDS = 0.05
+
+# Comandos com várias chaves que o anel divide por nó, somando os resultados
+MULTI_KEY_COMMANDS = ("delete", "unlink", "exists", "touch")
+# Comandos sem chave que o anel executa em todos os nós
+BROADCAST_COMMANDS = ("ping", "flushdb", "flushall", "script_flush")
+
+
+def parse_nodes(valor):
+    """Converte "host:porta,host:porta" em [(host, porta), ...]."""
+    nodes = []
+    for item in valor.split(","):
+        item = item.strip()
+        if item:
+            host, _, port = item.rpartition(":")
+            nodes.append((host or "localhost", int(port)))
+    return nodes
+
+
+def hash_tag(key):
+    """Trecho da chave usado no roteamento: a hash tag, se houver, ou a chave inteira."""
+    if isinstance(key, bytes):
+        key = key.decode()
+    inicio = key.find("{")
+    if inicio != -1:
+        fim = key.find("}", inicio + 1)
+        if fim > inicio + 1:
+            return key[inicio + 1:fim]
+    return key
+
+
+def ring_hash(valor):
+    return int.from_bytes(hashlib.md5(valor.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Anel de hash consistente: cada nó ocupa RING_REPLICAS pontos do anel."""
+
+    def __init__(self, names, replicas=RING_REPLICAS):
+        pontos = sorted((ring_hash(f"{name}#{replica}"), indice)
+                        for indice, name in enumerate(names) for replica in range(replicas))
+        self._hashes = [ponto for ponto, _ in pontos]
+        self._nodes = [indice for _, indice in pontos]
+
+    def node_for(self, key):
+        """Índice do nó dono da chave (pela hash tag)."""
+        posicao = bisect.bisect(self._hashes, ring_hash(hash_tag(key))) % len(self._hashes)
+        return self._nodes[posicao]
+
+
+def routing_keys(name, args, kwargs):
+    """Chaves que decidem o nó de um comando: em geral o primeiro argumento."""
+    if name in ("xread", "xreadgroup"):
+        streams = kwargs.get("streams") or args[0 if name == "xread" else 2]
+        return list(streams)
+    if name == "execute_command":
+        return list(args[1:2])
+    if name == "evalsha":
+        return list(args[2:2 + int(args[1])])
+    return list(args[:1])
+
+
+class ShardedBase:
+    """Roteamento comum às versões síncrona e assíncrona do cliente em anel."""
+
+    def __init__(self, clients, names):
+        self.nodes = list(clients)
+        self.ring = HashRing(names)
+
+    def node_index(self, keys):
+        """Nó de um conjunto de chaves, que precisam estar todas no mesmo nó (como no Cluster)."""
+        indices = {self.ring.node_for(key) for key in keys}
+        if len(indices) != 1:
+            raise redis.exceptions.ResponseError("CROSSSLOT Keys in request don't hash to the same node")
+        return indices.pop()
+
+    def group_by_node(self, keys):
+        grupos = {}
+        for key in keys:
+            grupos.setdefault(self.ring.node_for(key), []).append(key)
+        return grupos
+
+    def register_script(self, script):
+        return ShardedScript(self, script)
+
+    def __getattr__(self, name):
+        if name in MULTI_KEY_COMMANDS:
+            return lambda *keys: self._multi_key(name, keys)
+        if name in BROADCAST_COMMANDS:
+            return lambda *args, **kwargs: self._broadcast(name, args, kwargs)
+
+        def comando(*args, **kwargs):
+            return getattr(self.nodes[self.node_index(routing_keys(name, args, kwargs))], name)(*args, **kwargs)
+        return comando
+
+    def execute_command(self, *args, **kwargs):
+        return self.__getattr__("execute_command")(*args, **kwargs)
+
+
+class ShardedRedis(ShardedBase):
+    """Cliente síncrono que distribui as chaves por um anel de redis-servers independentes.
+
+    Comandos de uma chave, scripts e pipelines são roteados pela hash tag; DELETE/EXISTS com
+    chaves de vários nós são divididos, SCAN percorre todos os nós e o pub/sub escuta
+    os padrões (PSUBSCRIBE) em todos eles.
+    """
+
+    def _multi_key(self, name, keys):
+        return sum(getattr(self.nodes[indice], name)(*grupo) for indice, grupo in self.group_by_node(keys).items())
+
+    def _broadcast(self, name, args, kwargs):
+        return all([getattr(node, name)(*args, **kwargs) for node in self.nodes])
+
+    def scan_iter(self, *args, **kwargs):
+        for node in self.nodes:
+            yield from node.scan_iter(*args, **kwargs)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return ShardedPipeline(self, transaction)
+
+    def pubsub(self, **kwargs):
+        return ShardedPubSub(self, **kwargs)
+
+
+class AsyncShardedRedis(ShardedBase):
+    """Versão assíncrona de ShardedRedis (nós redis.asyncio), sem pub/sub."""
+
+    async def _multi_key(self, name, keys):
+        grupos = self.group_by_node(keys).items()
+        return sum(await asyncio.gather(*(getattr(self.nodes[indice], name)(*grupo) for indice, grupo in grupos)))
+
+    async def _broadcast(self, name, args, kwargs):
+        return all(await asyncio.gather(*(getattr(node, name)(*args, **kwargs) for node in self.nodes)))
+
+    async def scan_iter(self, *args, **kwargs):
+        for node in self.nodes:
+            async for key in node.scan_iter(*args, **kwargs):
+                yield key
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncShardedPipeline(self, transaction)
+
+    async def aclose(self):
+        await asyncio.gather(*(node.aclose() for node in self.nodes))
+
+
+class ShardedPipeline:
+    """Pipeline que enfileira cada comando no pipeline do nó dono da chave.
+
+    No execute, os pipelines dos nós são executados e os resultados voltam na ordem em que
+    os comandos foram enfileirados. Com transaction=True cada nó roda o seu trecho num
+    MULTI/EXEC: a atomicidade vale por nó, o que basta para as chaves de um mesmo quiz.
+    """
+
+    def __init__(self, client, transaction):
+        self.client = client
+        self.transaction = transaction
+        self._pipes = {}
+        self.command_stack = []  # nó de cada comando enfileirado, na ordem
+
+    def pipe_for(self, indice):
+        pipe = self._pipes.get(indice)
+        if pipe is None:
+            pipe = self._pipes[indice] = self.client.nodes[indice].pipeline(transaction=self.transaction)
+        return pipe
+
+    def queue(self, indice):
+        """Reserva a próxima posição do resultado para um comando enfileirado no nó."""
+        self.command_stack.append(indice)
+        return self.pipe_for(indice)
+
+    def __getattr__(self, name):
+        def comando(*args, **kwargs):
+            indice = self.client.node_index(routing_keys(name, args, kwargs))
+            getattr(self.queue(indice), name)(*args, **kwargs)
+            return self
+        return comando
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.reset()
+
+    def merge(self, resultados):
+        por_no = {indice: iter(valores) for indice, valores in zip(self._pipes, resultados)}
+        return [next(por_no[indice]) for indice in self.command_stack]
+
+    def execute(self, raise_on_error=True):
+        try:
+            return self.merge([pipe.execute(raise_on_error=raise_on_error) for pipe in self._pipes.values()])
+        finally:
+            self.reset()
+
+    def reset(self):
+        for pipe in self._pipes.values():
+            pipe.reset()
+        self._pipes = {}
+        self.command_stack = []
+
+
+class AsyncShardedPipeline(ShardedPipeline):
+    """Versão assíncrona de ShardedPipeline: os nós são executados em paralelo."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.reset()
+
+    async def execute(self, raise_on_error=True):
+        try:
+            return self.merge(await asyncio.gather(
+                *(pipe.execute(raise_on_error=raise_on_error) for pipe in self._pipes.values())))
+        finally:
+            await self.reset()
+
+    async def reset(self):
+        await asyncio.gather(*(pipe.reset() for pipe in self._pipes.values()))
+        self._pipes = {}
+        self.command_stack = []
+
+
+class ShardedScript:
+    """Script Lua registrado em todos os nós do anel, executado no nó dono das suas chaves.
+
+    Serve às duas versões: no cliente assíncrono a chamada devolve a corrotina do nó.
+    """
+
+    def __init__(self, client, script):
+        self.client = client
+        self.script = script
+        self._scripts = [node.register_script(script) for node in client.nodes]
+
+    def __call__(self, keys=None, args=None, client=None):
+        keys = keys or []
+        indice = self.client.node_index(keys)
+        if isinstance(client, ShardedPipeline):
+            return self._scripts[indice](keys=keys, args=args, client=client.queue(indice))
+        return self._scripts[indice](keys=keys, args=args)
+
+
+class ShardedPubSub:
+    """Pub/sub sobre todos os nós: SUBSCRIBE vai ao nó do canal e PSUBSCRIBE a todos.
+
+    PUBLISH no anel também é roteado pelo canal, então quem publica e quem assina um
+    canal sempre se encontram no mesmo nó (inclusive os canais publicados pelos scripts).
+    """
+
+    def __init__(self, client, **kwargs):
+        self.client = client
+        self._pubsubs = [node.pubsub(**kwargs) for node in client.nodes]
+
+    def subscribe(self, *channels):
+        for indice, grupo in self.client.group_by_node(channels).items():
+            self._pubsubs[indice].subscribe(*grupo)
+
+    def psubscribe(self, *patterns):
+        for pubsub in self._pubsubs:
+            pubsub.psubscribe(*patterns)
+
+    def get_message(self, timeout=0.0):
+        for pubsub in self._pubsubs:
+            if pubsub.subscribed:
+                message = pubsub.get_message(timeout=timeout / len(self._pubsubs))
+                if message is not None:
+                    return message
+        return None
+
+    def listen(self):
+        while True:
+            message = self.get_message(timeout=PUBSUB_POLL_SECONDS * len(self._pubsubs))
+            if message is not None:
+                yield message
+
+    def close(self):
+        for pubsub in self._pubsubs:
+            pubsub.close()
+
+
+class ClusterClient(redis.cluster.RedisCluster):
+    """RedisCluster que carrega cada script registrado em todos os primários.
+
+    Os pipelines do Cluster não tratam NOSCRIPT: sem a carga prévia, o primeiro script
+    enfileirado num pipeline falharia num nó que ainda não o conhece.
+    """
+
+    def register_script(self, script):
+        registrado = super().register_script(script)
+        self.script_load(script)
+        return registrado
+
+
+class AsyncClusterClient(aiocluster.RedisCluster):
+    """Versão assíncrona de ClusterClient: a carga acontece em load_scripts(), na inicialização."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._scripts = []
+
+    def register_script(self, script):
+        self._scripts.append(script)
+        return super().register_script(script)
+
+    async def load_scripts(self):
+        for script in self._scripts:
+            await self.script_load(script)
+
+
+def cluster_options(options):
+    """Opções do pool aceitas pelo RedisCluster (sem host/porta, db e espera por conexão)."""
+    return {chave: valor for chave, valor in options.items() if chave not in ("host", "port", "db", "timeout")}
+
+
+def create_client(mode, nodes, options):
+    """Cria o cliente síncrono do modo escolhido; options são as de redis_pool_options()."""
+    if mode == "standalone":
+        return redis.StrictRedis(connection_pool=redis.BlockingConnectionPool(**options))
+    if mode == "cluster":
+        return ClusterClient(startup_nodes=[redis.cluster.ClusterNode(host, port) for host, port in nodes],
+                             **cluster_options(options))
+    if mode == "ring":
+        clients = [redis.StrictRedis(connection_pool=redis.BlockingConnectionPool(**{**options, "host": host, "port": port}))
+                   for host, port in nodes]
+        return ShardedRedis(clients, [f"{host}:{port}" for host, port in nodes])
+    raise ValueError(f"REDIS_MODE inválido: {mode} (use um de {', '.join(REDIS_MODES)})")
+
+
+def create_async_client(mode, nodes, options):
+    """Versão assíncrona de create_client (redis.asyncio)."""
+    if mode == "standalone":
+        return aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool(**options))
+    if mode == "cluster":
+        return AsyncClusterClient(startup_nodes=[aiocluster.ClusterNode(host, port) for host, port in nodes],
+                                  **cluster_options(options))
+    if mode == "ring":
+        clients = [aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool(**{**options, "host": host, "port": port}))
+                   for host, port in nodes]
+        return AsyncShardedRedis(clients, [f"{host}:{port}" for host, port in nodes])
+    raise ValueError(f"REDIS_MODE inválido: {mode} (use um de {', '.join(REDIS_MODES)})")
+
+
+class LazyClient:
+    """Proxy para um cliente Redis criado só no primeiro uso (importar o módulo não conecta).
+
+    A factory é trocada por configure(), por exemplo em create_app; os scripts registrados
+    pelo proxy (LazyScript) acompanham a troca e se registram de novo no cliente atual.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+        self.scripts = []
+
+    def configure(self, factory=None, client=None):
+        """Troca o cliente: um já pronto (client) ou uma factory chamada no próximo uso."""
+        with self._lock:
+            if factory is not None:
+                self._factory = factory
+            self._client = client
+
+    @property
+    def client(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def register_script(self, script):
+        lazy_script = LazyScript(self, script)
+        self.scripts.append(lazy_script)
+        return lazy_script
+
+    def register_scripts(self):
+        """Registra já no cliente atual todos os scripts (o AsyncClusterClient os carrega depois)."""
+        for script in self.scripts:
+            script.registered()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class LazyScript:
+    """Script Lua registrado no cliente do LazyClient só na primeira chamada."""
+
+    def __init__(self, lazy, script):
+        self.lazy = lazy
+        self.script = script
+        self._registrado = (None, None)
+
+    def registered(self):
+        atual = self.lazy.client
+        cliente, script = self._registrado
+        if cliente is not atual:
+            script = atual.register_script(self.script)
+            self._registrado = (atual, script)
+        return script
+
+    def __call__(self, keys=None, args=None, client=None):
+        return self.registered()(keys=keys, args=args, client=client)
+
+
+def node_clients(client):
+    """Clientes dos nós de um anel (para instrumentação), ou o próprio cliente."""
+    if isinstance(client, LazyClient):
+        client = client.client
+    return client.nodes if isinstance(client, ShardedBase) else [client]
+
+
+def group_keys(client, keys):
+    """Agrupa as chaves que podem ir juntas num comando multi-chave, como XREADGROUP.
+
+    Mesmo slot no Cluster, mesmo nó no anel; num Redis só, tudo num grupo.
+    """
+    if isinstance(client, LazyClient):
+        client = client.client
+    if isinstance(client, ShardedBase):
+        return list(client.group_by_node(keys).values())
+    if isinstance(client, (redis.cluster.RedisCluster, aiocluster.RedisCluster)):
+        grupos = {}
+        for key in keys:
+            grupos.setdefault(client.keyslot(key), []).append(key)
+        return list(grupos.values())
+    return [list(keys)] if keys else []